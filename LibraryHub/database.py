@@ -0,0 +1,67 @@
+"""
+SQLite connection profiles for the LibraryHub settings.
+
+``sqlite_database()`` builds a ``DATABASES`` entry for one of the profiles
+below. ``default`` keeps Django's stock SQLite behaviour. ``tuned`` enables WAL
+so readers never block behind a writer, relaxes fsync to ``synchronous=NORMAL``
+(safe under WAL), memory-maps the file, enlarges the page cache, waits on locks
+instead of failing immediately and keeps connections open between requests.
+"""
+from pathlib import Path
+
+SQLITE_PROFILES = {
+    'default': {
+        'pragmas': {},
+        'timeout': 5,
+        'transaction_mode': None,
+        'conn_max_age': 0,
+    },
+    'tuned': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+            'busy_timeout': 5000,
+            'temp_store': 'MEMORY',
+        },
+        'timeout': 5,
+        # Writers take the lock when the transaction starts instead of failing on upgrade mid-way.
+        'transaction_mode': 'IMMEDIATE',
+        'conn_max_age': 600,
+    },
+}
+
+# Pragmas that change the database file and therefore cannot run on a read-only connection.
+WRITE_PRAGMAS = {'journal_mode'}
+
+
+def sqlite_pragmas(profile, read_only=False):
+    pragmas = dict(SQLITE_PROFILES[profile]['pragmas'])
+    if read_only:
+        for name in WRITE_PRAGMAS:
+            pragmas.pop(name, None)
+        pragmas['query_only'] = 1
+    return pragmas
+
+
+def sqlite_database(path, profile='default', read_only=False):
+    """DATABASES entry for an SQLite file using one of SQLITE_PROFILES."""
+    config = SQLITE_PROFILES[profile]
+    options = {
+        'timeout': config['timeout'],
+        'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in
+                                 sqlite_pragmas(profile, read_only).items()),
+    }
+    if config['transaction_mode'] and not read_only:
+        options['transaction_mode'] = config['transaction_mode']
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{path}?mode=ro' if read_only else path,
+        'OPTIONS': options,
+        'CONN_MAX_AGE': config['conn_max_age'],
+        'CONN_HEALTH_CHECKS': True,
+        # A file rather than Django's shared-cache in-memory database, so tests that run several threads
+        # see the same locking behaviour as production instead of failing on shared-cache table locks.
+        'TEST': {'NAME': str(Path(path).with_name(f'test_{Path(path).name}'))},
+    }
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import sqlite_database
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -48,6 +51,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'library.profiling.QueryProfilingMiddleware',
+    'library.audit.AuditMiddleware',
 ]
 
 ROOT_URLCONF = 'LibraryHub.urls'
@@ -74,13 +79,23 @@ WSGI_APPLICATION = 'LibraryHub.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# LIBRARYHUB_DB_PROFILE picks a profile from LibraryHub/database.py: 'default' (Django's stock SQLite
+# settings) unless set to 'tuned' (WAL, relaxed fsync, IMMEDIATE writes, persistent connections).
+# LIBRARYHUB_DB_REPLICA, when set, is the path of a read-only replica that serves ORM reads.
+
+DATABASE_PROFILE = os.environ.get('LIBRARYHUB_DB_PROFILE', 'default')
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': sqlite_database(BASE_DIR / 'db.sqlite3', DATABASE_PROFILE),
 }
 
+DATABASE_REPLICA = os.environ.get('LIBRARYHUB_DB_REPLICA')
+
+if DATABASE_REPLICA:
+    DATABASES['replica'] = sqlite_database(DATABASE_REPLICA, DATABASE_PROFILE, read_only=True)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['library.routers.ReadReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -122,3 +137,81 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Per-request SQL profiling (query count, DB time, repeated queries, wall time)
+# Reported as X-Query-* response headers and optionally appended to a rotating JSON-lines log.
+
+LIBRARY_PROFILING = {
+    'ENABLED': False,
+    'LOG_FILE': BASE_DIR / 'profiling.log',
+    'DUPLICATE_THRESHOLD': 3,
+}
+
+
+# Read-through cache for catalogue reads (library.caching)
+# Use 'library.caching.DjangoCacheBackend' with OPTIONS {'ALIAS': ...} to share entries through settings.CACHES.
+
+LIBRARY_CACHE = {
+    'BACKEND': 'library.caching.LocalMemoryBackend',
+    'TIMEOUT': 300,
+    'OPTIONS': {
+        'MAX_ENTRIES': 10000,
+    },
+}
+
+
+# Admin bulk actions (library.bulk): rows are changed in primary-key chunks, one transaction each.
+# Selections larger than BACKGROUND_THRESHOLD run on an in-process worker pool (None keeps them inline).
+
+LIBRARY_BULK_ACTIONS = {
+    'CHUNK_SIZE': 1000,
+    'BACKGROUND_THRESHOLD': 5000,
+    'WORKERS': 1,
+}
+
+
+# History partitioning (library.partitions): closed Borrow, Post and EventParticipant rows older than
+# HORIZON_DAYS move into per-year archive tables, kept in ARCHIVE_DATABASE (an SQLite file attached on
+# demand) when set and in the main database otherwise.
+
+LIBRARY_PARTITIONS = {
+    'HORIZON_DAYS': 730,
+    'ARCHIVE_DATABASE': os.environ.get('LIBRARYHUB_DB_ARCHIVE'),
+    'CHUNK_SIZE': 5000,
+}
+
+
+# Circulation analytics (library.analytics): Borrow columns are cached as memory-mapped arrays in a
+# subdirectory of CACHE_DIR per database alias, extended with new borrows and updated from the BorrowChange
+# log on each run; None reads every borrow each time.
+
+LIBRARY_ANALYTICS = {
+    'CACHE_DIR': BASE_DIR / 'analytics_cache',
+}
+
+
+# Audit log (library.audit): field-level changes to authors, books, borrows and members are queued in
+# memory and written in batches of BATCH_SIZE, or FLUSH_INTERVAL seconds after the first entry, by a
+# background thread. A producer that finds the queue full for PUT_TIMEOUT seconds writes its entry itself.
+
+LIBRARY_AUDIT = {
+    'ENABLED': True,
+    'BACKGROUND': True,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'QUEUE_SIZE': 10000,
+    'PUT_TIMEOUT': 1.0,
+}
+
+
+# Snapshots (library.snapshots): the snapshot command copies the database into DIRECTORY with the online
+# backup API, PAGES_PER_STEP pages at a time with STEP_PAUSE seconds between steps, gzip-compressed at
+# COMPRESS_LEVEL (0 stores plain copies). snapshot --incremental exports rows above each table's last mark.
+
+LIBRARY_SNAPSHOTS = {
+    'DIRECTORY': BASE_DIR / 'snapshots',
+    'PAGES_PER_STEP': 1024,
+    'STEP_PAUSE': 0.005,
+    'COMPRESS_LEVEL': 1,
+}
@@ -1,5 +1,14 @@
+from functools import partial
+
 from django.contrib import admin
+from .bulk import return_borrows, run_bulk_action, set_authors_deleted, set_members_active, set_members_role
+from .dashboard import annotate_overdue
+from .dedup import merge_candidates, set_candidates_status
+from .feeds import approve_posts
 from .models import *
+from .paginators import CachedCountPaginator, KeysetPaginationAdminMixin
+from .registrations import reconcile_events
+from .search import FullTextSearchAdminMixin
 
 
 class BookInline(admin.TabularInline):
@@ -13,20 +22,20 @@ class AuthorDetailInline(admin.StackedInline):
 
 
 def mark_authors_deleted(modeladmin, request, queryset):
-    queryset.update(deleted=True)
+    run_bulk_action(modeladmin, request, queryset, partial(set_authors_deleted, deleted=True), "Mark as deleted")
 
 
 mark_authors_deleted.short_description = "Mark selected authors as deleted"
 
 
 def unmark_authors_deleted(modeladmin, request, queryset):
-    queryset.update(deleted=False)
+    run_bulk_action(modeladmin, request, queryset, partial(set_authors_deleted, deleted=False), "Unmark as deleted")
 
 
 unmark_authors_deleted.short_description = "Unmark selected authors as deleted"
 
 
-class AuthorAdmin(admin.ModelAdmin):
+class AuthorAdmin(FullTextSearchAdminMixin, KeysetPaginationAdminMixin, admin.ModelAdmin):
     list_display = ('first_name', 'last_name', 'birth_date', 'rating', 'deleted')
     search_fields = ('first_name', 'last_name')
     ordering = ('last_name', 'first_name')
@@ -34,15 +43,24 @@ class AuthorAdmin(admin.ModelAdmin):
     actions = [mark_authors_deleted, unmark_authors_deleted]
 
 
-class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'publishing_date', 'genre')
+class HoldingInline(admin.TabularInline):
+    model = Holding
+    fields = ('library', 'copies', 'available')
+    readonly_fields = ('available',)
+    extra = 1
+
+
+class BookAdmin(FullTextSearchAdminMixin, KeysetPaginationAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'author', 'publishing_date', 'genre', 'average_rating', 'review_count')
     search_fields = ('title', 'author__first_name', 'author__last_name', 'genre')
     list_filter = ('genre', 'publishing_date')
     ordering = ('-publishing_date',)
+    list_select_related = ('author',)
     list_per_page = 10
+    inlines = [HoldingInline]
 
 
-class CategoryAdmin(admin.ModelAdmin):
+class CategoryAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
     list_display = ('name',)
     search_fields = ('name',)
     ordering = ('name',)
@@ -53,7 +71,7 @@ class EventInline(admin.TabularInline):
     extra = 1
 
 
-class LibraryAdmin(admin.ModelAdmin):
+class LibraryAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'location', 'site')
     search_fields = ('name', 'location')
     list_filter = ('location',)
@@ -77,25 +95,25 @@ class ReviewInline(admin.TabularInline):
 
 
 def activate_members(modeladmin, request, queryset):
-    queryset.update(active=True)
+    run_bulk_action(modeladmin, request, queryset, partial(set_members_active, active=True), "Activate")
 activate_members.short_description = "Activate selected members"
 
 
 def deactivate_members(modeladmin, request, queryset):
-    queryset.update(active=False)
+    run_bulk_action(modeladmin, request, queryset, partial(set_members_active, active=False), "Deactivate")
 deactivate_members.short_description = "Deactivate selected members"
 
 def assign_role_to_reader(modeladmin, request, queryset):
-    queryset.update(role='Reader')
+    run_bulk_action(modeladmin, request, queryset, partial(set_members_role, role='Reader'), "Assign role Reader")
 assign_role_to_reader.short_description = "Assign role Reader to selected members"
 
 def assign_role_to_staff(modeladmin, request, queryset):
-    queryset.update(role='Staff')
+    run_bulk_action(modeladmin, request, queryset, partial(set_members_role, role='Staff'), "Assign role Staff")
 assign_role_to_staff.short_description = "Assign role Staff to selected members"
 
 
-class MemberAdmin(admin.ModelAdmin):
-    list_display = ('first_name', 'last_name', 'email', 'role', 'active')
+class MemberAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
+    list_display = ('first_name', 'last_name', 'email', 'role', 'active', 'overdue_count')
     search_fields = ('first_name', 'last_name', 'email')
     list_filter = ('role', 'active')
     ordering = ('last_name', 'first_name')
@@ -103,37 +121,53 @@ class MemberAdmin(admin.ModelAdmin):
     actions = [activate_members, deactivate_members, assign_role_to_reader, assign_role_to_staff]
 
 
-class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'created_at', 'updated_at', 'library')
+def approve_selected_posts(modeladmin, request, queryset):
+    run_bulk_action(modeladmin, request, queryset, approve_posts, "Approve")
+approve_selected_posts.short_description = "Approve selected posts"
+
+
+class PostAdmin(FullTextSearchAdminMixin, KeysetPaginationAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'author', 'created_at', 'updated_at', 'library', 'moderated')
     search_fields = ('title', 'author__first_name', 'author__last_name')
-    list_filter = ('library', 'created_at')
+    list_filter = ('moderated', 'library', 'created_at')
     ordering = ('-created_at',)
+    list_select_related = ('author', 'library')
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    actions = [approve_selected_posts]
 
 
 def mark_borrows_returned(modeladmin, request, queryset):
-    queryset.update(returned=True)
+    run_bulk_action(modeladmin, request, queryset, return_borrows, "Mark as returned")
 mark_borrows_returned.short_description = "Mark selected borrows as returned"
 
 
-class BorrowAdmin(admin.ModelAdmin):
+class BorrowAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
     list_display = ('member', 'book', 'library', 'borrow_date', 'return_date', 'returned')
     search_fields = ('member__first_name', 'member__last_name', 'book__title', 'library__name')
     list_filter = ('returned', 'borrow_date', 'return_date')
     ordering = ('-borrow_date',)
+    list_select_related = ('member', 'book', 'library')
+    paginator = CachedCountPaginator
+    show_full_result_count = False
     actions = [mark_borrows_returned]
 
 
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
     list_display = ('book', 'reviewer', 'rating')
     search_fields = ('book__title', 'reviewer__first_name', 'reviewer__last_name')
     list_filter = ('rating',)
     ordering = ('-rating',)
+    list_select_related = ('book', 'reviewer')
+    paginator = CachedCountPaginator
+    show_full_result_count = False
 
 
-class AuthorDetailAdmin(admin.ModelAdmin):
+class AuthorDetailAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
     list_display = ('author', 'gender', 'birth_city')
     search_fields = ('author__first_name', 'author__last_name', 'birth_city')
     ordering = ('author__last_name',)
+    list_select_related = ('author',)
 
 
 class EventParticipantInline(admin.TabularInline):
@@ -141,19 +175,123 @@ class EventParticipantInline(admin.TabularInline):
     extra = 1
 
 
-class EventAdmin(admin.ModelAdmin):
-    list_display = ('title', 'date', 'library')
+class EventAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
+    list_display = ('title', 'date', 'library', 'capacity', 'admitted_count')
     search_fields = ('title', 'library__name')
     list_filter = ('date', 'library')
     ordering = ('-date',)
+    list_select_related = ('library',)
+    readonly_fields = ('admitted_count',)
     inlines = [EventParticipantInline]
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Registrations edited inline bypass the registration service.
+        if any(formset.has_changed() for formset in formsets):
+            reconcile_events([form.instance.pk])
 
-class EventParticipantAdmin(admin.ModelAdmin):
-    list_display = ('event', 'member', 'registration_date')
+
+class EventParticipantAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
+    list_display = ('event', 'member', 'registration_date', 'status')
     search_fields = ('event__title', 'member__first_name', 'member__last_name')
-    list_filter = ('registration_date',)
+    list_filter = ('status', 'registration_date')
     ordering = ('-registration_date',)
+    list_select_related = ('event', 'member')
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        reconcile_events({obj.event_id, form.initial.get('event', obj.event_id)})
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        reconcile_events([obj.event_id])
+
+    def delete_queryset(self, request, queryset):
+        event_ids = set(queryset.values_list('event_id', flat=True))
+        super().delete_queryset(request, queryset)
+        reconcile_events(event_ids)
+
+
+class LibraryStatsAdmin(admin.ModelAdmin):
+    list_display = ('library', 'active_members', 'books_held', 'open_loans', 'overdue_loans', 'post_count',
+                    'reconciled_at')
+    readonly_fields = ('library', 'active_members', 'books_held', 'open_loans', 'post_count', 'top_rated_books',
+                       'reconciled_at')
+    ordering = ('library__name',)
+    list_select_related = ('library',)
+
+    def get_queryset(self, request):
+        return annotate_overdue(super().get_queryset(request))
+
+    @admin.display(description="Overdue Loans", ordering='overdue_loans')
+    def overdue_loans(self, obj):
+        return obj.overdue_loans
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class BulkJobAdmin(admin.ModelAdmin):
+    list_display = ('action', 'model', 'user', 'status', 'progress_percent', 'changed', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('action', 'model', 'user', 'status', 'total', 'processed', 'changed', 'error', 'created_at',
+                       'finished_at')
+    list_select_related = ('user',)
+
+    @admin.display(description="Progress")
+    def progress_percent(self, obj):
+        return f"{obj.progress}%"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+def confirm_duplicates(modeladmin, request, queryset):
+    run_bulk_action(modeladmin, request, queryset, partial(set_candidates_status, status='confirmed'), "Confirm")
+confirm_duplicates.short_description = "Confirm selected duplicates"
+
+def reject_duplicates(modeladmin, request, queryset):
+    run_bulk_action(modeladmin, request, queryset, partial(set_candidates_status, status='rejected'), "Reject")
+reject_duplicates.short_description = "Reject selected duplicates"
+
+def merge_duplicates(modeladmin, request, queryset):
+    run_bulk_action(modeladmin, request, queryset, merge_candidates, "Merge duplicates")
+merge_duplicates.short_description = "Merge selected duplicates into the kept record"
+
+
+class DuplicateCandidateAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
+    list_display = ('kind', 'canonical_id', 'duplicate_id', 'score', 'status', 'created_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('kind', 'canonical_id', 'duplicate_id', 'score', 'created_at')
+    ordering = ('-score',)
+    actions = [confirm_duplicates, reject_duplicates, merge_duplicates]
+
+    def has_add_permission(self, request):
+        return False
+
+
+class AuditEntryAdmin(KeysetPaginationAdminMixin, admin.ModelAdmin):
+    list_display = ('changed_at', 'user', 'action', 'model', 'object_id')
+    list_filter = ('model', 'action')
+    readonly_fields = ('changed_at', 'user', 'action', 'model', 'object_id', 'changes')
+    ordering = ('-changed_at',)
+    list_select_related = ('user',)
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 admin.site.register(Author, AuthorAdmin)
@@ -166,4 +304,8 @@ admin.site.register(Borrow, BorrowAdmin)
 admin.site.register(Review, ReviewAdmin)
 admin.site.register(AuthorDetail, AuthorDetailAdmin)
 admin.site.register(Event, EventAdmin)
-admin.site.register(EventParticipant, EventParticipantAdmin)
\ No newline at end of file
+admin.site.register(EventParticipant, EventParticipantAdmin)
+admin.site.register(LibraryStats, LibraryStatsAdmin)
+admin.site.register(BulkJob, BulkJobAdmin)
+admin.site.register(DuplicateCandidate, DuplicateCandidateAdmin)
+admin.site.register(AuditEntry, AuditEntryAdmin)
@@ -0,0 +1,294 @@
+import itertools
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Book, Borrow, BorrowChange
+
+DEFAULTS = {
+    'CACHE_DIR': None,
+}
+
+FETCH_SIZE = 100000
+CHANGE_BATCH = 500
+GENRES = [genre for genre, _ in Book.GENRE_CHOICES]
+FIELDS = ('pk', 'borrow_date', 'return_date', 'returned', 'library_id', 'book__genre', 'book__category_id',
+          'member__age')
+COLUMNS = {
+    'id': np.int64,
+    'borrow_day': np.int32,
+    'due_day': np.int32,
+    'returned': np.bool_,
+    'library': np.int32,
+    'genre': np.int8,
+    'category': np.int32,
+    'age': np.int16,
+}
+LATENESS_BUCKETS = [1, 8, 15, 31, 61]
+LATENESS_LABELS = ['1-7', '8-14', '15-30', '31-60', '61+']
+AGE_BINS = [0, 18, 26, 36, 51, 66]
+AGE_LABELS = ['unknown', '0-17', '18-25', '26-35', '36-50', '51-65', '66+']
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_ANALYTICS', {})}
+
+
+def _nullable(values, dtype):
+    return np.nan_to_num(np.array(values, dtype=np.float64), nan=-1).astype(dtype)
+
+
+def _encode(rows):
+    """Column arrays for a batch of FIELDS tuples: dates as days since 1970-01-01, categoricals as codes, -1 for
+    missing values."""
+    pks, borrowed, due, returned, libraries, genres, categories, ages = zip(*rows)
+    genres = np.array(genres, dtype=object)
+    genre_codes = np.full(len(genres), -1, dtype=np.int8)
+    for code, genre in enumerate(GENRES):
+        genre_codes[genres == genre] = code
+    return {
+        'id': np.array(pks, dtype=np.int64),
+        'borrow_day': np.array(borrowed, dtype='datetime64[D]').astype(np.int32),
+        'due_day': np.array(due, dtype='datetime64[D]').astype(np.int32),
+        'returned': np.array(returned, dtype=np.bool_),
+        'library': np.array(libraries, dtype=np.int32),
+        'genre': genre_codes,
+        'category': _nullable(categories, np.int32),
+        'age': _nullable(ages, np.int16),
+    }
+
+
+def fetch_borrows(queryset):
+    """Stream FIELDS of every borrow in ``queryset`` into one array per column of COLUMNS, in primary-key order."""
+    chunks = {name: [] for name in COLUMNS}
+    rows = queryset.order_by('pk').values_list(*FIELDS).iterator(chunk_size=FETCH_SIZE)
+    while batch := list(itertools.islice(rows, FETCH_SIZE)):
+        for name, values in _encode(batch).items():
+            chunks[name].append(values)
+    return {name: np.concatenate(chunks[name]) if chunks[name] else np.empty(0, dtype)
+            for name, dtype in COLUMNS.items()}
+
+
+def log_borrow_changes(pks, using='default'):
+    """Note borrows changed without save() or delete(), which the signals note, for BorrowColumns."""
+    BorrowChange.objects.using(using).bulk_create([BorrowChange(borrow_id=pk) for pk in pks])
+
+
+class BorrowColumns:
+    """Borrow columns for the circulation reports, cached as raw memory-mapped files in a subdirectory of
+    ``directory`` named after the database alias.
+
+    Each load appends the borrows newer than the cached ones and re-reads only the cached borrows listed in
+    BorrowChange since the previous load: edited ones are updated in place, and deleted, archived or restored
+    ones rewrite the files. Book and member attributes are refreshed with their borrow only; ``rebuild()``
+    drops the cache. The entries read are pruned, so a second cache of the same database that falls behind
+    is rebuilt. Without a directory every load reads all borrows.
+    """
+
+    def __init__(self, directory=None, using='default'):
+        self.directory = Path(directory) / using if directory else None
+        self.using = using
+
+    @property
+    def meta_path(self):
+        return self.directory / 'meta.json'
+
+    def column_path(self, name):
+        return self.directory / f'{name}.bin'
+
+    def read_meta(self):
+        try:
+            meta = json.loads(self.meta_path.read_text())
+        except FileNotFoundError:
+            return None
+        # Files shorter than the recorded rows were left by an interrupted rewrite.
+        if 'last_change' in meta and all(self.column_path(name).exists() and self.column_path(name).stat().st_size
+               >= meta['rows'] * np.dtype(dtype).itemsize for name, dtype in COLUMNS.items()):
+            return meta
+        return None
+
+    def write_meta(self, meta):
+        temporary = self.meta_path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(meta))
+        os.replace(temporary, self.meta_path)
+
+    def rebuild(self):
+        for path in [self.meta_path, *map(self.column_path, COLUMNS)]:
+            path.unlink(missing_ok=True)
+
+    def open_columns(self, rows):
+        if not rows:
+            return {name: np.empty(0, dtype) for name, dtype in COLUMNS.items()}
+        return {name: np.memmap(self.column_path(name), dtype=dtype, mode='r+', shape=(rows,))
+                for name, dtype in COLUMNS.items()}
+
+    def read_log(self, meta):
+        """(entry id, borrow id) of the changes from the last one read on, or None if some were pruned unread."""
+        last = meta['last_change']
+        log = list(BorrowChange.objects.using(self.using).filter(pk__gte=last).order_by('pk')
+                   .values_list('pk', 'borrow_id'))
+        # Pruning keeps the newest entry a load has read, and ids count up from 1.
+        first = log[0][0] if log else None
+        if first != last if last else first not in (None, 1):
+            return None
+        return log
+
+    def apply_changes(self, columns, meta, changed):
+        """Re-read the cached borrows ``changed``; returns the columns, rewritten if rows went or came back."""
+        borrows = Borrow.objects.using(self.using)
+        parts = [fetch_borrows(borrows.filter(pk__in=changed[start:start + CHANGE_BATCH].tolist()))
+                 for start in range(0, len(changed), CHANGE_BATCH)]
+        fresh = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+        positions = np.searchsorted(columns['id'], fresh['id'])
+        cached = positions < meta['rows']
+        cached[cached] = columns['id'][positions[cached]] == fresh['id'][cached]
+        if cached.any():
+            for name, values in fresh.items():
+                columns[name][positions[cached]] = values[cached]
+                columns[name].flush()
+        # Changed borrows no longer in the table, located among the cached ids.
+        gone = np.searchsorted(columns['id'], np.setdiff1d(changed, fresh['id']))
+        gone = gone[gone < meta['rows']]
+        gone = gone[np.isin(columns['id'][gone], changed)]
+        if not len(gone) and cached.all():
+            return columns
+        keep = np.ones(meta['rows'], dtype=np.bool_)
+        keep[gone] = False
+        merged = {name: np.concatenate([columns[name][keep], fresh[name][~cached]]) for name in COLUMNS}
+        order = np.argsort(merged['id'], kind='stable')
+        # Without its meta file an interrupted rewrite leaves a cache that the next load rebuilds.
+        self.meta_path.unlink()
+        for name, values in merged.items():
+            temporary = self.column_path(name).with_suffix('.tmp')
+            values[order].tofile(temporary)
+            os.replace(temporary, self.column_path(name))
+        meta['rows'] = len(order)
+        return self.open_columns(meta['rows'])
+
+    def load(self):
+        borrows = Borrow.objects.using(self.using)
+        if self.directory is None:
+            return fetch_borrows(borrows)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta = self.read_meta()
+        log = self.read_log(meta) if meta else None
+        if log is None:
+            self.rebuild()
+            newest = BorrowChange.objects.using(self.using).order_by('-pk').values_list('pk', flat=True).first()
+            meta, columns = {'rows': 0, 'last_id': 0, 'last_change': newest or 0}, self.open_columns(0)
+        else:
+            columns = self.open_columns(meta['rows'])
+            changed = np.unique(np.array([borrow_id for pk, borrow_id in log if pk > meta['last_change']],
+                                         dtype=np.int64))
+            changed = changed[changed <= meta['last_id']]
+            if len(changed):
+                columns = self.apply_changes(columns, meta, changed)
+        read = meta['last_change']
+        if log:
+            meta['last_change'] = log[-1][0]
+        new = fetch_borrows(borrows.filter(pk__gt=meta['last_id']))
+        if len(new['id']):
+            for name, values in new.items():
+                with open(self.column_path(name), 'ab') as handle:
+                    # Drop whatever an interrupted append left past the recorded row count.
+                    handle.truncate(meta['rows'] * np.dtype(COLUMNS[name]).itemsize)
+                    values.tofile(handle)
+            meta['rows'] += len(new['id'])
+            meta['last_id'] = int(new['id'][-1])
+            columns = self.open_columns(meta['rows'])
+        if log is None or len(new['id']) or meta['last_change'] != read or not self.meta_path.exists():
+            self.write_meta(meta)
+        if meta['last_change'] != read:
+            BorrowChange.objects.using(self.using).filter(pk__lt=meta['last_change']).delete()
+        return columns
+
+
+def load_borrow_columns(using='default'):
+    return BorrowColumns(get_config()['CACHE_DIR'], using).load()
+
+
+def group(keys, weights=None):
+    """Distinct combinations of the ``keys`` arrays with their row counts, or the sums of ``weights``."""
+    combined = np.zeros(len(keys[0]), dtype=np.int64)
+    uniques = []
+    for key in keys:
+        unique, inverse = np.unique(key, return_inverse=True)
+        combined = combined * len(unique) + inverse
+        uniques.append(unique)
+    present, inverse = np.unique(combined, return_inverse=True)
+    totals = np.bincount(inverse, weights=weights, minlength=len(present))
+    positions = np.unravel_index(present, [len(unique) for unique in uniques]) if len(present) else [
+        present for _ in uniques]
+    return [unique[position] for unique, position in zip(uniques, positions)], totals
+
+
+def _month_label(month):
+    return str(np.datetime64(int(month), 'M'))
+
+
+def _genre_label(code):
+    return GENRES[code] if code >= 0 else None
+
+
+def _optional(value):
+    return int(value) if value >= 0 else None
+
+
+def _by_month(months, key, name, label):
+    (month_keys, values), loans = group([months, key])
+    return [{'month': _month_label(month), name: label(value), 'loans': int(count)}
+            for month, value, count in zip(month_keys, values, loans)]
+
+
+def circulation_report(columns, since=None, until=None, today=None):
+    """Loans per month by library, genre and category, loan durations, lateness of open loans and member age
+    cohorts, computed with vectorised group-bys over the arrays from ``load_borrow_columns``."""
+    today = np.datetime64(today or timezone.localdate(), 'D').astype(np.int32)
+    mask = np.ones(len(columns['id']), dtype=np.bool_)
+    if since:
+        mask &= columns['borrow_day'] >= np.datetime64(since, 'D').astype(np.int32)
+    if until:
+        mask &= columns['borrow_day'] <= np.datetime64(until, 'D').astype(np.int32)
+    borrow_day, due_day = columns['borrow_day'][mask], columns['due_day'][mask]
+    returned, library = columns['returned'][mask], columns['library'][mask]
+    genre, category, age = columns['genre'][mask], columns['category'][mask], columns['age'][mask]
+    months = borrow_day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+    # Borrow records only the due date, so a loan lasts until it is due and lateness is measured on open loans.
+    duration = (due_day - borrow_day).astype(np.float64)
+
+    (libraries,), loans = group([library])
+    _, days = group([library], duration)
+    durations = [{'library_id': int(library_id), 'loans': int(count), 'average_days': round(total / count, 2)}
+                 for library_id, count, total in zip(libraries, loans, days)]
+
+    late = ~returned & (due_day < today)
+    buckets = np.digitize(today - due_day[late], LATENESS_BUCKETS) - 1
+    (late_libraries, late_buckets), late_counts = group([library[late], buckets])
+    lateness = [{'library_id': int(library_id), 'days_late': LATENESS_LABELS[bucket], 'loans': int(count)}
+                for library_id, bucket, count in zip(late_libraries, late_buckets, late_counts)]
+
+    cohort = np.where(age >= 0, np.digitize(age, AGE_BINS), 0)
+    (cohorts,), cohort_loans = group([cohort])
+    _, cohort_days = group([cohort], duration)
+    _, cohort_returned = group([cohort], returned.astype(np.float64))
+    age_cohorts = [{'ages': AGE_LABELS[code], 'loans': int(count), 'average_days': round(total / count, 2),
+                    'returned_share': round(done / count, 4)}
+                   for code, count, total, done in zip(cohorts, cohort_loans, cohort_days, cohort_returned)]
+
+    return {
+        'loans': int(mask.sum()),
+        'loans_by_month_library': _by_month(months, library, 'library_id', int),
+        'loans_by_month_genre': _by_month(months, genre, 'genre', _genre_label),
+        'loans_by_month_category': _by_month(months, category, 'category_id', _optional),
+        'loan_duration': durations,
+        'overdue_lateness': lateness,
+        'age_cohorts': age_cohorts,
+    }
+
+
+def circulation(since=None, until=None, using='default'):
+    return circulation_report(load_borrow_columns(using), since, until)
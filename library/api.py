@@ -0,0 +1,298 @@
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
+from django.http.response import HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET, require_http_methods
+
+from .audit import object_history, user_history
+from .caching import aget_author_books, aget_book_page, aget_object, get_book_page
+from .feeds import QUEUE_FIELDS, approve_posts, feed_etag, feed_page, feed_state, moderation_queue
+from .inventory import availability
+from .models import Author, Book, Borrow, Event, Library, Member, Post
+from .paginators import InvalidCursor, KeysetPaginator
+from .recommendations import KINDS, recommended_books, recommended_for_member
+from .timeline import MemberTimeline
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_BATCH = 1000
+
+BOOK_FIELDS = ('id', 'title', 'author_id', 'genre', 'category_id', 'publishing_date', 'average_rating',
+               'review_count')
+BOOK_FILTERS = ('genre', 'category', 'library')
+AUTHOR_FIELDS = ('id', 'first_name', 'last_name', 'birth_date', 'profile', 'rating')
+EVENT_FIELDS = ('id', 'title', 'date', 'library_id')
+AUDIT_FIELDS = ('id', 'changed_at', 'user_id', 'action', 'model', 'object_id', 'changes')
+AUDITED = {model._meta.model_name: model for model in (Author, Book, Borrow, Member)}
+BORROW_FIELDS = ('id', 'book_id', 'book__title', 'library_id', 'library__name', 'borrow_date', 'return_date',
+                 'returned')
+
+
+class BadRequest(Exception):
+    pass
+
+
+def page_params(request):
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError as exc:
+        raise BadRequest("Invalid limit") from exc
+    if limit < 1:
+        raise BadRequest("Invalid limit")
+    return limit, request.GET.get('cursor')
+
+
+def page_payload(page):
+    return {
+        'results': page.object_list,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
+
+
+async def paginate(queryset, request, fields):
+    """One keyset page in the queryset's default ordering, projected to ``fields``."""
+    limit, cursor = page_params(request)
+    try:
+        return page_payload(await KeysetPaginator(queryset, limit, values=fields).apage_from_cursor(cursor))
+    except InvalidCursor as exc:
+        raise BadRequest(str(exc)) from exc
+
+
+def api_view(view, methods=('GET',)):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            result = await view(request, *args, **kwargs)
+        except BadRequest as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        return result if isinstance(result, HttpResponseBase) else JsonResponse(result)
+    return require_http_methods(list(methods))(wrapper)
+
+
+def api_action(view):
+    """api_view for endpoints that change data, called with POST."""
+    return api_view(view, methods=('POST',))
+
+
+async def require_staff(request):
+    user = await request.auser()
+    if not user.is_staff:
+        raise PermissionDenied
+
+
+def book_queryset(request):
+    queryset = Book.objects.all()
+    if request.GET.get('genre'):
+        queryset = queryset.filter(genre=request.GET['genre'])
+    try:
+        if request.GET.get('category'):
+            queryset = queryset.filter(category_id=int(request.GET['category']))
+        if request.GET.get('library'):
+            queryset = queryset.filter(libraries=int(request.GET['library']))
+    except ValueError as exc:
+        raise BadRequest("Invalid filter") from exc
+    return queryset
+
+
+def book_page_params(request):
+    """The parameters a book_list page depends on, which key it in the catalogue cache."""
+    limit, cursor = page_params(request)
+    params = {name: request.GET[name] for name in BOOK_FILTERS if request.GET.get(name)}
+    return {**params, 'limit': limit, 'cursor': cursor or ''}
+
+
+def book_page(request):
+    """One page of book_list, served from the catalogue cache."""
+    params, queryset = book_page_params(request), book_queryset(request)
+
+    def load():
+        try:
+            return page_payload(KeysetPaginator(queryset, params['limit'], values=BOOK_FIELDS)
+                                .page_from_cursor(params['cursor']))
+        except InvalidCursor as exc:
+            raise BadRequest(str(exc)) from exc
+
+    return get_book_page(params, load)
+
+
+def book_payload(book):
+    return {field: getattr(book, field) for field in BOOK_FIELDS}
+
+
+async def library_exists(pk):
+    try:
+        await aget_object(Library, pk)
+    except Library.DoesNotExist:
+        return False
+    return True
+
+
+@api_view
+async def book_list(request):
+    """Books filtered by genre, category or library, served from the catalogue cache."""
+    queryset = book_queryset(request)
+    return await aget_book_page(book_page_params(request), lambda: paginate(queryset, request, BOOK_FIELDS))
+
+
+def id_list(value):
+    try:
+        return [int(pk) for pk in value.split(',') if pk]
+    except ValueError as exc:
+        raise BadRequest("Invalid id list") from exc
+
+
+@api_view
+async def book_availability(request):
+    """Available copies per library for ``books`` (comma-separated ids), optionally limited to ``libraries``."""
+    book_ids = id_list(request.GET.get('books', ''))
+    if not book_ids or len(book_ids) > MAX_LIMIT:
+        raise BadRequest(f"Pass between 1 and {MAX_LIMIT} book ids")
+    library_ids = id_list(request.GET['libraries']) if request.GET.get('libraries') else None
+    result = await sync_to_async(availability)(book_ids, library_ids)
+    return {'results': [{'book_id': book_id, 'libraries': [{'library_id': library_id, 'available': available}
+                                                           for library_id, available in libraries.items()]}
+                        for book_id, libraries in result.items()]}
+
+
+@api_view
+async def author_detail(request, pk):
+    try:
+        author = await aget_object(Author, pk)
+    except Author.DoesNotExist:
+        author = None
+    if author is None or author.deleted:
+        raise Http404("No author matches the given query.")
+    books = await aget_author_books(pk)
+    return {**{field: getattr(author, field) for field in AUTHOR_FIELDS}, 'book_count': len(books),
+            'books': [book_payload(book) for book in books]}
+
+
+@api_view
+async def library_events(request, pk):
+    if not await library_exists(pk):
+        raise Http404("No library matches the given query.")
+    return await paginate(Event.objects.filter(library_id=pk), request, EVENT_FIELDS)
+
+
+@api_view
+async def member_borrows(request, pk):
+    await require_staff(request)
+    if not await Member.all_objects.filter(pk=pk).aexists():
+        raise Http404("No member matches the given query.")
+    return await paginate(Borrow.objects.filter(member_id=pk), request, BORROW_FIELDS)
+
+
+@api_view
+async def member_timeline(request, pk):
+    """Borrows, reviews, posts and event registrations of one member, newest first."""
+    await require_staff(request)
+    if not await Member.all_objects.filter(pk=pk).aexists():
+        raise Http404("No member matches the given query.")
+    limit, cursor = page_params(request)
+    try:
+        return await MemberTimeline(pk, limit).apage(cursor)
+    except InvalidCursor as exc:
+        raise BadRequest(str(exc)) from exc
+
+
+@api_view
+async def library_feed(request, pk):
+    """Moderated posts of a library, newest first, with ETag and Last-Modified for conditional requests."""
+    limit, cursor = page_params(request)
+    state = await sync_to_async(feed_state)(pk)
+    if not state['count'] and not await library_exists(pk):
+        raise Http404("No library matches the given query.")
+    etag = quote_etag(feed_etag(pk, state, limit, cursor))
+    last_modified = state['last_modified']
+    response = get_conditional_response(request, etag, int(last_modified.timestamp()) if last_modified else None)
+    if response is None:
+        try:
+            body, etag, last_modified = await sync_to_async(feed_page)(pk, limit, cursor)
+        except InvalidCursor as exc:
+            raise BadRequest(str(exc)) from exc
+        etag = quote_etag(etag)
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Clients may keep the page but must revalidate it, which mostly costs them a 304.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@api_view
+async def library_moderation_queue(request, pk):
+    """Posts of a library waiting for moderation, oldest first."""
+    await require_staff(request)
+    if not await library_exists(pk):
+        raise Http404("No library matches the given query.")
+    return await paginate(moderation_queue(pk), request, QUEUE_FIELDS)
+
+
+@api_action
+async def approve_library_posts(request, pk):
+    """Moderate the posts listed as ``{"posts": [id, ...]}`` in one batch; posts of other libraries are ignored."""
+    await require_staff(request)
+    try:
+        post_ids = json.loads(request.body)['posts']
+        if not isinstance(post_ids, list) or not all(isinstance(post_id, int) for post_id in post_ids):
+            raise ValueError
+    except (ValueError, KeyError, TypeError) as exc:
+        raise BadRequest('Pass {"posts": [id, ...]}') from exc
+    if len(post_ids) > MAX_BATCH:
+        raise BadRequest(f"Pass at most {MAX_BATCH} post ids")
+    posts = Post.objects.filter(library_id=pk, pk__in=post_ids)
+    return {'approved': await sync_to_async(approve_posts)(posts)}
+
+
+@api_view
+async def audit_log(request):
+    """Changes to one row (``model`` and ``object``) or by one ``user``, newest first."""
+    await require_staff(request)
+    try:
+        if request.GET.get('user'):
+            entries = user_history(int(request.GET['user']))
+        elif request.GET.get('model') in AUDITED and request.GET.get('object'):
+            entries = object_history(AUDITED[request.GET['model']], int(request.GET['object']))
+        else:
+            raise BadRequest(f"Pass user, or model ({', '.join(AUDITED)}) and object")
+    except ValueError as exc:
+        raise BadRequest("Invalid filter") from exc
+    return await paginate(entries, request, AUDIT_FIELDS)
+
+
+def recommendation_payload(books):
+    return {'results': [book_payload(book) for book in books]}
+
+
+@api_view
+async def book_recommendations(request, pk):
+    """Precomputed recommendations for a book; ``kind`` is co_borrowed (default) or similar_ratings."""
+    kind = request.GET.get('kind', KINDS[0])
+    if kind not in KINDS:
+        raise BadRequest(f"Invalid kind, choose from {', '.join(KINDS)}")
+    limit, _ = page_params(request)
+    return recommendation_payload(await sync_to_async(recommended_books)(pk, kind, limit))
+
+
+@api_view
+async def member_recommendations(request, pk):
+    await require_staff(request)
+    limit, _ = page_params(request)
+    return recommendation_payload(await sync_to_async(recommended_for_member)(pk, limit))
+
+
+@require_GET
+def book_list_sync(request):
+    """Synchronous twin of book_list, kept as the WSGI baseline for benchmark_api."""
+    try:
+        return JsonResponse(book_page(request))
+    except BadRequest as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
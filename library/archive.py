@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.forms.models import model_to_dict
+
+from .bulk import iter_pk_chunks
+from .models import ArchivedAuthor, ArchivedMember, Author, AuthorDetail, Member
+
+
+def archivable_authors(before, using='default'):
+    """Authors soft-deleted before ``before`` that no book refers to any more."""
+    return Author.all_objects.using(using).filter(deleted=True, deleted_at__lt=before, book__isnull=True)
+
+
+def archivable_members(before, using='default'):
+    """Members inactive since before ``before`` with no borrows, posts, reviews or event registrations."""
+    return Member.all_objects.using(using).filter(
+        active=False, deactivated_at__lt=before, borrows__isnull=True, posts__isnull=True, reviews__isnull=True,
+        event_participations__isnull=True,
+    )
+
+
+def _archive(candidates, archive_model, snapshot, chunk_size, dry_run):
+    if dry_run:
+        return candidates.count()
+    using = candidates.db
+    archived = 0
+    for pks in iter_pk_chunks(candidates, chunk_size):
+        with transaction.atomic(using=using):
+            # Re-check inside the transaction: a row may have been restored or referenced since it was listed.
+            rows = list(candidates.filter(pk__in=pks).select_for_update())
+            archive_model.objects.using(using).bulk_create([
+                archive_model(original_id=row.pk, data=data, removed_at=removed_at)
+                for row, (data, removed_at) in zip(rows, snapshot(rows, using))
+            ])
+            candidates.model.all_objects.using(using).filter(pk__in=[row.pk for row in rows]).delete()
+        archived += len(rows)
+    return archived
+
+
+def _author_snapshots(authors, using):
+    details = {detail.author_id: model_to_dict(detail, exclude=['id', 'author'])
+               for detail in AuthorDetail.objects.using(using).filter(author__in=authors)}
+    for author in authors:
+        yield {**model_to_dict(author), 'details': details.get(author.pk)}, author.deleted_at
+
+
+def _member_snapshots(members, using):
+    libraries = {}
+    for member_id, library_id in Member.libraries.through.objects.using(using) \
+            .filter(member__in=members).values_list('member_id', 'library_id'):
+        libraries.setdefault(member_id, []).append(library_id)
+    for member in members:
+        data = model_to_dict(member, exclude=['libraries'])
+        yield {**data, 'libraries': libraries.get(member.pk, [])}, member.deactivated_at
+
+
+def archive_authors(before, chunk_size=1000, dry_run=False, using='default'):
+    """Move long-deleted authors (and their details) into ArchivedAuthor; returns the number archived."""
+    return _archive(archivable_authors(before, using), ArchivedAuthor, _author_snapshots, chunk_size, dry_run)
+
+
+def archive_members(before, chunk_size=1000, dry_run=False, using='default'):
+    """Move long-inactive members (and their library memberships) into ArchivedMember."""
+    return _archive(archivable_members(before, using), ArchivedMember, _member_snapshots, chunk_size, dry_run)
@@ -0,0 +1,237 @@
+import atexit
+import contextvars
+import logging
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .models import AuditEntry
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BACKGROUND': True,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'QUEUE_SIZE': 10000,
+    'PUT_TIMEOUT': 1.0,
+}
+
+WRITE_ATTEMPTS = 3
+
+_request = contextvars.ContextVar('library_audit_request', default=None)
+_user_id = contextvars.ContextVar('library_audit_user_id', default=None)
+_STOP = object()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_AUDIT', {})}
+
+
+class AuditMiddleware:
+    """Makes the request available to audit capture, which reads the user only when something changes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+    async def __acall__(self, request):
+        token = _request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request.reset(token)
+
+
+@contextmanager
+def acting_as(user_id):
+    """Attribute changes made in this block to ``user_id``, for work running outside a request."""
+    token = _user_id.set(user_id)
+    try:
+        yield
+    finally:
+        _user_id.reset(token)
+
+
+def current_user_id():
+    user_id = _user_id.get()
+    if user_id is not None:
+        return user_id
+    request = _request.get()
+    user = getattr(request, 'user', None)
+    return user.pk if user is not None and user.is_authenticated else None
+
+
+def _write(entries, using):
+    for attempt in range(WRITE_ATTEMPTS):
+        try:
+            AuditEntry.objects.using(using).bulk_create(entries)
+            return True
+        except DatabaseError:
+            # Usually a writer holding the SQLite lock for longer than the busy timeout.
+            if attempt == WRITE_ATTEMPTS - 1:
+                logger.exception("Dropped %d audit entries", len(entries))
+                return False
+            time.sleep(0.1 * 2 ** attempt)
+
+
+class AuditWriter:
+    """Writes audit entries from a bounded in-process queue in batches on a background thread.
+
+    A batch is written once it holds ``batch_size`` entries or ``flush_interval`` seconds after its first
+    entry. When the queue stays full for ``put_timeout`` seconds the producer writes its entry itself, so
+    memory stays bounded and a stalled writer slows requests down instead of losing entries.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, queue_size=10000, put_timeout=1.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(queue_size)
+        self.stats = Counter()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='library-audit', daemon=True)
+                self._thread.start()
+
+    def put(self, entries, using='default'):
+        self.start()
+        for entry in entries:
+            try:
+                self.queue.put((using, entry), timeout=self.put_timeout)
+            except queue.Full:
+                self.stats['written_inline'] += 1
+                _write([entry], using)
+
+    def flush(self):
+        """Block until every queued entry has been written."""
+        self.queue.join()
+
+    def stop(self, timeout=10):
+        """Write what is queued and end the thread; registered to run at interpreter exit."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None or not thread.is_alive():
+            return
+        self.queue.put(_STOP)
+        thread.join(timeout)
+
+    def _next_batch(self):
+        item = self.queue.get()
+        batch = [item]
+        deadline = time.monotonic() + self.flush_interval
+        while item is not _STOP and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        try:
+            while True:
+                batch = self._next_batch()
+                stopping = batch[-1] is _STOP
+                entries = defaultdict(list)
+                for item in batch[:-1] if stopping else batch:
+                    entries[item[0]].append(item[1])
+                for using, items in entries.items():
+                    if _write(items, using):
+                        self.stats['written'] += len(items)
+                    else:
+                        self.stats['dropped'] += len(items)
+                self.stats['batches'] += 1
+                for _ in batch:
+                    self.queue.task_done()
+                if stopping:
+                    return
+        finally:
+            connections.close_all()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            config = get_config()
+            _writer = AuditWriter(config['BATCH_SIZE'], config['FLUSH_INTERVAL'], config['QUEUE_SIZE'],
+                                  config['PUT_TIMEOUT'])
+            atexit.register(_writer.stop)
+        return _writer
+
+
+def _submit(entries, using):
+    if get_config()['BACKGROUND']:
+        get_writer().put(entries, using)
+    else:
+        _write(entries, using)
+
+
+def record(model, changes, action='update', using='default'):
+    """Log ``changes``, ``{pk: {field: [old, new]}}``, to rows of ``model`` once the transaction commits.
+
+    The entries are captured now, with the acting user and time, and written later in batches.
+    """
+    if not changes or not get_config()['ENABLED']:
+        return
+    user_id, now, label = current_user_id(), timezone.now(), model._meta.label_lower
+    entries = [AuditEntry(model=label, object_id=pk, action=action, changes=fields, user_id=user_id, changed_at=now)
+               for pk, fields in changes.items()]
+    transaction.on_commit(lambda: _submit(entries, using), using=using)
+
+
+def diff(instance, action):
+    """``{field: [old, new]}`` of the editable fields of ``instance`` a save or delete changes."""
+    values = instance.__dict__
+    names = type(instance).audited_fields()
+    if action == 'create':
+        return {name: [None, values[name]] for name in names if name in values}
+    if action == 'delete':
+        return {name: [values[name], None] for name in names if name in values}
+    loaded = getattr(instance, '_loaded_state', {})
+    return {name: [loaded[name], values[name]] for name in names
+            if name in loaded and name in values and loaded[name] != values[name]}
+
+
+def object_history(model, pk, using='default'):
+    """Audit entries of one row, newest first, read on the (model, object_id, changed_at) index."""
+    return AuditEntry.objects.using(using).filter(model=model._meta.label_lower, object_id=pk) \
+        .order_by('-changed_at', '-pk')
+
+
+def user_history(user_id, using='default'):
+    """Changes made by one user, newest first, read on the (user, changed_at) index."""
+    return AuditEntry.objects.using(using).filter(user_id=user_id).order_by('-changed_at', '-pk')
@@ -0,0 +1,198 @@
+import platform
+import random
+import sqlite3
+import statistics
+import time
+
+import django
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .dashboard import library_dashboard
+from .models import Book, Borrow, Event, EventParticipant, Library, Member, Post, Review
+from .paginators import KeysetPaginator
+from .search import search
+from .seeding import WORDS
+from .timeline import MemberTimeline
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class Context:
+    """State shared by the benchmarks of one run: a logged-in admin client and a seeded RNG."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.client = Client()
+        user = User.objects.create_superuser('benchmark-admin', 'benchmark@example.org', None)
+        self.client.force_login(user)
+        self.cursors = {}
+
+    def random_pk(self, model):
+        last = model._default_manager.aggregate(last=Max('pk'))['last'] or 1
+        return self.rng.randint(1, last)
+
+
+def _changelist(model):
+    def run(context):
+        response = context.client.get(reverse(f'admin:library_{model._meta.model_name}_changelist'))
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+def _deep_changelist(model, page):
+    # The cursor is computed once, outside the timed loop, with the admin's ordering and page size.
+    def run(context):
+        key = (model, page)
+        if key not in context.cursors:
+            model_admin = site._registry[model]
+            queryset = model._default_manager.order_by(*model_admin.get_ordering(None), '-pk')
+            paginator = KeysetPaginator(queryset, model_admin.list_per_page)
+            cursor = None
+            for _ in range(page - 1):
+                cursor = paginator.page_from_cursor(cursor).next_cursor
+                if cursor is None:
+                    break
+            context.cursors[key] = cursor
+        url = reverse(f'admin:library_{model._meta.model_name}_changelist')
+        cursor = context.cursors[key]
+        response = context.client.get(url, {'cursor': cursor} if cursor else {})
+        assert response.status_code == 200, response.status_code
+    return run
+
+
+for _model in (Book, Borrow, Review, Member, Post, EventParticipant):
+    benchmark(f'admin.{_model._meta.model_name}.changelist')(_changelist(_model))
+benchmark('admin.borrow.changelist_page_10')(_deep_changelist(Borrow, 10))
+
+
+@benchmark('book.rating.stored_top_50')
+def stored_top_rated(context):
+    return [book.rating for book in Book.objects.top_rated()[:50]]
+
+
+@benchmark('book.rating.live_page_50')
+def live_rating_page(context):
+    return [book.rating for book in Book.objects.with_live_rating()[:50]]
+
+
+@benchmark('borrow.overdue.count')
+def overdue_count(context):
+    return Borrow.objects.overdue().count()
+
+
+@benchmark('borrow.overdue.by_library')
+def overdue_by_library(context):
+    return Borrow.objects.overdue_counts_by_library()
+
+
+@benchmark('borrow.due_within_7_days')
+def due_soon(context):
+    return list(Borrow.objects.due_within(7).values_list('pk', flat=True)[:500])
+
+
+@benchmark('search.books')
+def search_books(context):
+    return search(Book, ' '.join(context.rng.sample(WORDS, 2)), limit=20)
+
+
+@benchmark('search.posts_prefix')
+def search_posts(context):
+    return search(Post, context.rng.choice(WORDS)[:3], limit=20)
+
+
+@benchmark('member.history.first_page')
+def member_history(context):
+    member_id = context.random_pk(Member)
+    return KeysetPaginator(Borrow.objects.filter(member_id=member_id).select_related('book', 'library'),
+                           20).page_from_cursor().object_list
+
+
+@benchmark('member.timeline.first_page')
+def member_timeline(context):
+    return MemberTimeline(context.random_pk(Member), 20).page()['results']
+
+
+@benchmark('event.roster')
+def event_roster(context):
+    event_id = context.random_pk(Event)
+    return list(EventParticipant.objects.filter(event_id=event_id).select_related('member'))
+
+
+@benchmark('library.dashboard')
+def dashboard(context):
+    return library_dashboard(context.random_pk(Library))
+
+
+@benchmark('review.changelist_order_page')
+def review_page(context):
+    return KeysetPaginator(Review.objects.select_related('book', 'reviewer'), 100).page_from_cursor().object_list
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'vendor': connection.vendor,
+        'rows': {model.__name__: model._default_manager.count()
+                 for model in (Book, Borrow, Review, Member, Post, Event, EventParticipant)},
+    }
+
+
+class Rollback(Exception):
+    pass
+
+
+def run_benchmarks(names=None, repeat=5, warmup=1, seed=0):
+    """Time each benchmark and return a JSON-serialisable report; all writes are rolled back."""
+    results = {}
+    try:
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+            context = Context(seed)
+            for name, function in BENCHMARKS.items():
+                if names and name not in names:
+                    continue
+                for _ in range(warmup):
+                    function(context)
+                timings = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(repeat):
+                        started = time.perf_counter()
+                        function(context)
+                        timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                results[name] = {
+                    'median_ms': statistics.median(timings),
+                    'min_ms': timings[0],
+                    'p95_ms': timings[min(int(len(timings) * 0.95), len(timings) - 1)],
+                    'queries': len(queries) / repeat,
+                }
+            raise Rollback
+    except Rollback:
+        pass
+    return {'environment': environment(), 'repeat': repeat, 'results': results}
+
+
+def compare(report, baseline, threshold):
+    """Benchmarks whose median regressed by more than ``threshold`` (a ratio) against the baseline."""
+    regressions = {}
+    for name, result in report['results'].items():
+        previous = baseline.get('results', {}).get(name)
+        if previous and previous['median_ms'] > 0:
+            ratio = result['median_ms'] / previous['median_ms']
+            if ratio > threshold:
+                regressions[name] = ratio
+    return regressions
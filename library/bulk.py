@@ -0,0 +1,164 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import connections, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from .analytics import log_borrow_changes
+from .audit import acting_as, record
+from .caching import invalidate_objects
+from .dashboard import bump_daily, bump_due, bump_library
+from .inventory import bump_available
+from .models import Author, Borrow, BulkJob, Member
+from .overdue import refresh_overdue_counts
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CHUNK_SIZE': 1000,
+    'BACKGROUND_THRESHOLD': 5000,
+    'WORKERS': 1,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_BULK_ACTIONS', {})}
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=get_config()['WORKERS'], thread_name_prefix='library-bulk')
+        return _executor
+
+
+def iter_pk_chunks(queryset, chunk_size):
+    """Yield the primary keys of ``queryset`` in ascending lists of at most ``chunk_size``."""
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        pks = list(page.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def run_job(job, apply, queryset, chunk_size=None):
+    """Run ``apply`` over the selection one chunk per transaction, recording progress on ``job``.
+
+    ``apply`` receives a queryset restricted to the chunk and returns the number of rows it changed.
+    Chunks committed before a failure stay applied; the job is marked failed with the error.
+    """
+    using = queryset.db
+    jobs = BulkJob.objects.using(using).filter(pk=job.pk)
+    jobs.update(status='running')
+    rows = queryset.model._base_manager.using(using)
+    try:
+        with acting_as(job.user_id):
+            for pks in iter_pk_chunks(queryset, chunk_size or get_config()['CHUNK_SIZE']):
+                with transaction.atomic(using=using):
+                    changed = apply(rows.filter(pk__in=pks))
+                    jobs.update(processed=F('processed') + len(pks), changed=F('changed') + changed)
+    except Exception as exc:
+        logger.exception("Bulk job %s failed", job.pk)
+        jobs.update(status='failed', error=repr(exc), finished_at=timezone.now())
+    else:
+        jobs.update(status='done', finished_at=timezone.now())
+    job.refresh_from_db(using=using)
+    return job
+
+
+def _run_in_background(job, apply, queryset, chunk_size):
+    try:
+        run_job(job, apply, queryset, chunk_size)
+    finally:
+        connections.close_all()
+
+
+def start_job(apply, queryset, action, user=None):
+    """Record a BulkJob for ``queryset`` and run it inline, or on the worker pool once the transaction commits
+    when the selection is larger than BACKGROUND_THRESHOLD."""
+    config = get_config()
+    using = queryset.db
+    total = queryset.count()
+    job = BulkJob.objects.using(using).create(action=action, model=str(queryset.model._meta.verbose_name_plural),
+                                              user=user, total=total)
+    threshold = config['BACKGROUND_THRESHOLD']
+    if threshold is not None and total > threshold:
+        transaction.on_commit(lambda: get_executor().submit(_run_in_background, job, apply, queryset,
+                                                            config['CHUNK_SIZE']), using=using)
+        return job
+    return run_job(job, apply, queryset, config['CHUNK_SIZE'])
+
+
+def run_bulk_action(modeladmin, request, queryset, apply, action):
+    """Admin action body: start a bulk job for the selection and tell the user how it went."""
+    user = request.user if request.user.is_authenticated else None
+    job = start_job(apply, queryset, action, user)
+    link = format_html('<a href="{}">bulk job #{}</a>', reverse('admin:library_bulkjob_change', args=[job.pk]), job.pk)
+    if job.status == 'queued':
+        modeladmin.message_user(request, format_html("Started {} for {} {}.", link, job.total, job.model))
+    elif job.status == 'failed':
+        modeladmin.message_user(request, format_html("{} failed after {} of {} {}: {}", link, job.processed,
+                                                     job.total, job.model, job.error), messages.ERROR)
+    else:
+        modeladmin.message_user(request, f"Updated {job.changed} of {job.total} selected {job.model}.")
+    return job
+
+
+def set_authors_deleted(authors, deleted):
+    pks = list(authors.exclude(deleted=deleted).values_list('pk', flat=True))
+    authors.filter(pk__in=pks).update(deleted=deleted, deleted_at=timezone.now() if deleted else None)
+    invalidate_objects(Author, pks, authors.db)
+    record(Author, {pk: {'deleted': [not deleted, deleted]} for pk in pks}, using=authors.db)
+    return len(pks)
+
+
+def set_members_active(members, active):
+    using = members.db
+    pks = list(members.exclude(active=active).values_list('pk', flat=True))
+    members.filter(pk__in=pks).update(active=active, deactivated_at=None if active else timezone.now())
+    record(Member, {pk: {'active': [not active, active]} for pk in pks}, using=using)
+    memberships = Counter(Member.libraries.through.objects.using(using).filter(member_id__in=pks)
+                          .values_list('library_id', flat=True))
+    for library_id, count in memberships.items():
+        bump_library(library_id, using, active_members=count if active else -count)
+    return len(pks)
+
+
+def set_members_role(members, role):
+    rows = list(members.exclude(role=role).values_list('pk', 'role'))
+    members.filter(pk__in=[pk for pk, _ in rows]).update(role=role)
+    record(Member, {pk: {'role': [old, role]} for pk, old in rows}, using=members.db)
+    return len(rows)
+
+
+def return_borrows(borrows):
+    using = borrows.db
+    rows = list(borrows.filter(returned=False).values_list('pk', 'library_id', 'return_date', 'member_id', 'book_id'))
+    borrows.filter(pk__in=[row[0] for row in rows]).update(returned=True)
+    log_borrow_changes([row[0] for row in rows], using)
+    record(Borrow, {row[0]: {'returned': [False, True]} for row in rows}, using=using)
+    today = timezone.localdate()
+    for (library_id, return_date), count in Counter((row[1], row[2]) for row in rows).items():
+        bump_due(library_id, return_date, -count, using)
+    for library_id, count in Counter(row[1] for row in rows).items():
+        bump_library(library_id, using, open_loans=-count)
+        bump_daily(library_id, today, using, loans_returned=count)
+    for (library_id, book_id), count in Counter((row[1], row[4]) for row in rows).items():
+        bump_available(library_id, book_id, count, using)
+    refresh_overdue_counts(Member.all_objects.using(using).filter(pk__in={row[3] for row in rows}), today)
+    return len(rows)
@@ -0,0 +1,356 @@
+import copy
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import urlencode
+from django.utils.module_loading import import_string
+
+from .models import Author, Book, Category
+
+DEFAULTS = {
+    'BACKEND': 'library.caching.LocalMemoryBackend',
+    'TIMEOUT': 300,
+    'OPTIONS': {},
+}
+
+
+class LocalMemoryBackend:
+    """Thread-safe in-process cache with LRU eviction and per-entry TTL."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _set(self, key, value, timeout):
+        self._data[key] = (value, time.monotonic() + timeout if timeout else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            values = {key: self._get(key, now) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._get(key, time.monotonic()) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """Shared backend delegating to one of the caches configured in settings.CACHES."""
+
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set(self, key, value, timeout=None):
+        self.cache.set(key, value, timeout)
+
+    def add(self, key, value, timeout=None):
+        return self.cache.add(key, value, timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ReadThroughCache:
+    """Read-through cache whose entries are tagged with a per-key generation token.
+
+    Invalidation replaces the token, so a value loaded from the database before
+    a concurrent write commits can still be stored but is never served.
+    """
+
+    def __init__(self, backend, timeout):
+        self.backend = backend
+        self.timeout = timeout
+        self.stats = Counter()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _generation_key(key):
+        return f'{key}:generation'
+
+    def _count(self, namespace, event):
+        with self._stats_lock:
+            self.stats[f'{namespace}.{event}'] += 1
+
+    def _lookup(self, keys, namespace):
+        """Generation token per key and the values cached under the current one; sets missing tokens."""
+        generation_keys = {key: self._generation_key(key) for key in keys}
+        found = self.backend.get_many([*generation_keys.values(), *keys])
+        unset = [generation_key for generation_key in generation_keys.values() if generation_key not in found]
+        if unset:
+            for generation_key in unset:
+                self.backend.add(generation_key, uuid.uuid4().hex)
+            found.update(self.backend.get_many(unset))
+        generations = {key: found.get(generation_key) for key, generation_key in generation_keys.items()}
+        values = {}
+        for key in keys:
+            entry = found.get(key)
+            if entry is not None and entry[0] == generations[key]:
+                values[key] = entry[1]
+        if values:
+            self._count(namespace, 'hits')
+        if len(values) < len(generations):
+            self._count(namespace, 'misses')
+        return generations, values
+
+    def _store(self, generations, loaded):
+        for key, value in loaded.items():
+            if generations.get(key) is not None:
+                self.backend.set(key, (generations[key], value), self.timeout)
+
+    def get(self, key, loader, namespace):
+        generations, values = self._lookup([key], namespace)
+        if key in values:
+            return values[key]
+        value = loader()
+        self._store(generations, {key: value})
+        return value
+
+    def get_many(self, keys, loader, namespace):
+        """Values of several keys; ``loader`` receives the keys not cached and returns a dict of their values."""
+        generations, values = self._lookup(keys, namespace)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            loaded = {key: value for key, value in loader(missing).items() if key in generations}
+            self._store(generations, {key: loaded.get(key) for key in missing})
+            values.update(loaded)
+        return values
+
+    # Async twins for async views: the loaders are coroutine functions, the backend is called directly since
+    # its lookups never touch the database.
+
+    async def aget(self, key, loader, namespace):
+        generations, values = self._lookup([key], namespace)
+        if key in values:
+            return values[key]
+        value = await loader()
+        self._store(generations, {key: value})
+        return value
+
+    async def aget_many(self, keys, loader, namespace):
+        generations, values = self._lookup(keys, namespace)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            loaded = {key: value for key, value in (await loader(missing)).items() if key in generations}
+            self._store(generations, {key: loaded.get(key) for key in missing})
+            values.update(loaded)
+        return values
+
+    def invalidate(self, key, namespace):
+        self.backend.set(self._generation_key(key), uuid.uuid4().hex)
+        self.backend.delete(key)
+        self._count(namespace, 'invalidations')
+
+    def invalidate_on_commit(self, keys, namespace, using='default'):
+        keys = list(keys)
+
+        def invalidate():
+            for key in keys:
+                self.invalidate(key, namespace)
+
+        transaction.on_commit(invalidate, using=using)
+
+    def clear(self):
+        self.backend.clear()
+        with self._stats_lock:
+            self.stats.clear()
+
+
+@lru_cache(maxsize=None)
+def get_cache():
+    config = {**DEFAULTS, **getattr(settings, 'LIBRARY_CACHE', {})}
+    options = {name.lower(): value for name, value in config['OPTIONS'].items()}
+    return ReadThroughCache(import_string(config['BACKEND'])(**options), config['TIMEOUT'])
+
+
+def object_key(model, pk):
+    return f'library:{model._meta.label_lower}:{pk}'
+
+
+CATEGORIES_KEY = 'library:categories'
+BOOKS_KEY = 'library:books'
+
+
+def holdings_key(library_id):
+    return f'library:holdings:{library_id}'
+
+
+def feed_key(library_id):
+    return f'library:feed:{library_id}'
+
+
+def author_books_key(author_id):
+    return f'library:author-books:{author_id}'
+
+
+def _found(model, pk, instance):
+    if instance is None:
+        raise model.DoesNotExist(f"{model.__name__} matching pk={pk} does not exist.")
+    return copy.copy(instance)
+
+
+def get_object(model, pk):
+    """Return the instance with this pk, loading it on a miss; raises model.DoesNotExist."""
+    instance = get_cache().get(object_key(model, pk), lambda: model._default_manager.filter(pk=pk).first(),
+                               model._meta.label_lower)
+    return _found(model, pk, instance)
+
+
+async def aget_object(model, pk):
+    instance = await get_cache().aget(object_key(model, pk), model._default_manager.filter(pk=pk).afirst,
+                                      model._meta.label_lower)
+    return _found(model, pk, instance)
+
+
+def get_objects(model, pks):
+    """Instances with these pks in the same order, loading the ones not cached with a single query."""
+    keys = {object_key(model, pk): pk for pk in pks}
+
+    def load(missing):
+        instances = model._default_manager.in_bulk([keys[key] for key in missing])
+        return {key: instances.get(keys[key]) for key in missing}
+
+    found = get_cache().get_many(list(keys), load, model._meta.label_lower)
+    return [copy.copy(found[key]) for key in keys if found.get(key) is not None]
+
+
+async def aget_objects(model, pks):
+    keys = {object_key(model, pk): pk for pk in pks}
+
+    async def load(missing):
+        instances = await model._default_manager.ain_bulk([keys[key] for key in missing])
+        return {key: instances.get(keys[key]) for key in missing}
+
+    found = await get_cache().aget_many(list(keys), load, model._meta.label_lower)
+    return [copy.copy(found[key]) for key in keys if found.get(key) is not None]
+
+
+def get_categories():
+    return get_cache().get(CATEGORIES_KEY, lambda: tuple(Category.objects.values_list('pk', 'name')), 'categories')
+
+
+def get_library_holdings(library_id):
+    """(pk, title) pairs of the books held by a library."""
+    return get_cache().get(
+        holdings_key(library_id),
+        lambda: tuple(Book.objects.filter(libraries=library_id).order_by('title').values_list('pk', 'title')),
+        'holdings',
+    )
+
+
+def _author_book_ids(author_id):
+    return Book.objects.filter(author_id=author_id).values_list('pk', flat=True)
+
+
+def get_author_books(author_id):
+    """Books of an author in the default ordering; the list holds ids, the books come from the object cache."""
+    book_ids = get_cache().get(author_books_key(author_id), lambda: tuple(_author_book_ids(author_id)),
+                               'author-books')
+    return get_objects(Book, book_ids)
+
+
+async def aget_author_books(author_id):
+    async def load():
+        return tuple([pk async for pk in _author_book_ids(author_id)])
+
+    return await aget_objects(Book, await get_cache().aget(author_books_key(author_id), load, 'author-books'))
+
+
+async def _new_version():
+    return uuid.uuid4().hex
+
+
+def book_page_key(params, version):
+    return f'{BOOKS_KEY}:{version}:{urlencode(sorted(params.items()))}'
+
+
+def get_book_page(params, loader):
+    """A page of the book list for these query ``params``.
+
+    Pages are stored under the current catalogue version, so any change to a book, author, category or
+    holding drops all of them at once.
+    """
+    version = get_cache().get(BOOKS_KEY, lambda: uuid.uuid4().hex, 'books')
+    return get_cache().get(book_page_key(params, version), loader, 'books')
+
+
+async def aget_book_page(params, loader):
+    version = await get_cache().aget(BOOKS_KEY, _new_version, 'books')
+    return await get_cache().aget(book_page_key(params, version), loader, 'books')
+
+
+def cache_stats():
+    return dict(get_cache().stats)
+
+
+def invalidate_objects(model, pks, using='default'):
+    pks = list(pks)
+    if not pks:
+        return
+    get_cache().invalidate_on_commit([object_key(model, pk) for pk in pks], model._meta.label_lower, using)
+    if model is Category:
+        get_cache().invalidate_on_commit([CATEGORIES_KEY], 'categories', using)
+    if model in (Author, Book, Category):
+        get_cache().invalidate_on_commit([BOOKS_KEY], 'books', using)
+
+
+def invalidate_holdings(library_ids, using='default'):
+    library_ids = list(library_ids)
+    get_cache().invalidate_on_commit([holdings_key(pk) for pk in library_ids], 'holdings', using)
+    if library_ids:
+        get_cache().invalidate_on_commit([BOOKS_KEY], 'books', using)
+
+
+def invalidate_author_books(author_ids, using='default'):
+    get_cache().invalidate_on_commit([author_books_key(pk) for pk in author_ids], 'author-books', using)
+
+
+def invalidate_feeds(library_ids, using='default'):
+    get_cache().invalidate_on_commit([feed_key(pk) for pk in library_ids], 'feeds', using)
+
+
+def book_library_ids(book_ids, using='default'):
+    return set(Book.libraries.through.objects.using(using).filter(book_id__in=book_ids)
+               .values_list('library_id', flat=True))
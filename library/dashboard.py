@@ -0,0 +1,169 @@
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import (Book, Borrow, Event, EventParticipant, Library, LibraryDailyStats, LibraryLoanDue,
+                     LibraryStats, Member, Post)
+
+TOP_RATED_SIZE = 5
+
+
+def _increment(model, lookup, deltas, using='default'):
+    """Add ``deltas`` to the counters of the row matching ``lookup``, creating it when missing."""
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas or None in lookup.values():
+        return
+    manager = model._default_manager.using(using)
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    if manager.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic(using=using):
+            manager.create(**lookup, **deltas)
+    except IntegrityError:
+        manager.filter(**lookup).update(**changes)
+
+
+def bump_library(library_id, using='default', **deltas):
+    _increment(LibraryStats, {'library_id': library_id}, deltas, using)
+
+
+def bump_daily(library_id, date, using='default', **deltas):
+    _increment(LibraryDailyStats, {'library_id': library_id, 'date': date}, deltas, using)
+
+
+def bump_due(library_id, due_date, delta, using='default'):
+    _increment(LibraryLoanDue, {'library_id': library_id, 'due_date': due_date}, {'open_loans': delta}, using)
+
+
+def top_rated_books(library_id, using='default'):
+    books = Book.objects.using(using).filter(libraries=library_id).top_rated()[:TOP_RATED_SIZE]
+    return [{'id': book_id, 'title': title, 'average_rating': round(rating, 2)}
+            for book_id, title, rating in books.values_list('pk', 'title', 'average_rating')]
+
+
+def refresh_top_rated_for_book(book_id, using='default'):
+    """Fold the book's new rating into the stored top-rated list of each library holding it.
+
+    The lists are edited in place. A library is queried again only when the book may drop out of a full
+    list, since the book that would take its place is not stored.
+    """
+    book = Book.objects.using(using).filter(pk=book_id).values_list('title', 'average_rating', 'review_count') \
+        .first()
+    entry = None
+    if book and book[2] >= 1:
+        entry = {'id': book_id, 'title': book[0], 'average_rating': round(book[1], 2)}
+    library_ids = Book.libraries.through.objects.using(using).filter(book_id=book_id) \
+        .values_list('library_id', flat=True)
+    for stats in LibraryStats.objects.using(using).filter(library_id__in=library_ids):
+        listed = stats.top_rated_books
+        others = [other for other in listed if other['id'] != book_id]
+        if (len(others) < len(listed) and len(listed) >= TOP_RATED_SIZE
+                and (entry is None or entry['average_rating'] < listed[-1]['average_rating'])):
+            top = top_rated_books(stats.library_id, using)
+        else:
+            top = sorted(others + [entry] if entry else others, key=lambda other: -other['average_rating'])
+            top = top[:TOP_RATED_SIZE]
+        if top != listed:
+            stats.top_rated_books = top
+            stats.save(update_fields=['top_rated_books'])
+
+
+def reconcile_library_stats(library_ids=None, days=90, today=None, using='default'):
+    """Recompute every summary row from the source tables; returns the number of libraries refreshed."""
+    today = today or timezone.localdate()
+    libraries = Library.objects.using(using).all()
+    if library_ids is not None:
+        libraries = libraries.filter(pk__in=library_ids)
+    library_ids = list(libraries.values_list('pk', flat=True))
+
+    def grouped(queryset, *fields):
+        return {tuple(row[:-1]) if len(fields) > 1 else row[0]: row[-1] for row in
+                queryset.filter(library_id__in=library_ids).order_by().values(*fields)
+                .annotate(total=Count('pk')).values_list(*fields, 'total')}
+
+    members = grouped(Member.libraries.through.objects.using(using).filter(member__active=True), 'library_id')
+    books = grouped(Book.libraries.through.objects.using(using), 'library_id')
+    due = grouped(Borrow.objects.using(using).open(), 'library_id', 'return_date')
+    posts = grouped(Post.objects.using(using), 'library_id')
+
+    since = today - datetime.timedelta(days=days)
+    daily = {}
+    for field, queryset, date_field in (
+            ('loans_started', Borrow.objects.using(using), 'borrow_date'),
+            ('posts_created', Post.objects.using(using), 'created_at'),
+            ('event_registrations', EventParticipant.objects.using(using)
+             .annotate(library_id=F('event__library_id')), 'registration_date')):
+        counts = grouped(queryset.filter(**{f'{date_field}__gte': since}), 'library_id', date_field)
+        for key, total in counts.items():
+            daily.setdefault(key, {})[field] = total
+
+    now = timezone.now()
+    with transaction.atomic(using=using):
+        for library_id in library_ids:
+            open_loans = sum(total for (library, _), total in due.items() if library == library_id)
+            LibraryStats.objects.using(using).update_or_create(library_id=library_id, defaults={
+                'active_members': members.get(library_id, 0),
+                'books_held': books.get(library_id, 0),
+                'open_loans': open_loans,
+                'post_count': posts.get(library_id, 0),
+                'top_rated_books': top_rated_books(library_id, using),
+                'reconciled_at': now,
+            })
+        LibraryLoanDue.objects.using(using).filter(library_id__in=library_ids).delete()
+        LibraryLoanDue.objects.using(using).bulk_create([
+            LibraryLoanDue(library_id=library_id, due_date=due_date, open_loans=total)
+            for (library_id, due_date), total in due.items()
+        ])
+        # loans_returned has no source column to rebuild from, so existing values are kept.
+        existing = {(row.library_id, row.date): row for row in LibraryDailyStats.objects.using(using)
+                    .filter(library_id__in=library_ids, date__gte=since)}
+        rebuilt = ['loans_started', 'posts_created', 'event_registrations']
+        for row in existing.values():
+            for field in rebuilt:
+                setattr(row, field, daily.get((row.library_id, row.date), {}).get(field, 0))
+        LibraryDailyStats.objects.using(using).bulk_update(existing.values(), rebuilt, batch_size=1000)
+        LibraryDailyStats.objects.using(using).bulk_create([
+            LibraryDailyStats(library_id=library_id, date=date, **counts)
+            for (library_id, date), counts in daily.items() if (library_id, date) not in existing
+        ])
+    return len(library_ids)
+
+
+def overdue_loans(library_id, today=None, using='default'):
+    return LibraryLoanDue.objects.using(using).filter(
+        library_id=library_id, due_date__lt=today or timezone.localdate(),
+    ).aggregate(total=Coalesce(Sum('open_loans'), 0))['total']
+
+
+def annotate_overdue(queryset, today=None):
+    overdue = (LibraryLoanDue.objects.filter(library_id=OuterRef('library_id'),
+                                             due_date__lt=today or timezone.localdate())
+               .order_by().values('library_id').annotate(total=Sum('open_loans')).values('total'))
+    return queryset.annotate(overdue_loans=Coalesce(Subquery(overdue), Value(0)))
+
+
+def library_dashboard(library_id, days=30, using='default'):
+    """Dashboard figures for one library, read from the summary tables with a fixed number of queries."""
+    stats = LibraryStats.objects.using(using).filter(library_id=library_id).first() or LibraryStats(
+        library_id=library_id)
+    today = timezone.localdate()
+    daily = LibraryDailyStats.objects.using(using).filter(
+        library_id=library_id, date__gt=today - datetime.timedelta(days=days), date__lte=today,
+    ).order_by('date').values('date', 'loans_started', 'loans_returned', 'posts_created', 'event_registrations')
+    return {
+        'library': library_id,
+        'active_members': stats.active_members,
+        'books_held': stats.books_held,
+        'current_loans': stats.open_loans,
+        'overdue_loans': overdue_loans(library_id, today, using),
+        'post_count': stats.post_count,
+        'top_rated_books': stats.top_rated_books,
+        'upcoming_events': Event.objects.using(using).filter(library_id=library_id, date__gte=timezone.now())
+        .count(),
+        'daily': list(daily),
+        'reconciled_at': stats.reconciled_at,
+    }
@@ -0,0 +1,449 @@
+import itertools
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Case, F, Subquery, Value, When
+
+from .analytics import log_borrow_changes
+from .audit import record
+from .caching import book_library_ids, invalidate_author_books, invalidate_holdings, invalidate_objects
+from .inventory import refresh_availability
+from .models import Author, AuthorDetail, Book, Borrow, DuplicateCandidate, Event, Holding, Review
+from .ratings import recompute_book_ratings
+from .recommendations import mark_stale
+from .search import INDEXES, get_search_backend
+
+KINDS = ('author', 'book')
+FETCH_SIZE = 100000
+WRITE_BATCH_SIZE = 2000
+MERGE_CHUNK_SIZE = 500
+# Blocks larger than this are compared within a sliding window over their sorted records instead of pairwise.
+MAX_BLOCK_SIZE = 200
+WINDOW = 20
+BATCH_PAIRS = 50000
+AUTHOR_THRESHOLD = 0.9
+BOOK_THRESHOLD = 0.85
+# Weights of the first name, last name and birth date in an author score.
+AUTHOR_WEIGHTS = (0.35, 0.45, 0.2)
+# Factor applied to a book title score when the publishing years differ.
+YEAR_PENALTY = 0.9
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+    """Lowercase ASCII words of ``text`` separated by single spaces, accents and punctuation removed."""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return ' '.join(_WORD.findall(text))
+
+
+def author_records(queryset):
+    """(pk, first name, last name, birth day ordinal, birth year) per author, names normalized."""
+    rows = queryset.order_by().values_list('pk', 'first_name', 'last_name', 'birth_date')
+    return [(pk, normalize(first), normalize(last), born.toordinal(), born.year)
+            for pk, first, last, born in rows.iterator(chunk_size=FETCH_SIZE)]
+
+
+def book_records(queryset, author_map=None):
+    """(pk, title, author id, publishing year) per book, the title normalized and the author replaced by its
+    canonical author from ``author_map``."""
+    author_map = author_map or {}
+    rows = queryset.order_by().values_list('pk', 'title', 'author_id', 'publishing_date')
+    return [(pk, normalize(title), author_map.get(author_id, author_id), published.year)
+            for pk, title, author_id, published in rows.iterator(chunk_size=FETCH_SIZE)]
+
+
+def author_keys(record):
+    _, _, last, born, year = record
+    yield 'name', last.replace(' ', ''), year
+    # Keys on the exact birth date and either end of the last name catch most misspelt last names.
+    yield 'born', born, last[:3]
+    yield 'born', born, last[-3:]
+
+
+def book_keys(record):
+    _, title, author_id, _ = record
+    tokens = sorted({token for token in title.split() if len(token) >= 3}, key=lambda token: (-len(token), token))
+    for token in tokens[:2] or [title]:
+        yield author_id, token
+
+
+def _ratio(a, b, floor=0.0):
+    if a == b:
+        return 1.0
+    matcher = SequenceMatcher(None, a, b, autojunk=False)
+    # The quick ratios are upper bounds, so most hopeless pairs skip the full comparison.
+    if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+        return 0.0
+    return matcher.ratio()
+
+
+def author_similarity(a, b, threshold=0.0):
+    """Weighted similarity of two author records between 0 and 1; 0 as soon as ``threshold`` is out of reach."""
+    first_weight, last_weight, born_weight = AUTHOR_WEIGHTS
+    born = 1.0 if a[3] == b[3] else 0.5 if a[4] == b[4] else 0.0
+    first_a, first_b = a[1], b[1]
+    if not first_a or not first_b:
+        first = 0.5
+    elif len(first_a) == 1 or len(first_b) == 1:
+        # An initial matches any first name starting with it.
+        first = 1.0 if first_a[0] == first_b[0] else 0.0
+    else:
+        first = _ratio(first_a, first_b, (threshold - born_weight * born - last_weight) / first_weight)
+    floor = (threshold - born_weight * born - first_weight * first) / last_weight
+    if floor > 1:
+        return 0.0
+    return first_weight * first + last_weight * _ratio(a[2], b[2], floor) + born_weight * born
+
+
+def trigrams(title):
+    padded = f'  {title} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def book_similarity(a, b, grams_a=None, grams_b=None):
+    """Jaccard similarity of the titles' character trigrams, lowered when the publishing years differ."""
+    grams_a = trigrams(a[1]) if grams_a is None else grams_a
+    grams_b = trigrams(b[1]) if grams_b is None else grams_b
+    score = len(grams_a & grams_b) / len(grams_a | grams_b)
+    return score if a[3] == b[3] else score * YEAR_PENALTY
+
+
+def _block_pairs(block, sort_key):
+    if len(block) <= MAX_BLOCK_SIZE:
+        return itertools.combinations(block, 2)
+    ordered = sorted(block, key=sort_key)
+    return ((ordered[i], ordered[j]) for i in range(len(ordered)) for j in range(i + 1, min(i + WINDOW, len(ordered))))
+
+
+def _author_batch(state, blocks):
+    records, threshold = state['records'], state['threshold']
+    matches = []
+    for block in blocks:
+        for i, j in _block_pairs(block, lambda index: records[index][1:3]):
+            score = author_similarity(records[i], records[j], threshold)
+            if score >= threshold:
+                matches.append((i, j, score))
+    return matches
+
+
+def _book_batch(state, blocks):
+    records, threshold = state['records'], state['threshold']
+    grams = {}
+    matches = []
+    for block in blocks:
+        for index in block:
+            if index not in grams:
+                grams[index] = trigrams(records[index][1])
+        for i, j in _block_pairs(block, lambda index: records[index][1]):
+            score = book_similarity(records[i], records[j], grams[i], grams[j])
+            if score >= threshold:
+                matches.append((i, j, score))
+    return matches
+
+
+_worker_state = {}
+
+
+def _init_worker(state):
+    _worker_state.update(state)
+
+
+def _call_in_worker(function, blocks):
+    return function(_worker_state, blocks)
+
+
+def _batches(blocks):
+    """Group blocks so every batch holds about BATCH_PAIRS comparisons."""
+    batch, pairs = [], 0
+    for block in blocks:
+        batch.append(block)
+        pairs += min(len(block) * (len(block) - 1) // 2, len(block) * WINDOW)
+        if pairs >= BATCH_PAIRS:
+            yield batch
+            batch, pairs = [], 0
+    if batch:
+        yield batch
+
+
+def score_blocks(function, state, blocks, workers=1):
+    """Run a batch scoring function over ``blocks`` of record indices and chain the matching pairs.
+
+    With several workers the batches run in a process pool; ``state`` is sent to each worker once.
+    """
+    batches = list(_batches(blocks))
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(state,)) as pool:
+            return list(itertools.chain.from_iterable(pool.map(partial(_call_in_worker, function), batches)))
+    return [match for batch in batches for match in function(state, batch)]
+
+
+def blocks_of(records, keys):
+    """Lists of the indices of records sharing a blocking key, for keys shared by at least two records."""
+    index = defaultdict(list)
+    for position, record in enumerate(records):
+        for key in keys(record):
+            index[key].append(position)
+    return [block for block in index.values() if len(block) > 1]
+
+
+def cluster(records, matches):
+    """Group matching records transitively and return (canonical pk, duplicate pk, score) per duplicate.
+
+    The oldest record, the lowest pk, of each group is kept. Only records that matched it directly are
+    reported, so an ambiguous record such as an initial cannot chain two different people together.
+    """
+    parent = list(range(len(records)))
+
+    def find(position):
+        while parent[position] != position:
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    for i, j, _ in matches:
+        parent[find(i)] = find(j)
+    kept = {}
+    for i, j, _ in matches:
+        root = find(i)
+        kept[root] = min(kept.get(root, i), i, j, key=lambda position: records[position][0])
+    best = {}
+    for i, j, score in matches:
+        keep = kept[find(i)]
+        if keep in (i, j):
+            duplicate = j if keep == i else i
+            best[duplicate] = max(best.get(duplicate, 0.0), score)
+    return sorted((records[kept[find(position)]][0], records[position][0], score) for position, score in best.items())
+
+
+def find_author_duplicates(records, threshold=AUTHOR_THRESHOLD, workers=1):
+    """Duplicate authors among ``author_records``, blocked on last name and birth year or birth date."""
+    matches = score_blocks(_author_batch, {'records': records, 'threshold': threshold},
+                           blocks_of(records, author_keys), workers)
+    return cluster(records, matches)
+
+
+def find_book_duplicates(records, threshold=BOOK_THRESHOLD, workers=1):
+    """Duplicate books among ``book_records``, blocked on author and the longest title words."""
+    matches = score_blocks(_book_batch, {'records': records, 'threshold': threshold},
+                           blocks_of(records, book_keys), workers)
+    return cluster(records, matches)
+
+
+def save_candidates(kind, candidates, using='default'):
+    """Store found pairs for review; pairs already recorded keep their status, so rejections stick."""
+    DuplicateCandidate.objects.using(using).bulk_create(
+        [DuplicateCandidate(kind=kind, canonical_id=canonical, duplicate_id=duplicate, score=round(score, 4))
+         for canonical, duplicate, score in candidates],
+        batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True)
+    return len(candidates)
+
+
+def author_merge_map(using='default'):
+    """``{duplicate: canonical}`` of the author pairs not rejected, so books are compared under one author."""
+    return dict(DuplicateCandidate.objects.using(using).filter(kind='author', status__in=['pending', 'confirmed'])
+                .order_by('score').values_list('duplicate_id', 'canonical_id'))
+
+
+def find_duplicates(kinds=KINDS, author_threshold=AUTHOR_THRESHOLD, book_threshold=BOOK_THRESHOLD, workers=1,
+                    using='default'):
+    """Score live authors and books for duplicates and store the pairs as pending candidates.
+
+    Returns the number of pairs found per kind.
+    """
+    found = {}
+    if 'author' in kinds:
+        records = author_records(Author.objects.using(using))
+        found['author'] = save_candidates('author', find_author_duplicates(records, author_threshold, workers),
+                                          using)
+    if 'book' in kinds:
+        records = book_records(Book.objects.using(using), author_merge_map(using))
+        found['book'] = save_candidates('book', find_book_duplicates(records, book_threshold, workers), using)
+    return found
+
+
+def confirm_candidates(min_score, kinds=KINDS, using='default'):
+    return DuplicateCandidate.objects.using(using).filter(kind__in=kinds, status='pending', score__gte=min_score) \
+        .update(status='confirmed')
+
+
+def set_candidates_status(candidates, status):
+    return candidates.exclude(status__in=[status, 'merged']).update(status=status)
+
+
+def _resolve(pairs):
+    """Follow chains of merges to the record finally kept, dropping cycles."""
+    def root(pk):
+        seen = set()
+        while pk in pairs and pk not in seen:
+            seen.add(pk)
+            pk = pairs[pk]
+        return pk
+
+    resolved = {duplicate: root(duplicate) for duplicate in pairs}
+    return {duplicate: canonical for duplicate, canonical in resolved.items() if duplicate != canonical}
+
+
+def _repoint(queryset, field, mapping):
+    """Rewrite ``field`` from each key of ``mapping`` to its value with one UPDATE."""
+    if not mapping:
+        return 0
+    return queryset.filter(**{f'{field}__in': list(mapping)}).update(**{field: Case(
+        *[When(**{field: old}, then=Value(new)) for old, new in mapping.items()], default=F(field),
+        output_field=queryset.model._meta.get_field(field))})
+
+
+def _existing(manager, mapping):
+    present = set(manager.filter(pk__in=[*mapping, *mapping.values()]).values_list('pk', flat=True))
+    return {duplicate: canonical for duplicate, canonical in mapping.items()
+            if duplicate in present and canonical in present}
+
+
+def _merge_book_chunk(mapping, using):
+    mapping = _existing(Book.objects.using(using), mapping)
+    if not mapping:
+        return []
+    duplicates, canonicals = list(mapping), set(mapping.values())
+    _repoint(Review.objects.using(using), 'book_id', mapping)
+
+    borrows = Borrow.objects.using(using)
+    loans = list(borrows.filter(book_id__in=duplicates).order_by('pk')
+                 .values_list('pk', 'member_id', 'book_id', 'borrow_date'))
+    taken = set(borrows.filter(book_id__in=canonicals, member_id__in=Subquery(
+        borrows.filter(book_id__in=duplicates).values('member_id'))).values_list('member_id', 'book_id', 'borrow_date'))
+    clashes = []
+    for pk, member_id, book_id, borrow_date in loans:
+        key = (member_id, mapping[book_id], borrow_date)
+        if key in taken:
+            # The same loan recorded under both books; deleting it through the ORM keeps the statistics right.
+            clashes.append(pk)
+        taken.add(key)
+    borrows.filter(pk__in=clashes).delete()
+    _repoint(borrows, 'book_id', mapping)
+    clashes = set(clashes)
+    log_borrow_changes([pk for pk, _, _, _ in loans if pk not in clashes], using)
+    record(Borrow, {pk: {'book_id': [book_id, mapping[book_id]]} for pk, _, book_id, _ in loans if pk not in clashes},
+           using=using)
+
+    holdings = Holding.objects.using(using)
+    target = {(book_id, library_id): pk for pk, book_id, library_id
+              in holdings.filter(book_id__in=canonicals).values_list('pk', 'book_id', 'library_id')}
+    extra = Counter()
+    dropped = []
+    for pk, book_id, library_id, copies in holdings.filter(book_id__in=duplicates).order_by('pk') \
+            .values_list('pk', 'book_id', 'library_id', 'copies'):
+        key = (mapping[book_id], library_id)
+        if key in target:
+            extra[target[key]] += copies
+            dropped.append(pk)
+        else:
+            target[key] = pk
+    holdings.filter(pk__in=dropped).delete()
+    _repoint(holdings, 'book_id', mapping)
+    if extra:
+        holdings.filter(pk__in=list(extra)).update(copies=F('copies') + Case(
+            *[When(pk=pk, then=Value(copies)) for pk, copies in extra.items()], default=Value(0)))
+    refresh_availability(holdings.filter(book_id__in=canonicals))
+    invalidate_holdings(book_library_ids(canonicals, using), using)
+
+    through = Event.books.through
+    links = through.objects.using(using).filter(book_id__in=duplicates).values_list('event_id', 'book_id')
+    through.objects.using(using).bulk_create(
+        [through(event_id=event_id, book_id=mapping[book_id]) for event_id, book_id in links],
+        batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True)
+
+    books = Book.objects.using(using)
+    recompute_book_ratings(books.filter(pk__in=canonicals))
+    mark_stale(canonicals, using=using)
+    members = sorted({member_id for _, member_id, _, _ in loans})
+    for start in range(0, len(members), WRITE_BATCH_SIZE):
+        mark_stale(member_ids=members[start:start + WRITE_BATCH_SIZE], using=using)
+    invalidate_objects(Book, canonicals, using)
+    books.filter(pk__in=duplicates).delete()
+    return duplicates
+
+
+def _merge_author_chunk(mapping, using):
+    mapping = _existing(Author.all_objects.using(using), mapping)
+    if not mapping:
+        return []
+    duplicates, canonicals = list(mapping), set(mapping.values())
+    books = Book.objects.using(using)
+    # Books of one title by authors merged together would break unique_together once repointed, so they are
+    # merged first, into the kept author's book or else the oldest.
+    by_title = defaultdict(list)
+    for pk, title, author_id in books.filter(author_id__in=[*duplicates, *canonicals]).order_by('pk') \
+            .values_list('pk', 'title', 'author_id'):
+        by_title[(title, mapping.get(author_id, author_id))].append((author_id in mapping, pk))
+    same_title = {}
+    for group in by_title.values():
+        keeper = min(group)[1]
+        same_title.update({pk: keeper for _, pk in group if pk != keeper})
+    folded = _merge_book_chunk(same_title, using)
+    DuplicateCandidate.objects.using(using).filter(kind='book', duplicate_id__in=folded) \
+        .exclude(status='rejected').update(status='merged')
+    moved_books = dict(books.filter(author_id__in=duplicates).values_list('pk', 'author_id'))
+    book_ids = list(moved_books)
+    _repoint(books, 'author_id', mapping)
+    record(Book, {pk: {'author_id': [author_id, mapping[author_id]]} for pk, author_id in moved_books.items()},
+           using=using)
+
+    details = AuthorDetail.objects.using(using)
+    described = set(details.filter(author_id__in=canonicals).values_list('author_id', flat=True))
+    moved, dropped = {}, []
+    for pk, author_id in details.filter(author_id__in=duplicates).order_by('pk').values_list('pk', 'author_id'):
+        if mapping[author_id] in described:
+            dropped.append(pk)
+        else:
+            described.add(mapping[author_id])
+            moved[author_id] = mapping[author_id]
+    details.filter(pk__in=dropped).delete()
+    _repoint(details, 'author_id', moved)
+
+    # Book.author was changed with UPDATE, so refresh the author names in the book search index by hand.
+    get_search_backend().index(INDEXES[Book], book_ids, using)
+    invalidate_objects(Book, book_ids, using)
+    invalidate_author_books([*duplicates, *canonicals], using)
+    Author.all_objects.using(using).filter(pk__in=duplicates).delete()
+    return duplicates
+
+
+MERGES = {
+    'author': _merge_author_chunk,
+    'book': _merge_book_chunk,
+}
+
+
+def merge_candidates(candidates, chunk_size=MERGE_CHUNK_SIZE, using=None):
+    """Merge the pending or confirmed ``candidates``, authors before books, one chunk per transaction.
+
+    Books, the detail record, reviews, borrows, holdings and event links of each duplicate move to the record
+    kept and the duplicate is deleted; a book whose title the kept author already has is merged into that
+    book. Loans recorded under both books are kept once, copies held by one library are added up and the
+    stored ratings, availability and recommendations are refreshed. Returns the number of records merged
+    away.
+    """
+    using = using or candidates.db
+    merged = 0
+    for kind in KINDS:
+        selected = candidates.filter(kind=kind, status__in=['pending', 'confirmed'])
+        # Ascending score, so a record paired twice is merged into its best match.
+        pairs = _resolve(dict(selected.order_by('score').values_list('duplicate_id', 'canonical_id')))
+        duplicates = sorted(pairs)
+        for start in range(0, len(duplicates), chunk_size):
+            chunk = {duplicate: pairs[duplicate] for duplicate in duplicates[start:start + chunk_size]}
+            with transaction.atomic(using=using):
+                done = MERGES[kind](chunk, using)
+                DuplicateCandidate.objects.using(using).filter(kind=kind, duplicate_id__in=done) \
+                    .exclude(status='rejected').update(status='merged')
+            merged += len(done)
+    return merged
+
+
+def merge_confirmed(chunk_size=MERGE_CHUNK_SIZE, using='default'):
+    return merge_candidates(DuplicateCandidate.objects.using(using).filter(status='confirmed'), chunk_size, using)
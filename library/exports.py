@@ -0,0 +1,128 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Borrow, Post, Review
+from .partitions import PARTITIONS, PartitionError, history
+
+
+class ExportSpec:
+    def __init__(self, model, fields, date_field=None, library_field=None):
+        self.model = model
+        self.fields = fields
+        self.date_field = date_field
+        self.library_field = library_field
+
+    @property
+    def headers(self):
+        return [field.replace('__', '_') for field in self.fields]
+
+
+EXPORTS = {
+    'borrows': ExportSpec(
+        Borrow,
+        ['id', 'borrow_date', 'return_date', 'returned',
+         'member_id', 'member__first_name', 'member__last_name', 'member__email',
+         'book_id', 'book__title', 'book__genre', 'library_id', 'library__name'],
+        date_field='borrow_date',
+        library_field='library',
+    ),
+    'reviews': ExportSpec(
+        Review,
+        ['id', 'created_at', 'rating', 'description',
+         'reviewer_id', 'reviewer__first_name', 'reviewer__last_name', 'reviewer__email',
+         'book_id', 'book__title', 'book__genre'],
+        date_field='created_at',
+        library_field='book__libraries',
+    ),
+    'posts': ExportSpec(
+        Post,
+        ['id', 'created_at', 'updated_at', 'title', 'body', 'moderated',
+         'author_id', 'author__first_name', 'author__last_name', 'author__email',
+         'library_id', 'library__name'],
+        date_field='created_at',
+        library_field='library',
+    ),
+}
+
+
+class ExportError(Exception):
+    pass
+
+
+def get_export(name):
+    try:
+        return EXPORTS[name]
+    except KeyError:
+        raise ExportError(f"Unknown export {name!r}, choose from {', '.join(EXPORTS)}") from None
+
+
+def build_queryset(spec, since=None, until=None, library=None, queryset=None):
+    queryset = (spec.model._default_manager.all() if queryset is None else queryset).order_by('pk')
+    if since or until:
+        if spec.date_field is None:
+            raise ExportError(f"{spec.model._meta.verbose_name_plural} cannot be filtered by date")
+        if since:
+            queryset = queryset.filter(**{f'{spec.date_field}__gte': since})
+        if until:
+            queryset = queryset.filter(**{f'{spec.date_field}__lte': until})
+    if library is not None:
+        queryset = queryset.filter(**{spec.library_field: library})
+    return queryset.values_list(*spec.fields)
+
+
+def iter_rows(queryset, chunk_size=5000):
+    """Yield value tuples in primary key order, one keyset-paginated chunk at a time.
+
+    The first selected column must be the primary key.
+    """
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        rows = list(chunk[:chunk_size])
+        if not rows:
+            return
+        yield from rows
+        last_pk = rows[-1][0]
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(spec, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(spec.headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_jsonl(spec, rows):
+    headers = spec.headers
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'jsonl': (iter_jsonl, 'application/x-ndjson'),
+}
+
+
+def export_lines(name, fmt='csv', chunk_size=5000, archived=False, **filters):
+    """Export lines for ``name``; ``archived`` also reads the rows moved into its history archive tables."""
+    spec = get_export(name)
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt!r}, choose from {', '.join(FORMATS)}")
+    queryset = None
+    if archived:
+        if name not in PARTITIONS:
+            raise ExportError(f"{spec.model._meta.verbose_name_plural} have no archive")
+        try:
+            queryset = history(name, filters.get('since'), filters.get('until'))
+        except PartitionError as exc:
+            raise ExportError(str(exc)) from exc
+    queryset = build_queryset(spec, queryset=queryset, **filters)
+    return FORMATS[fmt][0](spec, iter_rows(queryset, chunk_size))
@@ -0,0 +1,68 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .caching import feed_key, get_cache, invalidate_feeds
+from .models import Post
+from .paginators import KeysetPaginator
+
+FEED_FIELDS = ('id', 'title', 'body', 'author_id', 'created_at', 'updated_at')
+QUEUE_FIELDS = ('id', 'title', 'body', 'author_id', 'created_at')
+
+
+def feed_queryset(library_id, using='default'):
+    """A library's moderated posts, newest first, read on the (library, moderated, created_at) index."""
+    return Post.objects.using(using).filter(library_id=library_id, moderated=True).order_by('-created_at', '-pk')
+
+
+def moderation_queue(library_id, using='default'):
+    """Posts of a library waiting for moderation, oldest first."""
+    return Post.objects.using(using).filter(library_id=library_id, moderated=False).order_by('created_at', 'pk')
+
+
+def feed_state(library_id, using='default'):
+    """Last change and post count of a library's feed, cached until a post in the feed is saved or deleted."""
+    return get_cache().get(
+        feed_key(library_id),
+        lambda: feed_queryset(library_id, using).order_by().aggregate(last_modified=Max('updated_at'),
+                                                                       count=Count('pk')),
+        'feeds',
+    )
+
+
+def feed_etag(library_id, state, limit, cursor=None):
+    """Validator of one feed page, derived from the feed's state so every process computes the same value."""
+    last_modified = state['last_modified'].isoformat() if state['last_modified'] else ''
+    version = f"{library_id}:{last_modified}:{state['count']}:{limit}:{cursor or ''}"
+    return hashlib.sha1(version.encode()).hexdigest()
+
+
+def feed_page(library_id, limit, cursor=None, using='default'):
+    """JSON body, ETag and last modification time of one feed page.
+
+    Pages are cached already serialized under their ETag, so a change to the feed simply moves readers to
+    new keys and the old pages expire. Raises InvalidCursor for a malformed cursor.
+    """
+    state = feed_state(library_id, using)
+    etag = feed_etag(library_id, state, limit, cursor)
+
+    def compile_page():
+        page = KeysetPaginator(feed_queryset(library_id, using), limit, values=FEED_FIELDS).page_from_cursor(cursor)
+        payload = {'results': page.object_list, 'next': page.next_cursor, 'previous': page.previous_cursor}
+        return json.dumps(payload, cls=DjangoJSONEncoder).encode()
+
+    body = get_cache().get(f'{feed_key(library_id)}:{etag}', compile_page, 'feeds')
+    return body, etag, state['last_modified']
+
+
+def approve_posts(posts):
+    """Moderate the selected posts with one UPDATE and drop the cached feeds of their libraries."""
+    using = posts.db
+    rows = list(posts.filter(moderated=False).values_list('pk', 'library_id'))
+    # update() skips auto_now, and the feed's Last-Modified must move forward.
+    Post.objects.using(using).filter(pk__in=[pk for pk, _ in rows]).update(moderated=True, updated_at=timezone.now())
+    invalidate_feeds({library_id for _, library_id in rows}, using)
+    return len(rows)
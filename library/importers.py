@@ -0,0 +1,265 @@
+import csv
+import datetime
+import json
+import os
+import time
+from collections import Counter, OrderedDict
+from itertools import islice
+
+from django.db import transaction
+
+from .audit import record
+from .caching import invalidate_author_books, invalidate_holdings, invalidate_objects
+from .dashboard import bump_library
+from .inventory import refresh_availability
+from .models import Author, Book, Category, Library
+from .search import index_objects
+
+BOOK_UPDATE_FIELDS = ['publishing_date', 'summary', 'genre', 'page_count', 'category']
+
+
+class CatalogueImportError(Exception):
+    pass
+
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+
+    def get(self, key):
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return None
+        return self._data[key]
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def read_records(path, fmt=None):
+    """Yield one dict per input record from a CSV or JSON-lines file without loading it whole."""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.json', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as handle:
+        if fmt == 'csv':
+            yield from csv.DictReader(handle)
+        else:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_date(value):
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value.strip())
+
+
+def split_names(value):
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [name.strip() for name in value if name.strip()]
+    return [name.strip() for name in value.split(';') if name.strip()]
+
+
+class Checkpoint:
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, source):
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding='utf-8') as handle:
+            state = json.load(handle)
+        if state.get('source') != os.path.abspath(source):
+            raise CatalogueImportError(f"Checkpoint {self.path} belongs to {state.get('source')}")
+        return state['rows_done']
+
+    def save(self, source, rows_done):
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump({'source': os.path.abspath(source), 'rows_done': rows_done}, handle)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CatalogueImporter:
+    """Upserts authors, categories, books and library holdings in fixed-size batches.
+
+    Each batch runs in its own transaction and advances the checkpoint, so an
+    interrupted run resumes after the last committed batch.
+    """
+
+    def __init__(self, batch_size=2000, author_cache_size=100000, checkpoint=None, progress=None):
+        self.batch_size = batch_size
+        self.authors = LRUCache(author_cache_size)
+        self.categories = dict(Category.objects.values_list('name', 'pk'))
+        self.libraries = dict(Library.objects.values_list('name', 'pk'))
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.progress = progress
+        self.unknown_libraries = set()
+
+    def run(self, path, fmt=None, resume=False):
+        skip = self.checkpoint.load(path) if resume else 0
+        records = islice(read_records(path, fmt), skip, None)
+        rows_done = skip
+        imported = 0
+        started = time.monotonic()
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                self.import_batch(batch)
+            rows_done += len(batch)
+            imported += len(batch)
+            self.checkpoint.save(path, rows_done)
+            if self.progress:
+                self.progress(rows_done, imported / max(time.monotonic() - started, 1e-9))
+        self.checkpoint.clear()
+        return imported, time.monotonic() - started
+
+    def import_batch(self, records):
+        rows = [self.parse_record(record) for record in records]
+        self.resolve_categories({row['category'] for row in rows if row['category']})
+        # A local map: the LRU may already have evicted authors of this batch when it holds more than its size.
+        authors = self.resolve_authors({row['author'] for row in rows})
+
+        books = {}
+        holdings = {}
+        for row in rows:
+            key = (row['title'], authors[row['author']])
+            books[key] = Book(
+                title=row['title'],
+                author_id=key[1],
+                publishing_date=row['publishing_date'],
+                summary=row['summary'],
+                genre=row['genre'],
+                page_count=row['page_count'],
+                category_id=self.categories.get(row['category']),
+            )
+            holdings.setdefault(key, set()).update(row['libraries'])
+
+        update_names = [Book._meta.get_field(name).attname for name in BOOK_UPDATE_FIELDS]
+        existing = {(title, author_id): (pk, values) for pk, title, author_id, *values in Book.objects.filter(
+            title__in={title for title, _ in books}, author_id__in={author_id for _, author_id in books},
+        ).values_list('pk', 'title', 'author_id', *update_names)}
+
+        created = Book.objects.bulk_create(
+            list(books.values()),
+            update_conflicts=True,
+            unique_fields=['title', 'author'],
+            update_fields=BOOK_UPDATE_FIELDS,
+        )
+        if any(book.pk is None for book in created):
+            lookup = {(title, author_id): pk for pk, title, author_id in Book.objects.filter(
+                title__in={book.title for book in created}).values_list('pk', 'title', 'author_id')}
+            for book in created:
+                book.pk = lookup[(book.title, book.author_id)]
+
+        # bulk_create sends no post_save, so the search index and the caches are brought up to date here.
+        index_objects(Book, [book.pk for book in created])
+        invalidate_objects(Book, [book.pk for book in created])
+        invalidate_author_books({book.author_id for book in created})
+        # Nor does it reach the audit log, so the created and changed books are recorded here.
+        inserted, updated = {}, {}
+        for book in created:
+            key = (book.title, book.author_id)
+            if key not in existing:
+                inserted[book.pk] = {name: [None, getattr(book, name)] for name in Book.audited_fields()}
+                continue
+            _, old_values = existing[key]
+            changes = {name: [old, getattr(book, name)] for name, old in zip(update_names, old_values)
+                       if old != getattr(book, name)}
+            if changes:
+                updated[book.pk] = changes
+        record(Book, inserted, 'create')
+        record(Book, updated, 'update')
+
+        through = Book.libraries.through
+        links = []
+        for book in created:
+            for name in holdings[(book.title, book.author_id)]:
+                library_id = self.libraries.get(name)
+                if library_id is None:
+                    self.unknown_libraries.add(name)
+                    continue
+                links.append(through(book_id=book.pk, library_id=library_id))
+        linked = set(through.objects.filter(book_id__in=[book.pk for book in created])
+                     .values_list('book_id', 'library_id'))
+        links = [link for link in links if (link.book_id, link.library_id) not in linked]
+        through.objects.bulk_create(links, ignore_conflicts=True)
+        # The holdings get no post_save either: count them on the dashboard and against open loans here.
+        for library_id, count in Counter(link.library_id for link in links).items():
+            bump_library(library_id, books_held=count)
+        if links:
+            refresh_availability(through.objects.filter(book_id__in={link.book_id for link in links},
+                                                        library_id__in={link.library_id for link in links}))
+        invalidate_holdings({link.library_id for link in links})
+
+    def parse_record(self, record):
+        try:
+            page_count = record.get('page_count')
+            return {
+                'title': record['title'].strip(),
+                'author': (record['author_first_name'].strip(), record['author_last_name'].strip(),
+                           parse_date(record['author_birth_date'])),
+                'publishing_date': parse_date(record['publishing_date']),
+                'summary': record.get('summary') or None,
+                'genre': record.get('genre') or None,
+                'page_count': int(page_count) if page_count not in (None, '') else None,
+                'category': (record.get('category') or '').strip() or None,
+                'libraries': split_names(record.get('libraries')),
+            }
+        except (KeyError, ValueError) as exc:
+            raise CatalogueImportError(f"Invalid record {record!r}: {exc}") from exc
+
+    def resolve_categories(self, names):
+        missing = [name for name in names if name not in self.categories]
+        if not missing:
+            return
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        self.categories.update(Category.objects.filter(name__in=missing).values_list('name', 'pk'))
+
+    def resolve_authors(self, keys):
+        """Author id for each (first name, last name, birth date) key, creating the authors not found."""
+        resolved = {}
+        for key in keys:
+            pk = self.authors.get(key)
+            if pk is not None:
+                resolved[key] = pk
+        missing = set(keys) - resolved.keys()
+        if not missing:
+            return resolved
+        existing = Author.all_objects.filter(
+            last_name__in={last_name for _, last_name, _ in missing},
+            first_name__in={first_name for first_name, _, _ in missing},
+        ).values_list('pk', 'first_name', 'last_name', 'birth_date')
+        for pk, first_name, last_name, birth_date in existing:
+            key = (first_name, last_name, birth_date)
+            if key in missing:
+                resolved[key] = pk
+                missing.discard(key)
+        new_authors = Author.objects.bulk_create([
+            Author(first_name=first_name, last_name=last_name, birth_date=birth_date)
+            for first_name, last_name, birth_date in missing
+        ])
+        for author in new_authors:
+            resolved[(author.first_name, author.last_name, author.birth_date)] = author.pk
+        index_objects(Author, [author.pk for author in new_authors])
+        for key, pk in resolved.items():
+            self.authors.set(key, pk)
+        return resolved
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Borrow, Holding
+
+
+def bump_available(library_id, book_id, delta, using='default'):
+    if delta and library_id is not None and book_id is not None:
+        Holding.objects.using(using).filter(library_id=library_id, book_id=book_id) \
+            .update(available=F('available') + delta)
+
+
+def availability(book_ids, library_ids=None, using='default'):
+    """``{book_id: {library_id: available}}`` for the books' holdings, read in one query on the
+    (book, library) unique index."""
+    book_ids = list(book_ids)
+    holdings = Holding.objects.using(using).filter(book_id__in=book_ids)
+    if library_ids is not None:
+        holdings = holdings.filter(library_id__in=library_ids)
+    result = {book_id: {} for book_id in book_ids}
+    for book_id, library_id, available in holdings.values_list('book_id', 'library_id', 'available'):
+        result[book_id][library_id] = available
+    return result
+
+
+def is_available(book_id, library_id, using='default'):
+    return Holding.objects.using(using).filter(book_id=book_id, library_id=library_id, available__gt=0).exists()
+
+
+def refresh_availability(holdings):
+    """Recompute available as copies minus open borrows for ``holdings`` with one UPDATE."""
+    open_loans = (Borrow.objects.open().filter(book_id=OuterRef('book_id'), library_id=OuterRef('library_id'))
+                  .order_by().values('book_id', 'library_id').annotate(count=Count('pk')).values('count'))
+    return holdings.order_by().update(available=F('copies') - Coalesce(Subquery(open_loans), Value(0)))
+
+
+def reconcile_availability(chunk_size=10000, progress=None, using='default'):
+    """Rebuild every holding's available counter from the borrow history, one short transaction per chunk."""
+    last_id = Holding.objects.using(using).aggregate(last_id=Max('pk'))['last_id'] or 0
+    updated = 0
+    for start in range(0, last_id, chunk_size):
+        with transaction.atomic(using=using):
+            updated += refresh_availability(Holding.objects.using(using)
+                                            .filter(pk__gt=start, pk__lte=start + chunk_size))
+        if progress:
+            progress(min(start + chunk_size, last_id), last_id)
+    return updated
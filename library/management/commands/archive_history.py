@@ -0,0 +1,29 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library.partitions import PARTITIONS, PartitionError, archive, get_config
+
+
+class Command(BaseCommand):
+    help = ("Move closed borrows, moderated posts and registrations for past events older than the horizon "
+            "into per-year archive tables.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', help=f"Tables to archive ({', '.join(PARTITIONS)}), all by default.")
+        parser.add_argument('--days', type=int, help="Horizon in days, LIBRARY_PARTITIONS['HORIZON_DAYS'] by default.")
+        parser.add_argument('--chunk-size', type=int, help="Rows moved per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would be archived.")
+        parser.add_argument('--database', default='default', help="Database alias to archive in.")
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else get_config()['HORIZON_DAYS']
+        before = timezone.localdate() - datetime.timedelta(days=days)
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        for name in options['tables'] or PARTITIONS:
+            try:
+                moved = archive(name, before, options['chunk_size'], options['dry_run'], options['database'])
+            except PartitionError as exc:
+                raise CommandError(str(exc)) from exc
+            self.stdout.write(self.style.SUCCESS(f"{verb} {moved} {name} dated before {before}."))
@@ -0,0 +1,24 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library.archive import archive_authors, archive_members
+
+
+class Command(BaseCommand):
+    help = "Move authors deleted and members inactive for longer than --days into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365, help="Minimum age of the deletion or deactivation.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Rows archived per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the rows that would be archived.")
+        parser.add_argument('--database', default='default', help="Database alias to archive in.")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - datetime.timedelta(days=options['days'])
+        arguments = (before, options['chunk_size'], options['dry_run'], options['database'])
+        authors = archive_authors(*arguments)
+        members = archive_members(*arguments)
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {authors} authors and {members} members."))
@@ -0,0 +1,85 @@
+import json
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count, Q
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from library.analytics import AGE_BINS, BorrowColumns, GENRES, LATENESS_BUCKETS, circulation_report
+from library.models import Borrow, Category, Library
+
+
+def orm_report(today):
+    """The per-slice alternative: one aggregate query for every month and library, genre or category, every
+    library and lateness bucket, and every age cohort."""
+    borrows = Borrow.objects.order_by()
+    months = list(borrows.dates('borrow_date', 'month'))
+    libraries = list(Library.objects.values_list('pk', flat=True))
+    categories = list(Category.objects.values_list('pk', flat=True)) + [None]
+    report = {'loans_by_month_library': [], 'loans_by_month_genre': [], 'loans_by_month_category': []}
+    for month in months:
+        in_month = borrows.filter(borrow_date__year=month.year, borrow_date__month=month.month)
+        for library_id in libraries:
+            report['loans_by_month_library'].append(in_month.filter(library_id=library_id).count())
+        for genre in GENRES + [None]:
+            report['loans_by_month_genre'].append(in_month.filter(book__genre=genre).count())
+        for category_id in categories:
+            report['loans_by_month_category'].append(in_month.filter(book__category_id=category_id).count())
+    bounds = [today - timezone.timedelta(days=days) for days in LATENESS_BUCKETS] + [None]
+    report['overdue_lateness'] = [
+        borrows.open().filter(library_id=library_id, return_date__lte=newest, **(
+            {'return_date__gt': oldest} if oldest else {})).count()
+        for library_id in libraries for newest, oldest in zip(bounds, bounds[1:])
+    ]
+    ages = AGE_BINS + [None]
+    report['age_cohorts'] = [
+        borrows.filter(member__age__gte=low, **({'member__age__lt': high} if high else {}))
+        .aggregate(loans=Count('pk'), returned=Count('pk', filter=Q(returned=True)))
+        for low, high in zip(ages, ages[1:])
+    ]
+    return report
+
+
+class Command(BaseCommand):
+    help = ("Time the circulation report computed from NumPy borrow columns (read from the database, and from a "
+            "memory-mapped cache) against one ORM aggregate query per slice, on the current database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        with tempfile.TemporaryDirectory() as directory:
+            cached = BorrowColumns(directory)
+            cached.load()
+            cases = {
+                'orm_per_slice': lambda: orm_report(today),
+                'numpy_from_database': lambda: circulation_report(BorrowColumns().load(), today=today),
+                'numpy_from_cache': lambda: circulation_report(cached.load(), today=today),
+            }
+            timings = {}
+            for name, case in cases.items():
+                samples = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(options['repeat']):
+                        started = time.perf_counter()
+                        result = case()
+                        samples.append((time.perf_counter() - started) * 1000)
+                timings[name] = {'median_ms': statistics.median(samples),
+                                 'queries': len(queries) // options['repeat']}
+                if name == 'orm_per_slice':
+                    expected = sum(result['loans_by_month_library'])
+                elif sum(row['loans'] for row in result['loans_by_month_library']) != expected:
+                    self.stderr.write(f"{name} disagrees with the ORM loan count.")
+        results = {'borrows': Borrow.objects.count(), 'timings': timings}
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{results['borrows']} borrows")
+        for name, row in timings.items():
+            self.stdout.write(f"{name:20} {row['median_ms']:10.2f} ms   {row['queries']:6} queries")
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = ("In-process load test of the async book list API under ASGI against its synchronous twin "
+            "under WSGI, reporting requests/s and p50/p99 latency.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=20)
+        parser.add_argument('--query', default='limit=50', help="Query string sent with every request.")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        query = options['query']
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            results = {
+                'asgi': asyncio.run(self.run_async(f"{reverse('library:api-books')}?{query}",
+                                                   options['requests'], options['concurrency'])),
+                'wsgi': self.run_sync(f"{reverse('library:api-books-sync')}?{query}",
+                                      options['requests'], options['concurrency']),
+            }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, row in results.items():
+            self.stdout.write(f"{name}: {row['requests_per_second']:8.1f} req/s   "
+                              f"p50 {row['p50_ms']:7.2f} ms   p99 {row['p99_ms']:7.2f} ms")
+
+    async def run_async(self, url, total, concurrency):
+        client = AsyncClient()
+        latencies = []
+        queue = iter(range(total))
+
+        async def worker():
+            for _ in queue:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+                response.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - started)
+
+    def run_sync(self, url, total, concurrency):
+        def request(_):
+            started = time.perf_counter()
+            Client().get(url).close()
+            return time.perf_counter() - started
+
+        def close_connections():
+            connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            latencies = list(pool.map(request, range(total)))
+            list(pool.map(lambda _: close_connections(), range(concurrency)))
+        return summarize(latencies, time.perf_counter() - started)
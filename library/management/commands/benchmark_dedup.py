@@ -0,0 +1,88 @@
+import json
+import random
+import resource
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.dedup import AUTHOR_THRESHOLD, author_keys, blocks_of, find_author_duplicates
+
+
+def misspell(rng, name):
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice(string.ascii_lowercase) + name[position + 1:]
+
+
+class Command(BaseCommand):
+    help = ("Measure duplicate author detection on a synthetic catalogue with a skewed last name distribution "
+            "and injected duplicates (misspelt names, initials). The database is not touched.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=2000000)
+        parser.add_argument('--last-names', type=int, default=100000)
+        parser.add_argument('--duplicate-share', type=float, default=0.02)
+        parser.add_argument('--threshold', type=float, default=AUTHOR_THRESHOLD)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        timings = {}
+
+        def word(length):
+            return ''.join(rng.choices(string.ascii_lowercase, k=length))
+
+        started = time.perf_counter()
+        last_names = [word(rng.randint(4, 10)) for _ in range(options['last_names'])]
+        first_names = [word(rng.randint(3, 8)) for _ in range(5000)]
+        # Zipf-like weights: a few last names are very common, as in real catalogues.
+        weights = [1 / (rank + 1) for rank in range(len(last_names))]
+        originals = options['authors'] - int(options['authors'] * options['duplicate_share'])
+        records = [(pk, first, last, born, 1900 + (born - 693596) // 365)
+                   for pk, first, last, born in zip(range(1, originals + 1), rng.choices(first_names, k=originals),
+                                                    rng.choices(last_names, weights, k=originals),
+                                                    (rng.randint(693596, 730000) for _ in range(originals)))]
+        expected = set()
+        for pk in range(originals + 1, options['authors'] + 1):
+            source = records[rng.randrange(originals)]
+            first, last = source[1], source[2]
+            if rng.random() < 0.5:
+                first = first[0]
+            else:
+                last = misspell(rng, last)
+            records.append((pk, first, last, *source[3:]))
+            expected.add((source[0], pk))
+        timings['generate_s'] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        blocks = blocks_of(records, author_keys)
+        timings['blocking_s'] = time.perf_counter() - started
+        started = time.perf_counter()
+        found = find_author_duplicates(records, options['threshold'], options['workers'])
+        timings['find_s'] = time.perf_counter() - started
+
+        pairs = {(canonical, duplicate) for canonical, duplicate, _ in found}
+        # A duplicate of a duplicate is reported against the original, so compare on the duplicate side only.
+        hits = {duplicate for _, duplicate in pairs} & {duplicate for _, duplicate in expected}
+        results = {
+            'authors': len(records),
+            'injected_duplicates': len(expected),
+            'blocks': len(blocks),
+            'largest_block': max(map(len, blocks), default=0),
+            'found': len(pairs),
+            'recall': len(hits) / len(expected) if expected else 1.0,
+            'precision': len(hits) / len(pairs) if pairs else 1.0,
+            'workers': options['workers'],
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+            'timings': timings,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, value in results.items():
+            if name != 'timings':
+                self.stdout.write(f"  {name:30} {value}")
+        for name, value in timings.items():
+            self.stdout.write(f"  {name:30} {value:10.2f} s")
@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.benchmarks import BENCHMARKS, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Time key library operations (admin changelists, ratings, overdue lookups, search, member "
+            "history, event rosters) against the current data and emit JSON results.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmarks', nargs='*', help=f"Subset to run: {', '.join(BENCHMARKS)}")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--warmup', type=int, default=1)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file.")
+        parser.add_argument('--baseline', help="JSON report of a previous run to compare against.")
+        parser.add_argument('--threshold', type=float, default=1.25,
+                            help="Fail when a median exceeds the baseline by this ratio.")
+
+    def handle(self, *args, **options):
+        unknown = set(options['benchmarks']) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+        report = run_benchmarks(options['benchmarks'], options['repeat'], options['warmup'], options['seed'])
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                handle.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                regressions = compare(report, json.load(handle), options['threshold'])
+            if regressions:
+                details = ', '.join(f"{name} x{ratio:.2f}" for name, ratio in sorted(regressions.items()))
+                raise CommandError(f"Regressions against {options['baseline']}: {details}")
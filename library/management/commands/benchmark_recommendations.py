@@ -0,0 +1,98 @@
+import json
+import resource
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from library.recommendations import (BLOCK_SIZE, TOP_K, interaction_matrix, item_neighbours, member_scores,
+                                     neighbour_matrix)
+
+
+def matrix_bytes(matrix):
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+class Command(BaseCommand):
+    help = ("Measure runtime and memory of the recommendation batch on a synthetic member x book matrix with "
+            "skewed book popularity. The database is not touched. With --sample-blocks only that many blocks "
+            "of randomly sampled books and members are computed and the full pass is extrapolated.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=1000000)
+        parser.add_argument('--books', type=int, default=500000)
+        parser.add_argument('--borrows-per-member', type=int, default=20)
+        parser.add_argument('--reviews-per-member', type=int, default=5)
+        parser.add_argument('--top-k', type=int, default=TOP_K)
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+        parser.add_argument('--sample-blocks', type=int, default=0, help="Blocks to time; 0 computes everything.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        members, books, k = options['members'], options['books'], options['top_k']
+        timings = {}
+
+        def popular_books(count):
+            # Pareto-shaped popularity: a small share of books collects most borrows.
+            return np.minimum(rng.pareto(1.2, count) * books / 50, 2 ** 62).astype(np.int64) % books
+
+        started = time.perf_counter()
+        borrow_rows = np.repeat(np.arange(members), options['borrows_per_member'])
+        borrows = interaction_matrix(borrow_rows, popular_books(len(borrow_rows)), (members, books))
+        review_rows = np.repeat(np.arange(members), options['reviews_per_member'])
+        ratings = interaction_matrix(review_rows, popular_books(len(review_rows)), (members, books),
+                                     rng.integers(1, 6, len(review_rows)).astype(np.float32))
+        timings['build_matrices_s'] = time.perf_counter() - started
+
+        sample = options['sample_blocks'] * options['block_size']
+        # Sampled books and members are drawn at random so popular and long-tail books are both represented.
+        book_columns = np.sort(rng.choice(books, sample, replace=False)) if 0 < sample < books else np.arange(books)
+        member_rows = np.sort(rng.choice(members, sample, replace=False)) if 0 < sample < members \
+            else np.arange(members)
+        arguments = (k, options['workers'], options['block_size'])
+
+        started = time.perf_counter()
+        ids, scores = item_neighbours(borrows, book_columns, *arguments)
+        timings['co_borrowed_s'] = time.perf_counter() - started
+        started = time.perf_counter()
+        item_neighbours(ratings, book_columns, *arguments)
+        timings['similar_ratings_s'] = time.perf_counter() - started
+
+        neighbours = neighbour_matrix(ids, scores, book_columns, books)
+        started = time.perf_counter()
+        member_scores(borrows, neighbours, member_rows, *arguments)
+        timings['member_scores_s'] = time.perf_counter() - started
+
+        if sample:
+            for name, scale in (('co_borrowed_s', books / len(book_columns)),
+                                ('similar_ratings_s', books / len(book_columns)),
+                                ('member_scores_s', members / len(member_rows))):
+                timings[f'{name[:-2]}_extrapolated_s'] = timings[name] * scale
+        results = {
+            'members': members,
+            'books': books,
+            'borrows': int(borrows.nnz),
+            'reviews': int(ratings.nnz),
+            'workers': options['workers'],
+            'sampled_books': len(book_columns),
+            'sampled_members': len(member_rows),
+            'memory_mb': {
+                'borrow_matrix': matrix_bytes(borrows) / 2 ** 20,
+                'rating_matrix': matrix_bytes(ratings) / 2 ** 20,
+                'top_k_table': books * k * (4 + 4) / 2 ** 20,
+                'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+            },
+            'timings': timings,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{members} members x {books} books, {results['borrows']} borrows, "
+                          f"{results['reviews']} reviews")
+        for name, value in results['memory_mb'].items():
+            self.stdout.write(f"  {name:30} {value:10.1f} MB")
+        for name, value in timings.items():
+            self.stdout.write(f"  {name:30} {value:10.2f} s")
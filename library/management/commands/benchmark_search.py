@@ -0,0 +1,94 @@
+import datetime
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library.models import Author, Book
+from library.search import INDEXES, LikeSearchBackend, SQLiteFTS5Backend
+from library.seeding import WORDS
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Compare LIKE '%term%' search with the full-text index on Book. With --books, synthetic "
+            "books are inserted first and everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=0, help="Synthetic books to insert before measuring.")
+        parser.add_argument('--queries', nargs='*', default=['dragon', 'silver tower', 'mid', 'winter wolf song'])
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['books']:
+                    self.seed(options['books'], random.Random(options['seed']))
+                results = self.measure(options['queries'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for row in results['queries']:
+            self.stdout.write(f"{row['query']!r:24} like {row['like_ms']:9.2f} ms   fts {row['fts_ms']:9.2f} ms   "
+                              f"x{row['speedup']:.1f}   {row['fts_hits']} hits")
+        self.stdout.write(f"Index build: {results['index_build_s']:.2f}s over {results['books']} books")
+
+    def seed(self, count, rng):
+        authors = Author.objects.bulk_create([
+            Author(first_name=rng.choice(WORDS).title(), last_name=f"{rng.choice(WORDS).title()}{i}",
+                   birth_date=datetime.date(1950, 1, 1))
+            for i in range(max(count // 20, 1))
+        ])
+        for start in range(0, count, 10000):
+            Book.objects.bulk_create([
+                Book(
+                    title=' '.join(rng.choices(WORDS, k=3)).title(),
+                    summary=' '.join(rng.choices(WORDS, k=40)),
+                    author=authors[i % len(authors)],
+                    genre=rng.choice(Book.GENRE_CHOICES)[0],
+                    publishing_date=datetime.date(2000, 1, 1),
+                )
+                for i in range(start, min(start + 10000, count))
+            ], ignore_conflicts=True)
+
+    def measure(self, queries, repeat):
+        spec = INDEXES[Book]
+        fts = SQLiteFTS5Backend()
+        like = LikeSearchBackend()
+        started = time.perf_counter()
+        fts.rebuild(spec, 'default')
+        build_time = time.perf_counter() - started
+
+        rows = []
+        for query in queries:
+            like_ms, like_hits = self.time_count(like, query, repeat)
+            fts_ms, fts_hits = self.time_count(fts, query, repeat)
+            rows.append({
+                'query': query,
+                'like_ms': like_ms,
+                'fts_ms': fts_ms,
+                'speedup': like_ms / fts_ms if fts_ms else 0.0,
+                'like_hits': like_hits,
+                'fts_hits': fts_hits,
+            })
+        return {'books': Book.objects.count(), 'index_build_s': build_time, 'queries': rows}
+
+    @staticmethod
+    def time_count(backend, query, repeat):
+        timings = []
+        hits = 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            hits = backend.filter_queryset(Book.objects.all(), query).count()
+            timings.append((time.perf_counter() - started) * 1000)
+        return sorted(timings)[len(timings) // 2], hits
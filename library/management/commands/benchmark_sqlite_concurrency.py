@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from LibraryHub.database import SQLITE_PROFILES, sqlite_pragmas
+
+
+def connect(path, profile):
+    config = SQLITE_PROFILES[profile]
+    connection = sqlite3.connect(path, timeout=config['timeout'], isolation_level=None, check_same_thread=False)
+    for name, value in sqlite_pragmas(profile).items():
+        connection.execute(f'PRAGMA {name}={value}')
+    return connection, config['transaction_mode'] or 'DEFERRED'
+
+
+def build_database(path, rows, members):
+    connection = sqlite3.connect(path)
+    connection.executescript('''
+        CREATE TABLE borrow (id INTEGER PRIMARY KEY, member_id INTEGER NOT NULL, book_id INTEGER NOT NULL,
+                             return_date TEXT NOT NULL, returned INTEGER NOT NULL);
+        CREATE INDEX borrow_member ON borrow(member_id);
+        CREATE INDEX borrow_open ON borrow(return_date) WHERE returned = 0;
+    ''')
+    rng = random.Random(0)
+    connection.executemany(
+        'INSERT INTO borrow (member_id, book_id, return_date, returned) VALUES (?, ?, ?, 0)',
+        ((rng.randrange(members), rng.randrange(rows // 10 or 1), f'2024-{rng.randint(1, 12):02d}-15')
+         for _ in range(rows)),
+    )
+    connection.commit()
+    connection.close()
+
+
+class Command(BaseCommand):
+    help = ("Mixed read/write thread benchmark of the SQLite connection profiles in LibraryHub/database.py "
+            "on a scratch database: readers look up member borrows while writers mark batches returned.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', nargs='*', default=list(SQLITE_PROFILES))
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds per profile.")
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--write-batch', type=int, default=500, help="Rows updated per write transaction.")
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        results = {}
+        for profile in options['profiles']:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                build_database(path, options['rows'], max(options['rows'] // 10, 1))
+                results[profile] = self.run_profile(path, profile, options)
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for profile, row in results.items():
+            self.stdout.write(
+                f"{profile:8} reads {row['reads_per_second']:9.1f}/s (p99 {row['read_p99_ms']:8.2f} ms)   "
+                f"writes {row['writes_per_second']:7.1f}/s (p99 {row['write_p99_ms']:8.2f} ms)   "
+                f"lock errors {row['lock_errors']}")
+
+    def run_profile(self, path, profile, options):
+        members = max(options['rows'] // 10, 1)
+        deadline = time.perf_counter() + options['duration']
+        read_latencies, write_latencies, errors = [], [], []
+        lock = threading.Lock()
+
+        def reader(seed):
+            rng = random.Random(seed)
+            connection, _ = connect(path, profile)
+            latencies = []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    connection.execute('SELECT id, book_id, return_date FROM borrow WHERE member_id = ?',
+                                       (rng.randrange(members),)).fetchall()
+                    connection.execute("SELECT count(*) FROM borrow WHERE returned = 0 AND return_date < '2024-06-01'"
+                                       ).fetchone()
+                except sqlite3.OperationalError as exc:
+                    with lock:
+                        errors.append(str(exc))
+                    continue
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                read_latencies.extend(latencies)
+
+        def writer(seed):
+            rng = random.Random(seed)
+            connection, mode = connect(path, profile)
+            latencies = []
+            while time.perf_counter() < deadline:
+                start = rng.randrange(options['rows'])
+                started = time.perf_counter()
+                try:
+                    connection.execute(f'BEGIN {mode}')
+                    connection.execute('UPDATE borrow SET returned = 1 - returned WHERE id BETWEEN ? AND ?',
+                                       (start, start + options['write_batch']))
+                    connection.execute('COMMIT')
+                except sqlite3.OperationalError as exc:
+                    if connection.in_transaction:
+                        connection.execute('ROLLBACK')
+                    with lock:
+                        errors.append(str(exc))
+                    continue
+                latencies.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                write_latencies.extend(latencies)
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(options['readers'])]
+        threads += [threading.Thread(target=writer, args=(1000 + i,)) for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        def p99(latencies):
+            latencies = sorted(latencies)
+            return latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000 if latencies else 0.0
+
+        return {
+            'reads_per_second': len(read_latencies) / options['duration'],
+            'writes_per_second': len(write_latencies) / options['duration'],
+            'read_p99_ms': p99(read_latencies),
+            'write_p99_ms': p99(write_latencies),
+            'lock_errors': len(errors),
+        }
@@ -0,0 +1,109 @@
+import datetime
+import heapq
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from library.models import Author, Book, Borrow, Event, EventParticipant, Library, Member, Post, Review
+from library.seeding import BulkWriter
+from library.timeline import SOURCES, MemberTimeline
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Time the merged member timeline against loading and sorting every activity row, for one synthetic "
+            "member with --events rows spread over borrows, reviews, posts and event registrations. "
+            "Everything is rolled back afterwards.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=100000, help="Activity rows for the synthetic member.")
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--depth', type=int, default=100, help="Page number measured for the deep page.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                member = self.seed(options['events'])
+                results = self.measure(member.pk, options['page_size'], options['depth'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, row in results['timings'].items():
+            self.stdout.write(f"{name:20} {row['median_ms']:9.2f} ms   {row['queries']:4} queries")
+
+    def seed(self, count):
+        library = Library.objects.create(name="Timeline Benchmark", location="Nowhere")
+        author = Author.objects.create(first_name="Timeline", last_name="Benchmark",
+                                       birth_date=datetime.date(1950, 1, 1))
+        book = Book.objects.create(title="Timeline Benchmark", author=author, genre='Fiction',
+                                   publishing_date=datetime.date(2000, 1, 1))
+        member = Member.objects.create(first_name="Timeline", last_name="Benchmark", email="timeline@example.org",
+                                       gender='Other', birth_date=datetime.date(1980, 1, 1), age=45, role='Reader')
+        start = datetime.date(1900, 1, 1)
+        share = count // len(SOURCES)
+
+        def day(i):
+            return start + datetime.timedelta(days=i)
+
+        def moment(i):
+            return timezone.make_aware(datetime.datetime.combine(day(i), datetime.time(18)))
+
+        BulkWriter(Borrow).write({'member_id': member.pk, 'book_id': book.pk, 'library_id': library.pk,
+                                  'borrow_date': day(i), 'return_date': day(i + 14), 'returned': True}
+                                 for i in range(share))
+        BulkWriter(Review).write({'book_id': book.pk, 'reviewer_id': member.pk, 'rating': 4.0,
+                                  'description': "Benchmark", 'created_at': day(i)} for i in range(share))
+        BulkWriter(Post).write({'title': f"Benchmark {i}", 'body': "Benchmark", 'author_id': member.pk,
+                                'library_id': library.pk, 'created_at': day(i), 'updated_at': moment(i)}
+                               for i in range(share))
+        event_start = (Event.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+        registrations = count - 3 * share
+        BulkWriter(Event).write({'id': event_start + i, 'title': f"Benchmark {i}", 'description': "Benchmark",
+                                 'date': moment(i), 'library_id': library.pk} for i in range(registrations))
+        BulkWriter(EventParticipant).write({'event_id': event_start + i, 'member_id': member.pk,
+                                            'registration_date': day(i)} for i in range(registrations))
+        return member
+
+    def measure(self, member_id, page_size, depth, repeat):
+        timeline = MemberTimeline(member_id, page_size)
+        cursor = None
+        for _ in range(depth - 1):
+            cursor = timeline.page(cursor)['next']
+
+        def unbounded():
+            # The previous approach: every row of every relation, merged in Python.
+            streams = [source.model._default_manager.filter(**{f'{source.member_field}_id': member_id})
+                       .values('id', source.date_field, *source.fields) for source in SOURCES.values()]
+            rows = [(row[source.date_field], row['id'], row) for source, stream in zip(SOURCES.values(), streams)
+                    for row in stream]
+            return heapq.nlargest(page_size, rows, key=lambda row: row[:2])
+
+        cases = {
+            'unbounded_merge': unbounded,
+            'timeline_first_page': lambda: timeline.page(),
+            f'timeline_page_{depth}': lambda: timeline.page(cursor),
+        }
+        timings = {}
+        for name, case in cases.items():
+            samples = []
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    case()
+                    samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = {'median_ms': statistics.median(samples), 'queries': len(queries) // repeat}
+        return {'events': sum(source.model._default_manager.filter(**{f'{source.member_field}_id': member_id})
+                              .count() for source in SOURCES.values()), 'page_size': page_size, 'timings': timings}
@@ -0,0 +1,24 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+
+from library.analytics import BorrowColumns, circulation_report, get_config
+
+
+class Command(BaseCommand):
+    help = ("Print circulation statistics as JSON: loans per month by library, genre and category, loan "
+            "durations, lateness of open loans and member age cohorts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=datetime.date.fromisoformat, help="First borrow date included.")
+        parser.add_argument('--until', type=datetime.date.fromisoformat, help="Last borrow date included.")
+        parser.add_argument('--rebuild', action='store_true', help="Discard the cached borrow columns first.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        columns = BorrowColumns(get_config()['CACHE_DIR'], options['database'])
+        if options['rebuild'] and columns.directory:
+            columns.rebuild()
+        report = circulation_report(columns.load(), options['since'], options['until'])
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,37 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.exports import EXPORTS, FORMATS, ExportError, export_lines
+
+
+class Command(BaseCommand):
+    help = "Stream Borrow, Review or Post history to CSV or JSON-lines with constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--output', help="Destination file, stdout by default.")
+        parser.add_argument('--since', type=datetime.date.fromisoformat, help="First date included (YYYY-MM-DD).")
+        parser.add_argument('--until', type=datetime.date.fromisoformat, help="Last date included (YYYY-MM-DD).")
+        parser.add_argument('--library', type=int, help="Only rows belonging to this library id.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows fetched per query.")
+        parser.add_argument('--include-archive', action='store_true',
+                            help="Also export rows moved into the per-year archive tables by archive_history.")
+
+    def handle(self, *args, **options):
+        try:
+            lines = export_lines(
+                options['export'], options['format'],
+                since=options['since'], until=options['until'],
+                library=options['library'], chunk_size=options['chunk_size'],
+                archived=options['include_archive'],
+            )
+            if options['output']:
+                with open(options['output'], 'w', newline='', encoding='utf-8') as handle:
+                    handle.writelines(lines)
+            else:
+                for line in lines:
+                    self.stdout.write(line, ending='')
+        except ExportError as exc:
+            raise CommandError(str(exc)) from exc
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.dedup import (AUTHOR_THRESHOLD, BOOK_THRESHOLD, KINDS, MERGE_CHUNK_SIZE, confirm_candidates,
+                           find_duplicates, merge_confirmed)
+
+
+class Command(BaseCommand):
+    help = ("Find duplicate authors and books by comparing records that share a blocking key and store the "
+            "pairs as pending duplicate candidates for review in the admin.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('kinds', nargs='*', help=f"Records to check ({', '.join(KINDS)}), all by default.")
+        parser.add_argument('--author-threshold', type=float, default=AUTHOR_THRESHOLD,
+                            help="Lowest similarity of two authors reported as duplicates.")
+        parser.add_argument('--book-threshold', type=float, default=BOOK_THRESHOLD,
+                            help="Lowest similarity of two books reported as duplicates.")
+        parser.add_argument('--workers', type=int, default=1, help="Processes scoring candidate pairs.")
+        parser.add_argument('--auto-merge-above', type=float,
+                            help="Confirm and merge pending pairs scoring at least this much right away.")
+        parser.add_argument('--chunk-size', type=int, default=MERGE_CHUNK_SIZE,
+                            help="Duplicates merged per transaction.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        kinds = options['kinds'] or KINDS
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            raise CommandError(f"Unknown kind {', '.join(sorted(unknown))}, choose from {', '.join(KINDS)}.")
+        started = time.monotonic()
+        found = find_duplicates(kinds, options['author_threshold'], options['book_threshold'], options['workers'],
+                                options['database'])
+        for kind, count in found.items():
+            self.stdout.write(f"Found {count} duplicate {kind}s.")
+        if options['auto_merge_above'] is not None:
+            confirmed = confirm_candidates(options['auto_merge_above'], kinds, options['database'])
+            merged = merge_confirmed(options['chunk_size'], options['database'])
+            self.stdout.write(f"Confirmed {confirmed} pairs and merged {merged} records.")
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.monotonic() - started:.1f}s."))
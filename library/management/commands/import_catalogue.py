@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.importers import CatalogueImporter, CatalogueImportError, Checkpoint
+
+
+class Command(BaseCommand):
+    help = ("Import authors, categories, books and library holdings from a CSV or JSON-lines feed. "
+            "Expected columns: title, author_first_name, author_last_name, author_birth_date, "
+            "publishing_date, summary, genre, page_count, category, libraries (';'-separated names).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSON-lines file to import.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Input format, guessed from the extension by default.")
+        parser.add_argument('--batch-size', type=int, default=2000, help="Records written per transaction.")
+        parser.add_argument('--author-cache-size', type=int, default=100000,
+                            help="Maximum number of author ids kept in the lookup cache.")
+        parser.add_argument('--checkpoint', help="Checkpoint file, defaults to <path>.checkpoint.")
+        parser.add_argument('--resume', action='store_true', help="Continue after the last committed batch.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        self.verbosity = options['verbosity']
+        importer = CatalogueImporter(
+            batch_size=options['batch_size'],
+            author_cache_size=options['author_cache_size'],
+            checkpoint=Checkpoint(options['checkpoint'] or f'{path}.checkpoint'),
+            progress=self.report_progress,
+        )
+        try:
+            imported, elapsed = importer.run(path, fmt=options['format'], resume=options['resume'])
+        except (CatalogueImportError, OSError) as exc:
+            raise CommandError(str(exc)) from exc
+        if importer.unknown_libraries:
+            self.stderr.write(f"Skipped unknown libraries: {', '.join(sorted(importer.unknown_libraries))}")
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} records in {elapsed:.1f}s ({rate:.0f} records/s)."))
+
+    def report_progress(self, rows_done, rate):
+        if self.verbosity >= 2:
+            self.stdout.write(f"{rows_done} records processed ({rate:.0f} records/s)")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from library.dedup import MERGE_CHUNK_SIZE, merge_confirmed
+
+
+class Command(BaseCommand):
+    help = ("Merge the confirmed duplicate candidates: references move to the kept author or book and the "
+            "duplicates are deleted.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=MERGE_CHUNK_SIZE,
+                            help="Duplicates merged per transaction.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        merged = merge_confirmed(options['chunk_size'], options['database'])
+        self.stdout.write(self.style.SUCCESS(f"Merged {merged} duplicate records."))
@@ -0,0 +1,25 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from library.search import INDEXES, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help="Model names to rebuild, all indexed models by default.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        models = None
+        if options['models']:
+            try:
+                models = {apps.get_model('library', name) for name in options['models']}
+            except LookupError as exc:
+                raise CommandError(str(exc)) from exc
+            unknown = models - set(INDEXES)
+            if unknown:
+                raise CommandError(f"Not indexed: {', '.join(model.__name__ for model in unknown)}")
+        rebuild_index(models, options['database'])
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
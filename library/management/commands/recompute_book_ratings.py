@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from library.models import Book
+from library.ratings import recompute_book_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored average_rating and review_count of every book from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Number of book ids recomputed per transaction.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = Book.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+        updated = 0
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += recompute_book_ratings(Book.objects.filter(pk__gt=start, pk__lte=start + batch_size))
+        self.stdout.write(self.style.SUCCESS(f"Recomputed ratings for {updated} books."))
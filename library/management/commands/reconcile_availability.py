@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from library.inventory import reconcile_availability
+from library.models import Holding
+
+
+class Command(BaseCommand):
+    help = "Rebuild every holding's available counter from its copies and the open borrows, in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Holdings refreshed per transaction.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+
+        def progress(done, total):
+            if verbosity >= 2:
+                self.stdout.write(f"Reconciled holdings up to id {done} of {total}")
+
+        updated = reconcile_availability(options['chunk_size'], progress, options['database'])
+        unavailable = Holding.objects.using(options['database']).filter(available__lte=0).count()
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {updated} holdings; {unavailable} have no copy available."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from library.dashboard import reconcile_library_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the library dashboard summary tables from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('libraries', nargs='*', type=int, help="Library ids, all libraries by default.")
+        parser.add_argument('--days', type=int, default=90, help="Days of daily statistics to rebuild.")
+
+    def handle(self, *args, **options):
+        refreshed = reconcile_library_stats(options['libraries'] or None, options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Reconciled statistics for {refreshed} libraries."))
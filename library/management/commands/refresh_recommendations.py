@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library.recommendations import BLOCK_SIZE, TOP_K, refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = ("Recompute 'borrowed together', 'similar by ratings' and per-member book recommendations from the "
+            "Borrow and Review tables. Only stale rows are refreshed unless --full is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every book and member.")
+        parser.add_argument('--top-k', type=int, default=TOP_K, help="Recommendations kept per book and member.")
+        parser.add_argument('--workers', type=int, default=1, help="Processes computing similarity blocks.")
+        parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help="Books or members per block.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        books, members = refresh_recommendations(options['full'], options['top_k'], options['workers'],
+                                                 options['block_size'], options['database'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed recommendations for {books} books and {members} members "
+            f"in {time.monotonic() - started:.1f}s."))
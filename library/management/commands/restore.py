@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.snapshots import SnapshotError, restore
+
+
+class Command(BaseCommand):
+    help = ("Replace the SQLite database with a snapshot and the incremental exports taken after it, "
+            "bulk loading without constraints and building indexes afterwards. Rows from the increments are "
+            "added to the search index and the object and analytics caches are dropped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', help="Snapshot file written by the snapshot command.")
+        parser.add_argument('increments', nargs='*', help="Incremental exports to apply on top, oldest first.")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help="Do not ask for confirmation.")
+        parser.add_argument('--database', default='default', help="Database alias to restore into.")
+
+    def handle(self, *args, **options):
+        if options['interactive']:
+            answer = input(f"This replaces every row of the {options['database']!r} database with "
+                           f"{options['snapshot']}. Type 'yes' to continue: ")
+            if answer != 'yes':
+                raise CommandError("Restore cancelled.")
+        try:
+            result = restore(options['snapshot'], options['increments'], using=options['database'])
+        except SnapshotError as exc:
+            raise CommandError(str(exc)) from exc
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {result.rows} rows: {result.size / 1e6:.1f} MB in {result.seconds:.2f} s "
+            f"({result.throughput:.1f} MB/s)."
+        ))
+        if result.violations:
+            self.stderr.write(self.style.WARNING(
+                f"{result.violations} rows refer to rows that no longer exist; see PRAGMA foreign_key_check."
+            ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.partitions import PARTITIONS, PartitionError, restore
+
+
+class Command(BaseCommand):
+    help = "Move rows from the per-year archive tables back into the live tables, undoing archive_history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', help=f"Tables to restore ({', '.join(PARTITIONS)}), all by default.")
+        parser.add_argument('--since-year', type=int, help="Only restore archive tables of this year and later.")
+        parser.add_argument('--database', default='default', help="Database alias to restore in.")
+
+    def handle(self, *args, **options):
+        for name in options['tables'] or PARTITIONS:
+            try:
+                restored, kept = restore(name, options['since_year'], options['database'])
+            except PartitionError as exc:
+                raise CommandError(str(exc)) from exc
+            message = f"Restored {restored} {name}."
+            if kept:
+                message += f" {kept} rows stay archived: what they refer to is gone or they clash with live rows."
+            self.stdout.write(self.style.SUCCESS(message))
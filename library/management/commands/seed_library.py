@@ -0,0 +1,36 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from library.seeding import LibrarySeeder
+
+
+class Command(BaseCommand):
+    help = ("Generate seeded synthetic data for every library model. --scale is the number of members; "
+            "borrows are 10x that.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Do not rebuild ratings, overdue counters, availability, library statistics, "
+                                 "recommendations and the search index afterwards.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(name, count):
+            self.stdout.write(f"{name}: {count} rows ({time.monotonic() - started:.1f}s)")
+
+        seeder = LibrarySeeder(options['scale'], options['seed'], options['database'], progress)
+        seeder.run()
+        if not options['skip_derived']:
+            call_command('recompute_book_ratings', stdout=self.stdout)
+            call_command('sweep_overdue', stdout=self.stdout)
+            call_command('reconcile_availability', database=options['database'], stdout=self.stdout)
+            call_command('refresh_library_stats', stdout=self.stdout)
+            call_command('refresh_recommendations', full=True, database=options['database'], stdout=self.stdout)
+            call_command('rebuild_search_index', database=options['database'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Seeded scale {options['scale']} in {time.monotonic() - started:.1f}s."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library.snapshots import SnapshotError, export_increment, get_config, snapshot
+
+
+class Command(BaseCommand):
+    help = ("Copy the SQLite database into a snapshot file with the online backup API while it keeps serving, "
+            "or export only the rows added since the last snapshot.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', help="Snapshot directory, LIBRARY_SNAPSHOTS['DIRECTORY'] by default.")
+        parser.add_argument('--incremental', action='store_true',
+                            help="Export rows above each table's primary-key high-water mark instead of a full copy.")
+        parser.add_argument('--tables', nargs='+', help="Tables to export incrementally, all by default.")
+        parser.add_argument('--no-compress', action='store_true', help="Store the copy without gzip compression.")
+        parser.add_argument('--pages', type=int, help="Pages copied per backup step.")
+        parser.add_argument('--pause', type=float, help="Seconds to sleep between backup steps.")
+        parser.add_argument('--database', default='default', help="Database alias to snapshot.")
+
+    def handle(self, *args, **options):
+        compress = not options['no_compress']
+        try:
+            if options['incremental']:
+                result = export_increment(options['directory'], options['tables'], compress, options['database'])
+            else:
+                if options['tables']:
+                    raise CommandError("--tables only applies to --incremental exports.")
+                result = snapshot(options['directory'], compress, options['pages'], options['pause'],
+                                  options['database'])
+        except SnapshotError as exc:
+            raise CommandError(str(exc)) from exc
+        rows = f" ({result.rows} rows)" if options['incremental'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {result.path}{rows}: {result.size / 1e6:.1f} MB in {result.seconds:.2f} s "
+            f"({result.throughput:.1f} MB/s), {result.stored / 1e6:.1f} MB on disk."
+        ))
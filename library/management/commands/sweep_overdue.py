@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from library.models import Borrow
+from library.overdue import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = "Recompute every member's overdue borrow counter in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000, help="Members refreshed per transaction.")
+        parser.add_argument('--date', type=datetime.date.fromisoformat,
+                            help="Reference date (YYYY-MM-DD), today by default.")
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+
+        def progress(done, total):
+            if verbosity >= 2:
+                self.stdout.write(f"Swept members up to id {done} of {total}")
+
+        updated = sweep_overdue(options['chunk_size'], options['date'], progress)
+        overdue = Borrow.objects.overdue(options['date']).count()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {updated} members; {overdue} borrows are overdue."))
@@ -1,27 +1,103 @@
+import datetime
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Avg, Count, Q, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
 
-class Author(models.Model):
+class LoadedStateMixin:
+    """Remembers the database values of ``tracked_fields`` so signal handlers can apply deltas on edit.
+
+    Models with ``audited`` set also remember every editable field, for the diffs of the audit log.
+    """
+
+    tracked_fields = ()
+    audited = False
+
+    @classmethod
+    def audited_fields(cls):
+        return [field.attname for field in cls._meta.concrete_fields if field.editable and not field.primary_key]
+
+    @classmethod
+    def remembered_fields(cls):
+        if '_remembered_fields' not in cls.__dict__:
+            names = dict.fromkeys(cls.tracked_fields)
+            if cls.audited:
+                names.update(dict.fromkeys(cls.audited_fields()))
+            cls._remembered_fields = tuple(names)
+        return cls._remembered_fields
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_state()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.remember_loaded_state()
+
+    def remember_loaded_state(self):
+        # Deferred fields are left out rather than remembered as None.
+        self._loaded_state = {name: self.__dict__[name] for name in self.remembered_fields() if name in self.__dict__}
+
+    def loaded_value(self, name):
+        """Value of a tracked field when the row was loaded or last saved; None for unsaved instances."""
+        return getattr(self, '_loaded_state', {}).get(name)
+
+
+class FilteredManager(models.Manager):
+    """Manager limited to rows matching ``filters``; soft-deleted rows stay reachable through ``all_objects``."""
+
+    def __init__(self, **filters):
+        super().__init__()
+        self.filters = filters
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**self.filters)
+
+
+class Author(LoadedStateMixin, models.Model):
     first_name = models.CharField(max_length=100, verbose_name="First name")
     last_name = models.CharField(max_length=100, verbose_name="Last name")
     birth_date = models.DateField(verbose_name="Birth date")
     profile = models.URLField(null=True, blank=True, verbose_name="Profile URL")
     deleted = models.BooleanField(default=False, verbose_name="Deleted",
                                   help_text="If checked, the author is considered removed from the list")
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Deleted At")
     rating = models.IntegerField(
         default=1,
         validators=[MinValueValidator(1), MaxValueValidator(10)],
         verbose_name="Rating"
     )
 
+    objects = FilteredManager(deleted=False)
+    all_objects = models.Manager()
+
+    audited = True
+
     def __str__(self):
         return f"{self.first_name} {self.last_name[0]}."
 
+    def save(self, *args, **kwargs):
+        if not self.deleted:
+            self.deleted_at = None
+        elif self.deleted_at is None:
+            self.deleted_at = timezone.now()
+        super().save(*args, **kwargs)
+
     class Meta:
+        # Admin, form validation and related lookups must still see deleted authors.
+        default_manager_name = 'all_objects'
         indexes = [
             models.Index(fields=['last_name', 'first_name']),
+            models.Index(fields=['last_name', 'first_name'], condition=Q(deleted=False),
+                         name='author_live_name_idx'),
+            models.Index(fields=['deleted_at'], condition=Q(deleted=True), name='author_deleted_at_idx'),
         ]
         verbose_name = "Author"
         verbose_name_plural = "Authors"
@@ -78,7 +154,7 @@ class Library(models.Model):
         ordering = ['name']
 
 
-class Member(models.Model):
+class Member(LoadedStateMixin, models.Model):
     GENDER_CHOICES = [
         ('Male', 'Male'),
         ('Female', 'Female'),
@@ -98,28 +174,50 @@ class Member(models.Model):
     age = models.IntegerField(validators=[MinValueValidator(6), MaxValueValidator(120)], verbose_name="Age")
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, verbose_name="Role")
     active = models.BooleanField(default=True, verbose_name="Active")
+    deactivated_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Deactivated At")
     libraries = models.ManyToManyField(Library, related_name='members', verbose_name="Libraries")
+    overdue_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Overdue Borrows")
+
+    objects = FilteredManager(active=True)
+    all_objects = models.Manager()
+
+    tracked_fields = ('active',)
+    audited = True
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.role})"
 
+    def save(self, *args, **kwargs):
+        if self.active:
+            self.deactivated_at = None
+        elif self.deactivated_at is None:
+            self.deactivated_at = timezone.now()
+        super().save(*args, **kwargs)
+
     class Meta:
+        # Admin, form validation and related lookups must still see inactive members.
+        default_manager_name = 'all_objects'
         indexes = [
             models.Index(fields=['last_name', 'first_name']),
+            models.Index(fields=['last_name', 'first_name'], condition=Q(active=True),
+                         name='member_active_name_idx'),
+            models.Index(fields=['deactivated_at'], condition=Q(active=False), name='member_deactivated_at_idx'),
         ]
         verbose_name = "Member"
         verbose_name_plural = "Members"
         ordering = ['last_name', 'first_name']
 
 
-class Post(models.Model):
+class Post(LoadedStateMixin, models.Model):
     title = models.CharField(max_length=255, unique_for_date='created_at', verbose_name="Title")
     body = models.TextField(verbose_name="Body")
     author = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='posts', verbose_name="Author")
     moderated = models.BooleanField(default=False, verbose_name="Moderated")
     library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='posts', verbose_name="Library")
     created_at = models.DateField(verbose_name="Created At")
-    updated_at = models.DateField(auto_now=True, verbose_name="Updated At")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    tracked_fields = ('library_id', 'moderated')
 
     def __str__(self):
         return self.title
@@ -127,14 +225,27 @@ class Post(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['created_at']),
-            models.Index(fields=['author']),
+            models.Index(fields=['author', 'created_at']),
+            # Serves both a library's feed (moderated) and its moderation queue (not moderated).
+            models.Index(fields=['library', 'moderated', 'created_at']),
         ]
         verbose_name = "Post"
         verbose_name_plural = "Posts"
         ordering = ['-created_at']
 
 
-class Book(models.Model):
+class BookQuerySet(models.QuerySet):
+    def with_live_rating(self):
+        return self.annotate(
+            live_average_rating=Coalesce(Avg('reviews__rating'), Value(0.0)),
+            live_review_count=Count('reviews'),
+        )
+
+    def top_rated(self, min_reviews=1):
+        return self.filter(review_count__gte=min_reviews).order_by('-average_rating', '-review_count')
+
+
+class Book(LoadedStateMixin, models.Model):
     GENRE_CHOICES = [
         ('Fiction', 'Fiction'),
         ('Non-Fiction', 'Non-Fiction'),
@@ -153,19 +264,22 @@ class Book(models.Model):
                                      verbose_name="Page Count")
     category = models.ForeignKey(Category, null=True, on_delete=models.SET_NULL, related_name='books',
                                  verbose_name="Category")
-    libraries = models.ManyToManyField(Library, related_name='books', verbose_name="Libraries")
+    libraries = models.ManyToManyField(Library, through='Holding', related_name='books', verbose_name="Libraries")
+    average_rating = models.FloatField(default=0, editable=False, verbose_name="Average Rating")
+    review_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Review Count")
 
-    @property
-    def rating(self):
-        reviews = self.reviews.all()
-        total_reviews = reviews.count()
+    objects = BookQuerySet.as_manager()
 
-        if total_reviews == 0:
-            return 0
+    audited = True
 
-        total_rating = sum(review.rating for review in reviews)
-        average_rating = total_rating / total_reviews
-        return round(average_rating, 2)
+    @property
+    def rating(self):
+        # Rows fetched through BookQuerySet.with_live_rating() carry a freshly
+        # aggregated value; everything else reads the stored aggregate.
+        average_rating = getattr(self, 'live_average_rating', None)
+        if average_rating is None:
+            average_rating = self.average_rating
+        return round(average_rating or 0, 2)
 
     def __str__(self):
         return self.title
@@ -175,17 +289,48 @@ class Book(models.Model):
         indexes = [
             models.Index(fields=['genre']),
             models.Index(fields=['publishing_date']),
+            models.Index(fields=['average_rating']),
         ]
         verbose_name = "Book"
         verbose_name_plural = "Books"
         ordering = ['-publishing_date']
 
 
-class Review(models.Model):
+class Holding(LoadedStateMixin, models.Model):
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='holdings', verbose_name="Book")
+    library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='holdings', verbose_name="Library")
+    copies = models.PositiveIntegerField(default=1, verbose_name="Copies")
+    # Copies minus open borrows; it goes negative when more loans are recorded than there are copies.
+    available = models.IntegerField(default=1, editable=False, verbose_name="Available")
+
+    tracked_fields = ('copies',)
+
+    def save(self, *args, **kwargs):
+        # Borrows move available with F() updates; a full save must not write a stale copy back.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = ['book', 'library', 'copies']
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.book} at {self.library}"
+
+    class Meta:
+        unique_together = ['book', 'library']
+        indexes = [
+            models.Index(fields=['library', 'available']),
+        ]
+        verbose_name = "Holding"
+        verbose_name_plural = "Holdings"
+
+
+class Review(LoadedStateMixin, models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews', verbose_name="Book")
     reviewer = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='reviews', verbose_name="Reviewer")
     rating = models.FloatField(validators=[MinValueValidator(1), MaxValueValidator(5)], verbose_name="Rating")
     description = models.TextField(verbose_name="Review Description")
+    created_at = models.DateField(default=timezone.localdate, verbose_name="Created At")
+
+    tracked_fields = ('book_id', 'rating')
 
     def __str__(self):
         return f"Review of {self.book} by {self.reviewer}"
@@ -194,14 +339,34 @@ class Review(models.Model):
         indexes = [
             models.Index(fields=['rating']),
             models.Index(fields=['book']),
-            models.Index(fields=['reviewer']),
+            models.Index(fields=['reviewer', 'created_at']),
         ]
         verbose_name = "Review"
         verbose_name_plural = "Reviews"
         ordering = ['-rating']
 
 
-class Borrow(models.Model):
+class BorrowQuerySet(models.QuerySet):
+    def open(self):
+        return self.filter(returned=False)
+
+    def overdue(self, today=None):
+        return self.open().filter(return_date__lt=today or timezone.localdate())
+
+    def due_within(self, days, today=None):
+        today = today or timezone.localdate()
+        return self.open().filter(return_date__gte=today, return_date__lte=today + datetime.timedelta(days=days))
+
+    def overdue_counts_by_member(self, today=None):
+        return dict(self.overdue(today).order_by().values('member').annotate(count=Count('pk'))
+                    .values_list('member', 'count'))
+
+    def overdue_counts_by_library(self, today=None):
+        return dict(self.overdue(today).order_by().values('library').annotate(count=Count('pk'))
+                    .values_list('library', 'count'))
+
+
+class Borrow(LoadedStateMixin, models.Model):
     member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='borrows', verbose_name="Member")
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrows', verbose_name="Book")
     library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='borrows', verbose_name="Library")
@@ -209,10 +374,15 @@ class Borrow(models.Model):
     return_date = models.DateField(verbose_name="Return Date")
     returned = models.BooleanField(default=False, verbose_name="Returned")
 
+    objects = BorrowQuerySet.as_manager()
+
+    tracked_fields = ('library_id', 'return_date', 'returned', 'member_id', 'book_id')
+    audited = True
+
     def is_overdue(self):
         if self.returned:
             return False
-        return self.return_date < timezone.now().date()
+        return self.return_date < timezone.localdate()
 
     def __str__(self):
         return f"{self.member} borrowed {self.book}"
@@ -221,19 +391,39 @@ class Borrow(models.Model):
         unique_together = ['member', 'book', 'borrow_date']
         indexes = [
             models.Index(fields=['borrow_date']),
+            models.Index(fields=['member', 'borrow_date']),
             models.Index(fields=['return_date']),
+            models.Index(fields=['return_date', 'member'], condition=Q(returned=False),
+                         name='borrow_open_return_date_idx'),
         ]
         verbose_name = "Borrow"
         verbose_name_plural = "Borrows"
         ordering = ['-borrow_date']
 
 
-class Event(models.Model):
+class Event(LoadedStateMixin, models.Model):
     title = models.CharField(max_length=255, verbose_name="Event Title")
     description = models.TextField(verbose_name="Event Description")
     date = models.DateTimeField(verbose_name="Event Date")
     library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='events', verbose_name="Library")
     books = models.ManyToManyField(Book, related_name='events', verbose_name="Books")
+    capacity = models.PositiveIntegerField(null=True, blank=True, verbose_name="Capacity",
+                                           help_text="Leave empty for unlimited places")
+    admitted_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Admitted")
+
+    tracked_fields = ('capacity',)
+
+    @property
+    def places_left(self):
+        return None if self.capacity is None else max(self.capacity - self.admitted_count, 0)
+
+    def save(self, *args, **kwargs):
+        # admitted_count only moves through the registration service's conditional updates, so a full save
+        # of an instance loaded earlier must not write its stale copy back.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'admitted_count']
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
@@ -242,6 +432,7 @@ class Event(models.Model):
         unique_together = ['title', 'date']
         indexes = [
             models.Index(fields=['date']),
+            models.Index(fields=['library', 'date']),
         ]
         verbose_name = "Event"
         verbose_name_plural = "Events"
@@ -249,9 +440,17 @@ class Event(models.Model):
 
 
 class EventParticipant(models.Model):
+    ADMITTED = 'admitted'
+    WAITLISTED = 'waitlisted'
+    STATUS_CHOICES = [
+        (ADMITTED, 'Admitted'),
+        (WAITLISTED, 'Waitlisted'),
+    ]
+
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='participants', verbose_name="Event")
     member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='event_participations', verbose_name="Participant")
     registration_date = models.DateField(default=timezone.now, verbose_name="Registration Date")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ADMITTED, verbose_name="Status")
 
     def __str__(self):
         return f"{self.member} registered for {self.event}"
@@ -259,9 +458,293 @@ class EventParticipant(models.Model):
     class Meta:
         unique_together = ['event', 'member']
         indexes = [
-            models.Index(fields=['member']),
-            models.Index(fields=['event']),
+            models.Index(fields=['member', 'registration_date']),
+            # Waitlist promotion reads (event, waitlisted) in primary-key order.
+            models.Index(fields=['event', 'status']),
         ]
         verbose_name = "Event Participant"
         verbose_name_plural = "Event Participants"
         ordering = ['-registration_date']
+
+
+class LibraryStats(models.Model):
+    library = models.OneToOneField(Library, on_delete=models.CASCADE, related_name='stats', verbose_name="Library")
+    active_members = models.IntegerField(default=0, verbose_name="Active Members")
+    books_held = models.IntegerField(default=0, verbose_name="Books Held")
+    open_loans = models.IntegerField(default=0, verbose_name="Current Loans")
+    post_count = models.IntegerField(default=0, verbose_name="Posts")
+    top_rated_books = models.JSONField(default=list, verbose_name="Top Rated Books")
+    reconciled_at = models.DateTimeField(null=True, blank=True, verbose_name="Reconciled At")
+
+    def __str__(self):
+        return f"Statistics of {self.library}"
+
+    class Meta:
+        verbose_name = "Library Statistics"
+        verbose_name_plural = "Library Statistics"
+        ordering = ['library__name']
+
+
+class LibraryLoanDue(models.Model):
+    library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='loans_due', verbose_name="Library")
+    due_date = models.DateField(verbose_name="Due Date")
+    open_loans = models.IntegerField(default=0, verbose_name="Open Loans")
+
+    def __str__(self):
+        return f"{self.open_loans} loans due {self.due_date} at {self.library}"
+
+    class Meta:
+        unique_together = ['library', 'due_date']
+        verbose_name = "Library Loans Due"
+        verbose_name_plural = "Library Loans Due"
+        ordering = ['due_date']
+
+
+class LibraryDailyStats(models.Model):
+    library = models.ForeignKey(Library, on_delete=models.CASCADE, related_name='daily_stats', verbose_name="Library")
+    date = models.DateField(verbose_name="Date")
+    loans_started = models.IntegerField(default=0, verbose_name="Loans Started")
+    loans_returned = models.IntegerField(default=0, verbose_name="Loans Returned")
+    posts_created = models.IntegerField(default=0, verbose_name="Posts Created")
+    event_registrations = models.IntegerField(default=0, verbose_name="Event Registrations")
+
+    def __str__(self):
+        return f"{self.library} on {self.date}"
+
+    class Meta:
+        unique_together = ['library', 'date']
+        verbose_name = "Library Daily Statistics"
+        verbose_name_plural = "Library Daily Statistics"
+        ordering = ['-date']
+
+
+class BookRecommendations(models.Model):
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='recommendations',
+                                verbose_name="Book")
+    co_borrowed = models.JSONField(default=list, verbose_name="Borrowed Together")
+    similar_ratings = models.JSONField(default=list, verbose_name="Similar By Ratings")
+    stale = models.BooleanField(default=False, verbose_name="Stale")
+    computed_at = models.DateTimeField(null=True, blank=True, verbose_name="Computed At")
+
+    def __str__(self):
+        return f"Recommendations for {self.book}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['book'], condition=Q(stale=True), name='book_recs_stale_idx'),
+        ]
+        verbose_name = "Book Recommendations"
+        verbose_name_plural = "Book Recommendations"
+
+
+class MemberRecommendations(models.Model):
+    member = models.OneToOneField(Member, on_delete=models.CASCADE, primary_key=True,
+                                  related_name='recommendations', verbose_name="Member")
+    books = models.JSONField(default=list, verbose_name="Recommended Books")
+    stale = models.BooleanField(default=False, verbose_name="Stale")
+    computed_at = models.DateTimeField(null=True, blank=True, verbose_name="Computed At")
+
+    def __str__(self):
+        return f"Recommendations for {self.member}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['member'], condition=Q(stale=True), name='member_recs_stale_idx'),
+        ]
+        verbose_name = "Member Recommendations"
+        verbose_name_plural = "Member Recommendations"
+
+
+class BorrowChange(models.Model):
+    """A borrow saved, updated or deleted, so the circulation analytics cache can re-read only that row."""
+
+    # A plain id rather than a foreign key: the entry outlives a deleted or archived borrow.
+    borrow_id = models.PositiveIntegerField(verbose_name="Borrow ID")
+
+    def __str__(self):
+        return f"Borrow {self.borrow_id} changed"
+
+    class Meta:
+        verbose_name = "Borrow Change"
+        verbose_name_plural = "Borrow Changes"
+
+
+class AuditEntry(models.Model):
+    ACTION_CHOICES = [
+        ('create', 'Create'),
+        ('update', 'Update'),
+        ('delete', 'Delete'),
+    ]
+
+    model = models.CharField(max_length=100, verbose_name="Model")
+    object_id = models.BigIntegerField(verbose_name="Object ID")
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES, verbose_name="Action")
+    # {field: [old value, new value]} for the editable fields that changed.
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder, verbose_name="Changes")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+                             related_name='+', verbose_name="User")
+    changed_at = models.DateTimeField(verbose_name="Changed At")
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model} {self.object_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model', 'object_id', 'changed_at']),
+            models.Index(fields=['user', 'changed_at']),
+        ]
+        verbose_name = "Audit Entry"
+        verbose_name_plural = "Audit Entries"
+        ordering = ['-changed_at']
+
+
+class BulkJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    action = models.CharField(max_length=100, verbose_name="Action")
+    model = models.CharField(max_length=100, verbose_name="Model")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL,
+                             verbose_name="User")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued', verbose_name="Status")
+    total = models.PositiveIntegerField(default=0, verbose_name="Selected Rows")
+    processed = models.PositiveIntegerField(default=0, verbose_name="Processed Rows")
+    changed = models.PositiveIntegerField(default=0, verbose_name="Changed Rows")
+    error = models.TextField(blank=True, verbose_name="Error")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="Finished At")
+
+    def __str__(self):
+        return f"{self.action} on {self.total} {self.model} ({self.status})"
+
+    @property
+    def progress(self):
+        return 100 if not self.total else min(100, round(100 * self.processed / self.total))
+
+    class Meta:
+        verbose_name = "Bulk Job"
+        verbose_name_plural = "Bulk Jobs"
+        ordering = ['-created_at']
+
+
+class DuplicateCandidate(models.Model):
+    KIND_CHOICES = [
+        ('author', 'Author'),
+        ('book', 'Book'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed'),
+        ('rejected', 'Rejected'),
+        ('merged', 'Merged'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Kind")
+    # Plain ids rather than foreign keys: the duplicate row is deleted by the merge, the decision is kept.
+    canonical_id = models.PositiveIntegerField(verbose_name="Kept ID")
+    duplicate_id = models.PositiveIntegerField(verbose_name="Duplicate ID")
+    score = models.FloatField(verbose_name="Score")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="Status")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Created At")
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.duplicate_id} duplicates {self.canonical_id}"
+
+    class Meta:
+        unique_together = ['kind', 'canonical_id', 'duplicate_id']
+        indexes = [
+            models.Index(fields=['kind', 'status']),
+        ]
+        verbose_name = "Duplicate Candidate"
+        verbose_name_plural = "Duplicate Candidates"
+        ordering = ['-score']
+
+
+class ArchivedRecord(models.Model):
+    original_id = models.IntegerField(unique=True, verbose_name="Original ID")
+    data = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="Data")
+    removed_at = models.DateTimeField(verbose_name="Removed At")
+    archived_at = models.DateTimeField(auto_now_add=True, verbose_name="Archived At")
+
+    class Meta:
+        abstract = True
+        ordering = ['-archived_at']
+
+
+class ArchivedAuthor(ArchivedRecord):
+    def __str__(self):
+        return f"Archived author {self.original_id}"
+
+    class Meta(ArchivedRecord.Meta):
+        verbose_name = "Archived Author"
+        verbose_name_plural = "Archived Authors"
+
+
+class ArchivedMember(ArchivedRecord):
+    def __str__(self):
+        return f"Archived member {self.original_id}"
+
+    class Meta(ArchivedRecord.Meta):
+        verbose_name = "Archived Member"
+        verbose_name_plural = "Archived Members"
+
+
+# Read-only twins of the partitioned tables. Each reads a temporary view that unions the hot table with its
+# per-year archive tables; partitions.history() builds the view on the connection and returns the queryset.
+
+class BorrowHistory(models.Model):
+    member = models.ForeignKey(Member, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                               verbose_name="Member")
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                             verbose_name="Book")
+    library = models.ForeignKey(Library, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                                verbose_name="Library")
+    borrow_date = models.DateField(verbose_name="Borrow Date")
+    return_date = models.DateField(verbose_name="Return Date")
+    returned = models.BooleanField(verbose_name="Returned")
+
+    class Meta:
+        managed = False
+        db_table = 'library_borrow_history'
+        verbose_name = "Borrow History"
+        verbose_name_plural = "Borrow History"
+        ordering = ['-borrow_date']
+
+
+class PostHistory(models.Model):
+    title = models.CharField(max_length=255, verbose_name="Title")
+    body = models.TextField(verbose_name="Body")
+    author = models.ForeignKey(Member, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                               verbose_name="Author")
+    moderated = models.BooleanField(verbose_name="Moderated")
+    library = models.ForeignKey(Library, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                                verbose_name="Library")
+    created_at = models.DateField(verbose_name="Created At")
+    updated_at = models.DateTimeField(verbose_name="Updated At")
+
+    class Meta:
+        managed = False
+        db_table = 'library_post_history'
+        verbose_name = "Post History"
+        verbose_name_plural = "Post History"
+        ordering = ['-created_at']
+
+
+class EventParticipantHistory(models.Model):
+    event = models.ForeignKey(Event, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                              verbose_name="Event")
+    member = models.ForeignKey(Member, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+',
+                               verbose_name="Participant")
+    registration_date = models.DateField(verbose_name="Registration Date")
+    status = models.CharField(max_length=10, choices=EventParticipant.STATUS_CHOICES, verbose_name="Status")
+
+    class Meta:
+        managed = False
+        db_table = 'library_eventparticipant_history'
+        verbose_name = "Event Participant History"
+        verbose_name_plural = "Event Participant History"
+        ordering = ['-registration_date']
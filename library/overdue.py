@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Borrow, Member
+
+
+def refresh_overdue_counts(members, today=None):
+    """Store each member's number of overdue borrows in Member.overdue_count with one UPDATE."""
+    today = today or timezone.localdate()
+    overdue = (Borrow.objects.overdue(today).filter(member=OuterRef('pk')).order_by()
+               .values('member').annotate(count=Count('pk')).values('count'))
+    return members.order_by().update(overdue_count=Coalesce(Subquery(overdue), Value(0)))
+
+
+def sweep_overdue(chunk_size=10000, today=None, progress=None):
+    """Refresh overdue counters for every member in primary-key chunks, one short transaction each."""
+    today = today or timezone.localdate()
+    last_id = Member.all_objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+    updated = 0
+    for start in range(0, last_id, chunk_size):
+        with transaction.atomic():
+            members = Member.all_objects.filter(pk__gt=start, pk__lte=start + chunk_size)
+            updated += refresh_overdue_counts(members, today)
+        if progress:
+            progress(min(start + chunk_size, last_id), last_id)
+    return updated
@@ -0,0 +1,274 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.functional import cached_property
+
+
+def estimate_row_count(model, using='default'):
+    """Planner statistics row estimate for a model's table, or None when unavailable."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            row = cursor.fetchone()
+            return int(row[0].split()[0]) if row else None
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+    return None
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator that avoids a full COUNT(*) over very large tables.
+
+    Unfiltered querysets use a cached count, seeded from the database's table
+    statistics once the table is past ``estimate_threshold`` rows. Filtered
+    querysets are counted through a LIMIT subquery capped at ``max_count``.
+    """
+
+    cache_timeout = 300
+    estimate_threshold = 100000
+    max_count = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return len(queryset)
+        if not queryset.query.has_filters():
+            return self._table_count(queryset)
+        return queryset[:self.max_count].count()
+
+    def _table_count(self, queryset):
+        key = f'library:paginator-count:{queryset.db}:{queryset.model._meta.label_lower}'
+        count = cache.get(key)
+        if count is not None:
+            return count
+        count = estimate_row_count(queryset.model, queryset.db)
+        if count is None or count < self.estimate_threshold:
+            count = queryset.count()
+        if count >= self.estimate_threshold:
+            cache.set(key, count, self.cache_timeout)
+        return count
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _resolve_ordering_field(model, path):
+    """Concrete field an ordering path ends in, or None if keyset comparison cannot use it."""
+    parts = path.split(LOOKUP_SEP)
+    opts = model._meta
+    for position, part in enumerate(parts):
+        try:
+            field = opts.pk if part == 'pk' else opts.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if position == len(parts) - 1:
+            return None if field.is_relation or not field.concrete or field.null else field
+        if not (field.many_to_one or field.one_to_one) or not field.concrete:
+            return None
+        opts = field.related_model._meta
+    return None
+
+
+def keyset_ordering(queryset):
+    """(path, descending, field) triples ending in a primary-key tiebreaker, or None if unsupported."""
+    query = queryset.query
+    order_by = query.order_by or (query.default_ordering and queryset.model._meta.ordering) or ()
+    ordering = []
+    for item in order_by:
+        if not isinstance(item, str) or item == '?':
+            return None
+        descending = item.startswith('-')
+        path = item.lstrip('-+')
+        if path == 'pk':
+            path = queryset.model._meta.pk.name
+        field = _resolve_ordering_field(queryset.model, path)
+        if field is None:
+            return None
+        if any(path == seen for seen, _, _ in ordering):
+            continue
+        ordering.append((path, descending, field))
+    pk_name = queryset.model._meta.pk.name
+    if not any(path == pk_name for path, _, _ in ordering):
+        ordering.append((pk_name, ordering[-1][1] if ordering else False, queryset.model._meta.pk))
+    return ordering
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator(CachedCountPaginator):
+    """Cursor pagination over a queryset's ordering plus a primary-key tiebreaker.
+
+    Each page is a range scan that starts right after the previous page's last
+    row, so its cost does not depend on how deep into the result set it is.
+    Cursors are opaque strings; ``values`` switches pages to values() dicts.
+    """
+
+    def __init__(self, object_list, per_page, values=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.ordering = keyset_ordering(object_list)
+        if self.ordering is None:
+            raise ValueError("Queryset ordering cannot be used for keyset pagination.")
+        self.values = values
+        self.per_page = int(per_page)
+
+    @property
+    def signature(self):
+        spec = ','.join(f"{'-' if descending else ''}{path}" for path, descending, _ in self.ordering)
+        return hashlib.sha1(spec.encode()).hexdigest()[:8]
+
+    def _row_values(self, row):
+        values = []
+        for path, _, _ in self.ordering:
+            if isinstance(row, dict):
+                value = row[path]
+            else:
+                value = row
+                for part in path.split(LOOKUP_SEP):
+                    value = getattr(value, part)
+            values.append(value)
+        return values
+
+    def encode_cursor(self, row, backwards=False):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in self._row_values(row)]
+        payload = {'o': self.signature, 'v': values, 'b': backwards}
+        return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            if payload['o'] != self.signature or len(payload['v']) != len(self.ordering):
+                raise InvalidCursor("Cursor does not match this ordering.")
+            values = [field.to_python(value) for (_, _, field), value in zip(self.ordering, payload['v'])]
+            return values, bool(payload['b'])
+        except (binascii.Error, ValueError, KeyError, TypeError, ValidationError) as exc:
+            if isinstance(exc, InvalidCursor):
+                raise
+            raise InvalidCursor("Invalid cursor.") from exc
+
+    def _after(self, values, backwards):
+        condition = Q()
+        for (path, descending, _), value in reversed(list(zip(self.ordering, values))):
+            lookup = 'lt' if descending != backwards else 'gt'
+            step = Q(**{f'{path}__{lookup}': value})
+            condition = step if not condition else step | (Q(**{path: value}) & condition)
+        return condition
+
+    def _page_queryset(self, cursor):
+        queryset = self.object_list
+        backwards = False
+        if cursor:
+            values, backwards = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(values, backwards))
+        queryset = queryset.order_by(*[f"{'-' if descending != backwards else ''}{path}"
+                                       for path, descending, _ in self.ordering])
+        if self.values is not None:
+            fields = list(self.values) + [path for path, _, _ in self.ordering if path not in self.values]
+            queryset = queryset.values(*fields)
+        return queryset[:self.per_page + 1], backwards
+
+    def _build_page(self, rows, cursor, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+        return KeysetPage(
+            rows,
+            self.encode_cursor(rows[-1]) if rows and has_next else None,
+            self.encode_cursor(rows[0], backwards=True) if rows and has_previous else None,
+        )
+
+    def page_from_cursor(self, cursor=None):
+        queryset, backwards = self._page_queryset(cursor)
+        return self._build_page(list(queryset), cursor, backwards)
+
+    async def apage_from_cursor(self, cursor=None):
+        queryset, backwards = self._page_queryset(cursor)
+        return self._build_page([row async for row in queryset.aiterator()], cursor, backwards)
+
+
+CURSOR_VAR = 'cursor'
+
+
+class KeysetChangeList(ChangeList):
+    """Admin changelist that pages with keyset cursors instead of OFFSET page numbers."""
+
+    keyset_page = None
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Any link that does not explicitly move the cursor (sorting, filters) restarts at page one.
+        new_params = dict(new_params or {})
+        new_params.setdefault(CURSOR_VAR, None)
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        if self.show_all or keyset_ordering(self.queryset) is None:
+            return super().get_results(request)
+        paginator = KeysetPaginator(self.queryset, self.list_per_page)
+        try:
+            page = paginator.page_from_cursor(request.GET.get(CURSOR_VAR))
+        except InvalidCursor:
+            raise IncorrectLookupParameters
+        self.result_count = paginator.count
+        self.show_full_result_count = self.model_admin.show_full_result_count
+        if self.show_full_result_count:
+            self.full_result_count = CachedCountPaginator(self.root_queryset, self.list_per_page).count
+        else:
+            self.full_result_count = None
+        self.show_admin_actions = not self.show_full_result_count or bool(self.full_result_count)
+        self.result_list = page.object_list
+        self.can_show_all = False
+        self.multi_page = page.has_next() or page.has_previous()
+        self.paginator = paginator
+        self.keyset_page = page
+        self.next_page_url = self.get_query_string({CURSOR_VAR: page.next_cursor}) if page.has_next() else None
+        self.previous_page_url = (self.get_query_string({CURSOR_VAR: page.previous_cursor})
+                                  if page.has_previous() else None)
+
+
+class KeysetPaginationAdminMixin:
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
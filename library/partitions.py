@@ -0,0 +1,264 @@
+import datetime
+from collections import Counter
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .analytics import log_borrow_changes
+from .bulk import iter_pk_chunks
+from .caching import invalidate_feeds
+from .dashboard import bump_library
+from .models import Borrow, BorrowHistory, EventParticipant, EventParticipantHistory, Post, PostHistory
+from .recommendations import mark_stale
+from .search import index_objects
+
+DEFAULTS = {
+    'HORIZON_DAYS': 730,
+    'ARCHIVE_DATABASE': None,
+    'CHUNK_SIZE': 5000,
+}
+
+ARCHIVE_SCHEMA = 'library_archive'
+
+
+class PartitionError(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_PARTITIONS', {})}
+
+
+@dataclass(frozen=True)
+class PartitionSpec:
+    """A table whose closed rows move into ``<table>_<year>`` archive tables once older than the horizon.
+
+    ``moved`` is called with the pks of hot rows about to be archived (sign -1) or just restored (sign 1),
+    in place of the signals the raw SQL skips.
+    """
+
+    model: type
+    history_model: type
+    date_field: str
+    closed: Q
+    moved: object = None
+
+    @property
+    def table(self):
+        return self.model._meta.db_table
+
+    @property
+    def date_column(self):
+        return self.model._meta.get_field(self.date_field).column
+
+    def archive_table(self, year):
+        return f'{self.table}_{year}'
+
+    def archivable(self, before, using='default'):
+        return self.model._base_manager.using(using).filter(self.closed, **{f'{self.date_field}__lt': before})
+
+
+def _borrows_moved(pks, sign, using):
+    log_borrow_changes(pks, using)
+    # Recommendations are computed from the hot table only, so those of the books and members concerned change.
+    rows = list(Borrow._base_manager.using(using).filter(pk__in=pks).values_list('book_id', 'member_id'))
+    mark_stale({book_id for book_id, _ in rows}, {member_id for _, member_id in rows}, using)
+
+
+def _posts_moved(pks, sign, using):
+    # The dashboard counts the posts of the hot table, as reconcile_library_stats does.
+    counts = Counter(Post._base_manager.using(using).filter(pk__in=pks).values_list('library_id', flat=True))
+    for library_id, count in counts.items():
+        bump_library(library_id, using, post_count=sign * count)
+    invalidate_feeds(counts, using)
+
+
+PARTITIONS = {
+    'borrows': PartitionSpec(Borrow, BorrowHistory, 'borrow_date', Q(returned=True), _borrows_moved),
+    'posts': PartitionSpec(Post, PostHistory, 'created_at', Q(moderated=True), _posts_moved),
+    'registrations': PartitionSpec(EventParticipant, EventParticipantHistory, 'registration_date',
+                                   Q(event__date__lt=Now())),
+}
+
+
+def get_partition(name):
+    try:
+        return PARTITIONS[name]
+    except KeyError:
+        raise PartitionError(f"Unknown partitioned table {name!r}, choose from {', '.join(PARTITIONS)}") from None
+
+
+def archive_schema(connection):
+    """Schema of the archive tables, attaching ARCHIVE_DATABASE to ``connection`` first when it is configured."""
+    if connection.vendor != 'sqlite':
+        raise PartitionError("History partitioning needs an SQLite database.")
+    path = get_config()['ARCHIVE_DATABASE']
+    if not path:
+        return 'main'
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA database_list')
+        if ARCHIVE_SCHEMA not in {row[1] for row in cursor.fetchall()}:
+            if connection.in_atomic_block:
+                raise PartitionError("The archive database cannot be attached inside a transaction.")
+            cursor.execute(f'ATTACH DATABASE %s AS {ARCHIVE_SCHEMA}', [str(path)])
+    return ARCHIVE_SCHEMA
+
+
+def _columns(cursor, schema, table):
+    """(name, type, not null, primary key) for each column of ``schema.table``."""
+    cursor.execute(f'PRAGMA {schema}.table_info({table})')
+    return [(name, kind, notnull, pk) for _, name, kind, notnull, _, pk in cursor.fetchall()]
+
+
+def _archive_years(cursor, spec, schema):
+    cursor.execute(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' AND name GLOB %s",
+                   [f'{spec.table}_[0-9][0-9][0-9][0-9]'])
+    return sorted(int(name[-4:]) for name, in cursor.fetchall())
+
+
+def archive_years(name, using='default'):
+    """Years that have an archive table for the partitioned table ``name``."""
+    spec = get_partition(name)
+    connection = connections[using]
+    schema = archive_schema(connection)
+    with connection.cursor() as cursor:
+        return _archive_years(cursor, spec, schema)
+
+
+def _create_archive_table(cursor, quote, spec, schema, year):
+    # Same columns and primary key as the hot table, without foreign keys: they cannot point across files,
+    # and archived rows may outlive what they referred to.
+    table = spec.archive_table(year)
+    columns = ', '.join(f'{quote(name)} {kind}' + (' NOT NULL' if notnull else '') + (' PRIMARY KEY' if pk else '')
+                        for name, kind, notnull, pk in _columns(cursor, 'main', spec.table))
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS {schema}.{quote(table)} ({columns})')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.{quote(f"{table}_date")} '
+                   f'ON {quote(table)} ({quote(spec.date_column)})')
+    return table
+
+
+def _shared_columns(cursor, quote, spec, schema, table):
+    archived = {column[0] for column in _columns(cursor, schema, table)}
+    return ', '.join(quote(column[0]) for column in _columns(cursor, 'main', spec.table) if column[0] in archived)
+
+
+def archive(name, before=None, chunk_size=None, dry_run=False, using='default'):
+    """Move closed rows dated before ``before`` (the horizon by default) into per-year archive tables.
+
+    Rows are copied and deleted one primary-key chunk per transaction. Copies use INSERT OR IGNORE on the
+    primary key, so a run interrupted between the two steps can simply be repeated. Dashboard post counts
+    and recommendations follow the hot table, so they drop the archived rows; daily statistics keep them, and
+    reconcile_library_stats rebuilds only recent days, which lie inside the horizon.
+    Returns the rows moved.
+    """
+    spec = get_partition(name)
+    config = get_config()
+    before = before or timezone.localdate() - datetime.timedelta(days=config['HORIZON_DAYS'])
+    candidates = spec.archivable(before, using)
+    if dry_run:
+        return candidates.count()
+    connection = connections[using]
+    schema = archive_schema(connection)
+    quote = connection.ops.quote_name
+    pk_column = quote(spec.model._meta.pk.column)
+    moved = 0
+    for pks in iter_pk_chunks(candidates, chunk_size or config['CHUNK_SIZE']):
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            # Re-check inside the transaction: a row may have been reopened since it was listed.
+            chunk = candidates.filter(pk__in=pks)
+            pks = list(chunk.values_list('pk', flat=True))
+            if not pks:
+                continue
+            placeholders = ', '.join(['%s'] * len(pks))
+            for day in chunk.dates(spec.date_field, 'year'):
+                table = _create_archive_table(cursor, quote, spec, schema, day.year)
+                columns = _shared_columns(cursor, quote, spec, schema, table)
+                cursor.execute(
+                    f'INSERT OR IGNORE INTO {schema}.{quote(table)} ({columns}) SELECT {columns} '
+                    f'FROM main.{quote(spec.table)} WHERE {pk_column} IN ({placeholders}) '
+                    f'AND {quote(spec.date_column)} >= %s AND {quote(spec.date_column)} < %s',
+                    [*pks, day.isoformat(), day.replace(year=day.year + 1).isoformat()],
+                )
+            # A plain DELETE, so the signals of a real deletion (daily statistics, availability) stay out of it;
+            # what does follow the hot table is adjusted by spec.moved.
+            if spec.moved:
+                spec.moved(pks, -1, using)
+            cursor.execute(f'DELETE FROM main.{quote(spec.table)} WHERE {pk_column} IN ({placeholders})', pks)
+            index_objects(spec.model, pks, using)
+        moved += len(pks)
+    return moved
+
+
+def restore(name, since_year=None, using='default'):
+    """Copy archived rows back into the hot table and drop the archive tables that end up empty.
+
+    Rows whose member, book, library or event no longer exists, or that now clash with a unique constraint,
+    stay archived. Returns the number of rows restored and the number kept in the archive.
+    """
+    spec = get_partition(name)
+    connection = connections[using]
+    schema = archive_schema(connection)
+    quote = connection.ops.quote_name
+    pk_column = quote(spec.model._meta.pk.column)
+    references = []
+    for field in spec.model._meta.concrete_fields:
+        if field.is_relation:
+            target = field.related_model
+            exists = (f'{quote(field.column)} IN (SELECT {quote(target._meta.pk.column)} '
+                      f'FROM main.{quote(target._meta.db_table)})')
+            references.append(f'({quote(field.column)} IS NULL OR {exists})' if field.null else exists)
+    condition = ' AND '.join(references) or '1'
+    restored = kept = 0
+    with connection.cursor() as cursor:
+        years = [year for year in _archive_years(cursor, spec, schema) if since_year is None or year >= since_year]
+    for year in years:
+        table = quote(spec.archive_table(year))
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            columns = _shared_columns(cursor, quote, spec, schema, spec.archive_table(year))
+            cursor.execute(f'INSERT OR IGNORE INTO main.{quote(spec.table)} ({columns}) '
+                           f'SELECT {columns} FROM {schema}.{table} WHERE {condition}')
+            restored += cursor.rowcount
+            live = f'{pk_column} IN (SELECT {pk_column} FROM main.{quote(spec.table)})'
+            cursor.execute(f'SELECT {pk_column} FROM {schema}.{table} WHERE {live}')
+            pks = [pk for pk, in cursor.fetchall()]
+            cursor.execute(f'DELETE FROM {schema}.{table} WHERE {live}')
+            index_objects(spec.model, pks, using)
+            if spec.moved:
+                spec.moved(pks, 1, using)
+            cursor.execute(f'SELECT COUNT(*) FROM {schema}.{table}')
+            remaining = cursor.fetchone()[0]
+            if not remaining:
+                cursor.execute(f'DROP TABLE {schema}.{table}')
+            kept += remaining
+    return restored, kept
+
+
+def history(name, since=None, until=None, using='default'):
+    """Queryset over the hot table and its archive tables, for reports reaching past the horizon.
+
+    ``since`` and ``until`` leave out archive tables of years outside the range; filter the queryset on the
+    date as well. The union is a temporary view on this connection, so evaluate the queryset on it.
+    """
+    spec = get_partition(name)
+    connection = connections[using]
+    schema = archive_schema(connection)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        columns = [column[0] for column in _columns(cursor, 'main', spec.table)]
+        selects = [f"SELECT {', '.join(map(quote, columns))} FROM main.{quote(spec.table)}"]
+        for year in _archive_years(cursor, spec, schema):
+            if (since and year < since.year) or (until and year > until.year):
+                continue
+            table = spec.archive_table(year)
+            archived = {column[0] for column in _columns(cursor, schema, table)}
+            selected = ', '.join(quote(column) if column in archived else f'NULL AS {quote(column)}'
+                                 for column in columns)
+            selects.append(f'SELECT {selected} FROM {schema}.{quote(table)}')
+        view = quote(spec.history_model._meta.db_table)
+        cursor.execute(f'DROP VIEW IF EXISTS temp.{view}')
+        cursor.execute(f"CREATE TEMP VIEW {view} AS {' UNION ALL '.join(selects)}")
+    return spec.history_model._default_manager.using(using).all()
@@ -0,0 +1,117 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+DEFAULTS = {
+    'ENABLED': False,
+    'LOG_FILE': None,
+    'LOG_MAX_BYTES': 10 * 1024 * 1024,
+    'LOG_BACKUP_COUNT': 5,
+    'DUPLICATE_THRESHOLD': 3,
+    'PATH_PREFIXES': (),
+}
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def get_profiling_settings():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_PROFILING', {})}
+
+
+def normalize_sql(sql):
+    # Inline literals are folded so "... WHERE id = 1" and "... WHERE id = 2" count as the same query.
+    return _LITERALS.sub('?', sql)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((context['connection'].alias, sql, time.perf_counter() - start))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def duplicates(self, threshold):
+        counts = Counter((alias, normalize_sql(sql)) for alias, sql, _ in self.queries)
+        return {sql: count for (alias, sql), count in counts.items() if count >= threshold}
+
+
+def _build_logger(path, max_bytes, backup_count):
+    logger = logging.getLogger('library.profiling')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    if not any(getattr(handler, 'baseFilename', None) == str(path) for handler in logger.handlers):
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    return logger
+
+
+class QueryProfilingMiddleware:
+    """Reports SQL query count, DB time, repeated queries and wall time for each request.
+
+    Enabled through ``settings.LIBRARY_PROFILING['ENABLED']``; when it is off the
+    middleware removes itself from the chain at startup.
+    """
+
+    def __init__(self, get_response):
+        config = get_profiling_settings()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.duplicate_threshold = config['DUPLICATE_THRESHOLD']
+        self.path_prefixes = tuple(config['PATH_PREFIXES'])
+        self.logger = None
+        if config['LOG_FILE']:
+            self.logger = _build_logger(config['LOG_FILE'], config['LOG_MAX_BYTES'], config['LOG_BACKUP_COUNT'])
+
+    def __call__(self, request):
+        if self.path_prefixes and not request.path.startswith(self.path_prefixes):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        wall_time = time.perf_counter() - start
+
+        duplicates = recorder.duplicates(self.duplicate_threshold)
+        response['X-Query-Count'] = str(recorder.count)
+        response['X-Query-Time-Ms'] = f"{recorder.total_time * 1000:.2f}"
+        response['X-Duplicate-Queries'] = str(sum(duplicates.values()))
+        response['X-Wall-Time-Ms'] = f"{wall_time * 1000:.2f}"
+
+        if self.logger is not None:
+            self.logger.info(json.dumps({
+                'timestamp': time.time(),
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'query_count': recorder.count,
+                'query_time_ms': round(recorder.total_time * 1000, 3),
+                'wall_time_ms': round(wall_time * 1000, 3),
+                'duplicates': [{'sql': sql, 'count': count}
+                               for sql, count in sorted(duplicates.items(), key=lambda item: -item[1])],
+            }))
+        return response
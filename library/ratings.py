@@ -0,0 +1,36 @@
+from django.db.models import Avg, Case, Count, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Book, Review
+
+
+def apply_review_delta(book_id, rating_delta, count_delta):
+    """Shift a book's stored aggregate by one review's contribution in a single UPDATE."""
+    if book_id is None:
+        return
+    new_average = (F('average_rating') * F('review_count') + Value(float(rating_delta))) / (
+        F('review_count') + Value(count_delta))
+    Book.objects.filter(pk=book_id).update(
+        average_rating=Case(
+            When(review_count__lte=-count_delta, then=Value(0.0)),
+            default=new_average,
+            output_field=FloatField(),
+        ),
+        review_count=Case(
+            When(review_count__lte=-count_delta, then=Value(0)),
+            default=F('review_count') + Value(count_delta),
+        ),
+    )
+
+
+def recompute_book_ratings(queryset=None):
+    """Rebuild stored aggregates from the Review table; returns the number of books updated."""
+    if queryset is None:
+        queryset = Book.objects.all()
+    reviews = Review.objects.filter(book=OuterRef('pk')).order_by().values('book')
+    return queryset.order_by().update(
+        average_rating=Coalesce(
+            Subquery(reviews.annotate(value=Avg('rating')).values('value')), Value(0.0)),
+        review_count=Coalesce(
+            Subquery(reviews.annotate(value=Count('pk')).values('value')), Value(0)),
+    )
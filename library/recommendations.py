@@ -0,0 +1,279 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Book, BookRecommendations, Borrow, MemberRecommendations, Review
+
+TOP_K = 20
+BLOCK_SIZE = 1024
+FETCH_SIZE = 100000
+WRITE_BATCH_SIZE = 2000
+KINDS = ('co_borrowed', 'similar_ratings')
+
+
+def fetch_columns(queryset, fields, dtypes):
+    """Read ``fields`` of every row into one NumPy array per field, FETCH_SIZE rows at a time."""
+    chunks = [[] for _ in fields]
+    rows = queryset.order_by().values_list(*fields).iterator(chunk_size=FETCH_SIZE)
+    while batch := list(itertools.islice(rows, FETCH_SIZE)):
+        for column, values, dtype in zip(chunks, zip(*batch), dtypes):
+            column.append(np.array(values, dtype=dtype))
+    return [np.concatenate(column) if column else np.empty(0, dtype) for column, dtype in zip(chunks, dtypes)]
+
+
+def interaction_matrix(rows, columns, shape, values=None):
+    """CSR member x book matrix; binary when ``values`` is None, otherwise mean-centred per member."""
+    if values is None:
+        matrix = sparse.csr_matrix((np.ones(len(rows), np.float32), (rows, columns)), shape=shape)
+        matrix.sum_duplicates()
+        matrix.data[:] = 1
+        return matrix
+    totals = sparse.csr_matrix((values.astype(np.float32), (rows, columns)), shape=shape)
+    counts = sparse.csr_matrix((np.ones(len(rows), np.float32), (rows, columns)), shape=shape)
+    totals.sum_duplicates()
+    counts.sum_duplicates()
+    totals.data /= counts.data
+    per_row = np.diff(totals.indptr)
+    means = np.divide(np.asarray(totals.sum(axis=1)).ravel(), per_row, out=np.zeros(shape[0]), where=per_row > 0)
+    totals.data -= np.repeat(means, per_row).astype(np.float32)
+    totals.eliminate_zeros()
+    return totals
+
+
+def normalize_columns(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return (matrix @ sparse.diags(scale.astype(np.float32))).tocsc()
+
+
+def _top_k(block, k, exclude=None):
+    """Best ``k`` positive entries of each column of a CSC block (or row of a CSR block), as index/score arrays."""
+    ids = np.full((len(block.indptr) - 1, k), -1, dtype=np.int32)
+    scores = np.zeros((len(block.indptr) - 1, k), dtype=np.float32)
+    for i in range(len(block.indptr) - 1):
+        start, end = block.indptr[i], block.indptr[i + 1]
+        candidates, values = block.indices[start:end], block.data[start:end]
+        keep = values > 0
+        if exclude is not None:
+            keep &= candidates != exclude[i]
+        candidates, values = candidates[keep], values[keep]
+        if len(values) > k:
+            best = np.argpartition(-values, k)[:k]
+            candidates, values = candidates[best], values[best]
+        order = np.lexsort((candidates, -values))
+        ids[i, :len(order)] = candidates[order]
+        scores[i, :len(order)] = values[order]
+    return ids, scores
+
+
+def _item_block(state, columns):
+    normalized = state['normalized']
+    block = (normalized.T @ normalized[:, columns]).tocsc()
+    return _top_k(block, state['k'], exclude=columns)
+
+
+def _member_block(state, rows):
+    borrowed = state['borrows'][rows]
+    block = (borrowed @ state['neighbours']).tocsr()
+    block = (block - block.multiply(borrowed)).tocsr()
+    block.eliminate_zeros()
+    return _top_k(block, state['k'])
+
+
+_worker_state = {}
+
+
+def _init_worker(state):
+    _worker_state.update(state)
+
+
+def _call_in_worker(function, indices):
+    return function(_worker_state, indices)
+
+
+def map_blocks(function, state, indices, workers=1, block_size=BLOCK_SIZE):
+    """Apply a block function to ``indices`` in blocks and stack the (ids, scores) results.
+
+    With several workers the blocks run in a process pool; ``state`` is sent to each worker once.
+    """
+    k = state['k']
+    blocks = [indices[start:start + block_size] for start in range(0, len(indices), block_size)]
+    if workers > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(state,)) as pool:
+            results = list(pool.map(partial(_call_in_worker, function), blocks))
+    else:
+        results = [function(state, block) for block in blocks]
+    if not results:
+        return np.empty((0, k), np.int32), np.empty((0, k), np.float32)
+    return np.vstack([ids for ids, _ in results]), np.vstack([scores for _, scores in results])
+
+
+def item_neighbours(matrix, columns, k=TOP_K, workers=1, block_size=BLOCK_SIZE):
+    """Top-``k`` cosine neighbours of the given book columns of a member x book matrix."""
+    state = {'normalized': normalize_columns(matrix), 'k': k}
+    return map_blocks(_item_block, state, np.asarray(columns), workers, block_size)
+
+
+def neighbour_matrix(ids, scores, columns, size):
+    """Sparse book x book matrix holding each listed book's neighbour scores."""
+    keep = ids >= 0
+    rows = np.repeat(np.asarray(columns), keep.sum(axis=1))
+    return sparse.csr_matrix((scores[keep], (rows, ids[keep])), shape=(size, size))
+
+
+def member_scores(borrows, neighbours, rows, k=TOP_K, workers=1, block_size=BLOCK_SIZE):
+    """Top-``k`` unborrowed books per member row, scored by the neighbours of the books they borrowed."""
+    state = {'borrows': borrows, 'neighbours': neighbours, 'k': k}
+    return map_blocks(_member_block, state, np.asarray(rows), workers, block_size)
+
+
+class Interactions:
+    """Borrow and review matrices over one shared member and book index."""
+
+    def __init__(self, using='default'):
+        borrow_members, borrow_books = fetch_columns(Borrow.objects.using(using), ['member_id', 'book_id'],
+                                                     [np.int64, np.int64])
+        review_members, review_books, ratings = fetch_columns(
+            Review.objects.using(using), ['reviewer_id', 'book_id', 'rating'], [np.int64, np.int64, np.float32])
+        self.member_ids = np.union1d(borrow_members, review_members)
+        self.book_ids = np.union1d(borrow_books, review_books)
+        shape = (len(self.member_ids), len(self.book_ids))
+        self.borrows = interaction_matrix(self.member_index(borrow_members), self.book_index(borrow_books), shape)
+        self.ratings = interaction_matrix(self.member_index(review_members), self.book_index(review_books), shape,
+                                          ratings)
+
+    def member_index(self, ids):
+        return np.searchsorted(self.member_ids, ids)
+
+    def book_index(self, ids):
+        return np.searchsorted(self.book_ids, ids)
+
+    def known_books(self, ids):
+        return self.book_index(np.intersect1d(np.asarray(ids, dtype=np.int64), self.book_ids))
+
+    def known_members(self, ids):
+        return self.member_index(np.intersect1d(np.asarray(ids, dtype=np.int64), self.member_ids))
+
+
+def _as_lists(ids, scores, id_map):
+    for row_ids, row_scores in zip(ids, scores):
+        count = int((row_ids >= 0).sum())
+        yield [[int(id_map[index]), round(float(score), 4)] for index, score in
+               zip(row_ids[:count], row_scores[:count])]
+
+
+def _upsert(model, key, rows, fields, using):
+    manager = model._default_manager.using(using)
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        with transaction.atomic(using=using):
+            manager.bulk_create(rows[start:start + WRITE_BATCH_SIZE], update_conflicts=True, unique_fields=[key],
+                                update_fields=fields)
+
+
+def _claim_stale(model, known_ids, full, using):
+    """Ids to recompute: every known id, or stale rows plus known ids without a row. Clears their flags."""
+    manager = model._default_manager.using(using)
+    with transaction.atomic(using=using):
+        if full:
+            manager.filter(stale=True).update(stale=False)
+            return known_ids
+        stale = fetch_columns(manager.filter(stale=True), ['pk'], [np.int64])[0]
+        manager.filter(pk__in=stale.tolist()).update(stale=False)
+    existing = fetch_columns(manager.all(), ['pk'], [np.int64])[0]
+    return np.union1d(np.intersect1d(stale, known_ids), np.setdiff1d(known_ids, existing))
+
+
+def _stored_neighbours(interactions, using):
+    books, lists = [], []
+    for book_id, co_borrowed in BookRecommendations.objects.using(using).values_list('book_id', 'co_borrowed') \
+            .iterator(chunk_size=FETCH_SIZE):
+        books.append(book_id)
+        lists.append(co_borrowed)
+    size = len(interactions.book_ids)
+    known = np.isin(np.array(books, dtype=np.int64), interactions.book_ids)
+    rows, columns, scores = [], [], []
+    for book_id, entries, is_known in zip(books, lists, known):
+        if not is_known:
+            continue
+        for neighbour_id, score in entries:
+            rows.append(book_id)
+            columns.append(neighbour_id)
+            scores.append(score)
+    rows, columns = np.array(rows, dtype=np.int64), np.array(columns, dtype=np.int64)
+    keep = np.isin(columns, interactions.book_ids)
+    return sparse.csr_matrix(
+        (np.array(scores, dtype=np.float32)[keep],
+         (interactions.book_index(rows[keep]), interactions.book_index(columns[keep]))),
+        shape=(size, size))
+
+
+def refresh_recommendations(full=False, k=TOP_K, workers=1, block_size=BLOCK_SIZE, using='default'):
+    """Recompute book and member recommendations; returns the numbers of books and members written.
+
+    Without ``full`` only stale rows and subjects without a row are recomputed. Their similarities are
+    still taken against the whole catalogue, but unchanged books keep their stored lists until the next
+    full run even when a changed book would now rank among their neighbours.
+    """
+    interactions = Interactions(using)
+    now = timezone.now()
+    book_ids = _claim_stale(BookRecommendations, interactions.book_ids, full, using)
+    member_ids = _claim_stale(MemberRecommendations, interactions.member_ids, full, using)
+    try:
+        columns = interactions.known_books(book_ids)
+        lists, neighbours = {}, None
+        for kind, matrix in zip(KINDS, (interactions.borrows, interactions.ratings)):
+            ids, scores = item_neighbours(matrix, columns, k, workers, block_size)
+            lists[kind] = list(_as_lists(ids, scores, interactions.book_ids))
+            if kind == 'co_borrowed' and full:
+                neighbours = neighbour_matrix(ids, scores, columns, len(interactions.book_ids))
+        _upsert(BookRecommendations, 'book', [
+            BookRecommendations(book_id=int(interactions.book_ids[column]), co_borrowed=co_borrowed,
+                                similar_ratings=similar_ratings, computed_at=now)
+            for column, co_borrowed, similar_ratings in zip(columns, lists['co_borrowed'], lists['similar_ratings'])
+        ], ['co_borrowed', 'similar_ratings', 'computed_at'], using)
+
+        rows = interactions.known_members(member_ids)
+        if len(rows):
+            if neighbours is None:
+                neighbours = _stored_neighbours(interactions, using)
+            ids, scores = member_scores(interactions.borrows, neighbours, rows, k, workers, block_size)
+            _upsert(MemberRecommendations, 'member', [
+                MemberRecommendations(member_id=int(interactions.member_ids[row]), books=books, computed_at=now)
+                for row, books in zip(rows, _as_lists(ids, scores, interactions.book_ids))
+            ], ['books', 'computed_at'], using)
+    except Exception:
+        mark_stale(book_ids.tolist(), member_ids.tolist(), using)
+        raise
+    return len(columns), len(rows)
+
+
+def mark_stale(book_ids=(), member_ids=(), using='default'):
+    book_ids, member_ids = set(book_ids) - {None}, set(member_ids) - {None}
+    if book_ids:
+        BookRecommendations.objects.using(using).filter(pk__in=book_ids, stale=False).update(stale=True)
+    if member_ids:
+        MemberRecommendations.objects.using(using).filter(pk__in=member_ids, stale=False).update(stale=True)
+
+
+def _ordered_books(entries, limit, using):
+    ids = [book_id for book_id, _ in entries[:limit]]
+    books = Book.objects.using(using).in_bulk(ids)
+    return [books[book_id] for book_id in ids if book_id in books]
+
+
+def recommended_books(book_id, kind='co_borrowed', limit=TOP_K, using='default'):
+    """Books recommended next to ``book_id``, best first; ``kind`` is 'co_borrowed' or 'similar_ratings'."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown recommendation kind {kind!r}")
+    entries = BookRecommendations.objects.using(using).filter(pk=book_id).values_list(kind, flat=True).first()
+    return _ordered_books(entries or [], limit, using)
+
+
+def recommended_for_member(member_id, limit=TOP_K, using='default'):
+    entries = MemberRecommendations.objects.using(using).filter(pk=member_id).values_list('books', flat=True).first()
+    return _ordered_books(entries or [], limit, using)
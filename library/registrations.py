@@ -0,0 +1,133 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .dashboard import bump_daily
+from .models import Event, EventParticipant
+
+ADMITTED = EventParticipant.ADMITTED
+WAITLISTED = EventParticipant.WAITLISTED
+
+
+class AlreadyRegistered(Exception):
+    pass
+
+
+def _lock_event(event_id, using='default'):
+    """Lock the event row on backends with SELECT ... FOR UPDATE, and fetch it.
+
+    SQLite ignores the lock. Batch operations there are serialised only when the connection opens its
+    transactions IMMEDIATE, as the tuned profile does; under the default profile concurrent batches stay
+    correct through the compare-and-swap in _claim_places and the unique (event, member) constraint.
+    """
+    return Event.objects.using(using).select_for_update().get(pk=event_id)
+
+
+def _claim_places(event_id, wanted, using='default'):
+    """Reserve up to ``wanted`` places with a compare-and-swap on admitted_count; returns the number taken.
+
+    A conflicting single registration makes the swap match no row, so the counter is re-read and retried.
+    """
+    events = Event.objects.using(using).filter(pk=event_id)
+    while True:
+        capacity, admitted = events.values_list('capacity', 'admitted_count').get()
+        taken = wanted if capacity is None else max(min(wanted, capacity - admitted), 0)
+        if not taken or events.filter(admitted_count=admitted).update(admitted_count=admitted + taken):
+            return taken
+
+
+def register(event_id, member_id, using='default'):
+    """Register one member, admitted while places remain and waitlisted after that.
+
+    The place is taken by a single conditional UPDATE on Event.admitted_count, so concurrent sign-ups can
+    never admit more members than the capacity. Raises AlreadyRegistered for a repeated registration.
+    """
+    events = Event.objects.using(using).filter(pk=event_id)
+    try:
+        with transaction.atomic(using=using):
+            admitted = events.filter(Q(capacity__isnull=True) | Q(admitted_count__lt=F('capacity'))) \
+                .update(admitted_count=F('admitted_count') + 1)
+            if not admitted and not events.exists():
+                raise Event.DoesNotExist(f"Event {event_id} does not exist.")
+            return EventParticipant.objects.using(using).create(
+                event_id=event_id, member_id=member_id, status=ADMITTED if admitted else WAITLISTED)
+    except IntegrityError:
+        if EventParticipant.objects.using(using).filter(event_id=event_id, member_id=member_id).exists():
+            raise AlreadyRegistered(f"Member {member_id} is already registered for event {event_id}.")
+        raise
+
+
+def register_many(event_id, member_ids, using='default'):
+    """Register several members in one transaction; returns the admitted and waitlisted member ids.
+
+    Members already registered are skipped. Places go to members in the order given.
+    """
+    with transaction.atomic(using=using):
+        event = _lock_event(event_id, using)
+        member_ids = list(dict.fromkeys(member_ids))
+        registered = set(EventParticipant.objects.using(using).filter(event_id=event_id, member_id__in=member_ids)
+                         .values_list('member_id', flat=True))
+        new = [member_id for member_id in member_ids if member_id not in registered]
+        if not new:
+            return [], []
+        taken = _claim_places(event_id, len(new), using)
+        admitted, waitlisted = new[:taken], new[taken:]
+        today = timezone.localdate()
+        EventParticipant.objects.using(using).bulk_create(
+            [EventParticipant(event_id=event_id, member_id=member_id, registration_date=today, status=ADMITTED)
+             for member_id in admitted]
+            + [EventParticipant(event_id=event_id, member_id=member_id, registration_date=today, status=WAITLISTED)
+               for member_id in waitlisted]
+        )
+        # bulk_create skips post_save, so record the registrations on the dashboard here.
+        bump_daily(event.library_id, today, using, event_registrations=len(new))
+    return admitted, waitlisted
+
+
+def promote_waitlist(event_id, using='default'):
+    """Admit waitlisted members, earliest registration first, into the places left; returns how many."""
+    with transaction.atomic(using=using):
+        _lock_event(event_id, using)
+        waiting = EventParticipant.objects.using(using).filter(event_id=event_id, status=WAITLISTED)
+        taken = _claim_places(event_id, waiting.count(), using)
+        if not taken:
+            return 0
+        pks = list(waiting.order_by('pk').values_list('pk', flat=True)[:taken])
+        EventParticipant.objects.using(using).filter(pk__in=pks).update(status=ADMITTED)
+        if len(pks) < taken:
+            # Hand back places claimed for rows cancelled since they were counted.
+            Event.objects.using(using).filter(pk=event_id) \
+                .update(admitted_count=F('admitted_count') - (taken - len(pks)))
+    return len(pks)
+
+
+def cancel(event_id, member_ids, using='default'):
+    """Cancel the members' registrations and fill the freed places from the waitlist.
+
+    Returns the number of registrations cancelled and the number of waitlisted members promoted.
+    """
+    with transaction.atomic(using=using):
+        _lock_event(event_id, using)
+        registrations = EventParticipant.objects.using(using).filter(event_id=event_id, member_id__in=member_ids)
+        rows = list(registrations.values_list('pk', 'status'))
+        EventParticipant.objects.using(using).filter(pk__in=[pk for pk, _ in rows]).delete()
+        freed = sum(status == ADMITTED for _, status in rows)
+        if freed:
+            Event.objects.using(using).filter(pk=event_id).update(admitted_count=F('admitted_count') - freed)
+        promoted = promote_waitlist(event_id, using) if freed else 0
+    return len(rows), promoted
+
+
+def refresh_event_counts(events):
+    """Recount Event.admitted_count from the admitted registrations with one UPDATE."""
+    admitted = (EventParticipant.objects.filter(event=OuterRef('pk'), status=ADMITTED).order_by()
+                .values('event').annotate(count=Count('pk')).values('count'))
+    return events.order_by().update(admitted_count=Coalesce(Subquery(admitted), Value(0)))
+
+
+def reconcile_events(event_ids, using='default'):
+    """Recount admitted members after registrations were edited directly, then fill any free places."""
+    refresh_event_counts(Event.objects.using(using).filter(pk__in=event_ids))
+    for event_id in event_ids:
+        promote_waitlist(event_id, using)
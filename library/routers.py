@@ -0,0 +1,28 @@
+from django.db import connections
+
+
+class ReadReplicaRouter:
+    """Sends reads to the read-only ``replica`` alias and everything else to ``default``.
+
+    Reads made while a transaction is open on the primary stay on the primary so
+    they see that transaction's own writes.
+    """
+
+    primary = 'default'
+    replica = 'replica'
+
+    def db_for_read(self, model, **hints):
+        if connections[self.primary].in_atomic_block:
+            return self.primary
+        return self.replica
+
+    def db_for_write(self, model, **hints):
+        return self.primary
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {self.primary, self.replica}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == self.primary
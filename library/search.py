@@ -0,0 +1,247 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Author, Book, Member, Post, Review
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+class IndexSpec:
+    """Text columns indexed for one model.
+
+    ``columns`` maps an index column to the value paths concatenated into it and
+    ``dependencies`` maps a related model to the lookup that finds the rows whose
+    indexed text it contributes to.
+    """
+
+    def __init__(self, model, columns, weights, dependencies=None):
+        self.model = model
+        self.columns = columns
+        self.weights = weights
+        self.dependencies = dependencies or {}
+
+    @property
+    def table(self):
+        return f'{self.model._meta.db_table}_search'
+
+    @property
+    def paths(self):
+        return [path for paths in self.columns.values() for path in paths]
+
+    def rows(self, queryset):
+        for values in queryset.order_by().values_list('pk', *self.paths).iterator(chunk_size=2000):
+            row = [values[0]]
+            position = 1
+            for paths in self.columns.values():
+                parts = values[position:position + len(paths)]
+                row.append(' '.join(str(part) for part in parts if part))
+                position += len(paths)
+            yield row
+
+
+INDEXES = {
+    spec.model: spec for spec in [
+        IndexSpec(Book, {
+            'title': ['title'],
+            'summary': ['summary'],
+            'author': ['author__first_name', 'author__last_name'],
+            'genre': ['genre'],
+        }, weights=[10.0, 1.0, 5.0, 2.0], dependencies={Author: 'author'}),
+        IndexSpec(Author, {
+            'name': ['first_name', 'last_name'],
+        }, weights=[1.0]),
+        IndexSpec(Post, {
+            'title': ['title'],
+            'body': ['body'],
+            'author': ['author__first_name', 'author__last_name'],
+        }, weights=[10.0, 1.0, 5.0], dependencies={Member: 'author'}),
+        IndexSpec(Review, {
+            'description': ['description'],
+        }, weights=[1.0]),
+    ]
+}
+
+
+def tokenize(query):
+    return _TOKEN.findall(query)
+
+
+class SearchBackend:
+    """Interface implemented by full-text search backends."""
+
+    def supports(self, model):
+        return model in INDEXES
+
+    def create_index(self, spec, using):
+        pass
+
+    def index(self, spec, pks, using):
+        pass
+
+    def remove(self, spec, pks, using):
+        pass
+
+    def rebuild(self, spec, using):
+        pass
+
+    def filter_queryset(self, queryset, query):
+        raise NotImplementedError
+
+    def search(self, model, query, limit=20):
+        """Return up to ``limit`` (pk, score) pairs, best match first."""
+        raise NotImplementedError
+
+
+class LikeSearchBackend(SearchBackend):
+    """Fallback that keeps no index and matches every token with icontains."""
+
+    def filter_queryset(self, queryset, query):
+        spec = INDEXES[queryset.model]
+        for token in tokenize(query):
+            condition = Q()
+            for path in spec.paths:
+                condition |= Q(**{f'{path}__icontains': token})
+            queryset = queryset.filter(condition)
+        return queryset
+
+    def search(self, model, query, limit=20):
+        if not tokenize(query):
+            return []
+        pks = self.filter_queryset(model._default_manager.all(), query).values_list('pk', flat=True)[:limit]
+        return [(pk, 0.0) for pk in pks]
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """Inverted index kept in one FTS5 virtual table per model, keyed by the row's primary key."""
+
+    def create_index(self, spec, using):
+        columns = ', '.join(spec.columns)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS "{spec.table}" '
+                f"USING fts5({columns}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def index(self, spec, pks, using):
+        pks = list(pks)
+        if not pks:
+            return
+        self.remove(spec, pks, using)
+        queryset = spec.model._default_manager.using(using).filter(pk__in=pks)
+        self._insert(spec, spec.rows(queryset), using)
+
+    def remove(self, spec, pks, using):
+        pks = list(pks)
+        with connections[using].cursor() as cursor:
+            for start in range(0, len(pks), 500):
+                chunk = pks[start:start + 500]
+                cursor.execute(f'DELETE FROM "{spec.table}" WHERE rowid IN ({", ".join(["%s"] * len(chunk))})',
+                               chunk)
+
+    def rebuild(self, spec, using):
+        self.create_index(spec, using)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{spec.table}"')
+        self._insert(spec, spec.rows(spec.model._default_manager.using(using).all()), using)
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'INSERT INTO "{spec.table}"("{spec.table}") VALUES (\'optimize\')')
+
+    def _insert(self, spec, rows, using):
+        placeholders = ', '.join(['%s'] * (len(spec.columns) + 1))
+        sql = f'INSERT INTO "{spec.table}"(rowid, {", ".join(spec.columns)}) VALUES ({placeholders})'
+        batch = []
+        with connections[using].cursor() as cursor:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= 2000:
+                    cursor.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+
+    @staticmethod
+    def match_expression(query):
+        # Every token must match; a trailing * turns each into a prefix query.
+        return ' '.join(f'"{token}"*' for token in tokenize(query))
+
+    def filter_queryset(self, queryset, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset
+        spec = INDEXES[queryset.model]
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM "{spec.table}" WHERE "{spec.table}" MATCH %s', [expression]))
+
+    def search(self, model, query, limit=20):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        spec = INDEXES[model]
+        weights = ', '.join(str(weight) for weight in spec.weights)
+        using = router.db_for_read(model)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid, bm25("{spec.table}", {weights}) AS score FROM "{spec.table}" '
+                f'WHERE "{spec.table}" MATCH %s ORDER BY score LIMIT %s',
+                [expression, limit],
+            )
+            # bm25() is lower for better matches; flip it so higher scores rank first.
+            return [(pk, -score) for pk, score in cursor.fetchall()]
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    backend = getattr(settings, 'LIBRARY_SEARCH', {}).get('BACKEND')
+    if backend:
+        return import_string(backend)()
+    if connections['default'].vendor == 'sqlite':
+        return SQLiteFTS5Backend()
+    return LikeSearchBackend()
+
+
+def search(model, query, limit=20):
+    """Ranked search returning model instances, best match first."""
+    hits = get_search_backend().search(model, query, limit)
+    objects = model._default_manager.in_bulk([pk for pk, _ in hits])
+    return [objects[pk] for pk, _ in hits if pk in objects]
+
+
+def index_objects(model, pks, using='default'):
+    """Refresh the index for rows of ``model`` written without save() or delete(): bulk_create, update(), raw SQL.
+
+    Rows that no longer exist leave the index, and rows whose indexed text includes them are refreshed too.
+    """
+    pks = list(pks)
+    if not pks:
+        return
+    backend = get_search_backend()
+    if model in INDEXES:
+        backend.index(INDEXES[model], pks, using)
+    for spec in INDEXES.values():
+        lookup = spec.dependencies.get(model)
+        if lookup:
+            backend.index(spec, spec.model._default_manager.using(using).filter(**{f'{lookup}__in': pks})
+                          .values_list('pk', flat=True), using)
+
+
+def rebuild_index(models=None, using='default'):
+    backend = get_search_backend()
+    for model, spec in INDEXES.items():
+        if models is None or model in models:
+            backend.rebuild(spec, using)
+
+
+class FullTextSearchAdminMixin:
+    """Serves changelist searches from the full-text index instead of LIKE '%term%' joins."""
+
+    def get_search_results(self, request, queryset, search_term):
+        backend = get_search_backend()
+        if not search_term or not backend.supports(queryset.model):
+            return super().get_search_results(request, queryset, search_term)
+        return backend.filter_queryset(queryset, search_term), False
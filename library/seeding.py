@@ -0,0 +1,294 @@
+import datetime
+import random
+
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (Author, AuthorDetail, Book, Borrow, Category, Event, EventParticipant, Library, Member,
+                     Post, Review)
+
+WORDS = ("ancient archive autumn border bridge captain castle city code crown dark desert dragon dream "
+         "empire engine forest garden ghost glass harbor hidden iron island journey kingdom letter light "
+         "machine memory midnight mirror moon mountain night ocean orchard paper queen river road secret "
+         "shadow silver song star stone storm summer sword tide tower valley voyage war winter wolf").split()
+FIRST_NAMES = ("Ada Alan Alice Anna Ben Clara David Eva Frank Grace Hana Ivan Jane John Kate Leo Lucy Mark "
+               "Maya Nina Omar Paul Rosa Sam Sara Tom Vera Will Yuki Zoe").split()
+LAST_NAMES = ("Adams Baker Brown Chen Clark Davis Evans Garcia Green Hall Harris Ivanov Jones Khan Kim Lee "
+              "Lopez Martin Miller Moore Nguyen Novak Patel Smith Taylor Walker White Wilson Young").split()
+
+
+class ScalePlan:
+    """Row counts for every model, derived from the number of members."""
+
+    def __init__(self, scale):
+        self.members = max(scale, 10)
+        self.libraries = max(self.members // 2000, 2)
+        self.categories = 20
+        self.authors = max(self.members // 10, 5)
+        self.books = max(self.members // 2, 10)
+        self.borrows_per_member = 10
+        self.reviews_per_member = 2
+        self.posts = max(self.members // 4, 5)
+        self.events = max(self.members // 200, 3)
+        self.participants_per_event = min(40, self.members)
+
+    @property
+    def borrows(self):
+        return self.members * self.borrows_per_member
+
+    def as_dict(self):
+        return {
+            'libraries': self.libraries, 'categories': self.categories, 'authors': self.authors,
+            'author_details': self.authors, 'books': self.books, 'members': self.members,
+            'borrows': self.borrows, 'reviews': self.members * self.reviews_per_member, 'posts': self.posts,
+            'events': self.events, 'event_participants': self.events * self.participants_per_event,
+        }
+
+
+class BulkWriter:
+    """Inserts rows given as dicts with executemany, filling omitted columns with field defaults.
+
+    The primary key column is written only when the first row provides it.
+    """
+
+    def __init__(self, model, using='default', batch_size=20000):
+        self.model = model
+        self.connection = connections[using]
+        self.batch_size = batch_size
+        self.written = 0
+
+    def _prepare(self, first_row):
+        pk_name = self.model._meta.pk.attname
+        self.fields = [field for field in self.model._meta.concrete_fields
+                       if field.attname != pk_name or pk_name in first_row]
+        self.defaults = {field.attname: field.get_default() for field in self.fields if field.has_default()}
+        quote = self.connection.ops.quote_name
+        columns = ', '.join(quote(field.column) for field in self.fields)
+        placeholders = ', '.join(['%s'] * len(self.fields))
+        self.sql = f'INSERT INTO {quote(self.model._meta.db_table)} ({columns}) VALUES ({placeholders})'
+
+    def write(self, rows):
+        batch = []
+        with self.connection.cursor() as cursor:
+            for row in rows:
+                if not batch and not self.written:
+                    self._prepare(row)
+                values = []
+                for field in self.fields:
+                    value = row[field.attname] if field.attname in row else self.defaults.get(field.attname)
+                    values.append(field.get_db_prep_save(value, self.connection))
+                batch.append(values)
+                if len(batch) >= self.batch_size:
+                    cursor.executemany(self.sql, batch)
+                    self.written += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(self.sql, batch)
+                self.written += len(batch)
+        return self.written
+
+
+def next_id(model):
+    return (model._default_manager.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+class LibrarySeeder:
+    """Generates a reproducible, realistically shaped dataset for every library model."""
+
+    def __init__(self, scale, seed=0, using='default', progress=None):
+        self.plan = ScalePlan(scale)
+        self.rng = random.Random(seed)
+        self.using = using
+        self.progress = progress or (lambda name, count: None)
+        self.today = timezone.localdate()
+
+    def run(self):
+        for step in (self.seed_libraries, self.seed_categories, self.seed_authors, self.seed_books,
+                     self.seed_members, self.seed_borrows, self.seed_reviews, self.seed_posts,
+                     self.seed_events):
+            with transaction.atomic(using=self.using):
+                step()
+        connection = connections[self.using]
+        models = [Library, Category, Author, AuthorDetail, Book, Member, Borrow, Review, Post, Event,
+                  EventParticipant, Book.libraries.through, Member.libraries.through, Event.books.through]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+
+    def _insert(self, model, rows, name=None):
+        written = BulkWriter(model, self.using).write(rows)
+        self.progress(name or model._meta.verbose_name_plural, written)
+
+    def _date(self, start_year, end_year):
+        start = datetime.date(start_year, 1, 1).toordinal()
+        return datetime.date.fromordinal(self.rng.randint(start, datetime.date(end_year, 12, 28).toordinal()))
+
+    def _removed_at(self):
+        # Soft deletions and deactivations spread over the last three years, so some are old enough to archive.
+        return timezone.now() - datetime.timedelta(days=self.rng.randrange(3 * 365), seconds=self.rng.randrange(86400))
+
+    def seed_libraries(self):
+        self.library_start = next_id(Library)
+        self._insert(Library, ({
+            'id': self.library_start + i,
+            'name': f"{self.rng.choice(WORDS).title()} Library {i}",
+            'location': f"{self.rng.choice(WORDS).title()} Street {i}",
+        } for i in range(self.plan.libraries)))
+
+    def seed_categories(self):
+        self.category_start = next_id(Category)
+        self._insert(Category, ({
+            'id': self.category_start + i, 'name': f"{WORDS[i % len(WORDS)].title()} {self.category_start + i}",
+        } for i in range(self.plan.categories)))
+
+    def seed_authors(self):
+        self.author_start = next_id(Author)
+        rng = self.rng
+
+        def authors():
+            for i in range(self.plan.authors):
+                deleted = rng.random() < 0.02
+                yield {
+                    'id': self.author_start + i,
+                    'first_name': rng.choice(FIRST_NAMES),
+                    'last_name': rng.choice(LAST_NAMES),
+                    'birth_date': self._date(1900, 1995),
+                    'deleted': deleted,
+                    'deleted_at': self._removed_at() if deleted else None,
+                    'rating': rng.randint(1, 10),
+                }
+
+        self._insert(Author, authors())
+        self._insert(AuthorDetail, ({
+            'author_id': self.author_start + i,
+            'biography': ' '.join(rng.choices(WORDS, k=30)),
+            'birth_city': rng.choice(WORDS).title(),
+            'gender': rng.choice(AuthorDetail.GENDER_CHOICES)[0],
+        } for i in range(self.plan.authors)))
+
+    def seed_books(self):
+        self.book_start = next_id(Book)
+        rng = self.rng
+        genres = [choice for choice, _ in Book.GENRE_CHOICES]
+        self._insert(Book, ({
+            'id': self.book_start + i,
+            'title': f"{' '.join(rng.choices(WORDS, k=3)).title()} {i}",
+            # Author popularity is skewed: a few authors write many books.
+            'author_id': self.author_start + min(int(rng.paretovariate(1.2)) - 1, self.plan.authors - 1),
+            'publishing_date': self._date(1900, 2024),
+            'summary': ' '.join(rng.choices(WORDS, k=40)),
+            'genre': rng.choice(genres),
+            'page_count': rng.randint(80, 1200),
+            'category_id': self.category_start + rng.randrange(self.plan.categories),
+        } for i in range(self.plan.books)))
+        through = Book.libraries.through
+        self._insert(through, ({
+            'book_id': self.book_start + i,
+            'library_id': self.library_start + library,
+            'copies': rng.randint(1, 3),
+        } for i in range(self.plan.books)
+            for library in rng.sample(range(self.plan.libraries), min(self.plan.libraries, rng.randint(1, 3)))),
+            name='book holdings')
+
+    def seed_members(self):
+        self.member_start = next_id(Member)
+        rng = self.rng
+        genders = [choice for choice, _ in Member.GENDER_CHOICES]
+
+        def members():
+            for i in range(self.plan.members):
+                age = rng.randint(8, 90)
+                active = rng.random() < 0.9
+                yield {
+                    'id': self.member_start + i,
+                    'first_name': rng.choice(FIRST_NAMES),
+                    'last_name': rng.choice(LAST_NAMES),
+                    'email': f"member{self.member_start + i}@example.org",
+                    'gender': rng.choice(genders),
+                    'birth_date': self.today - datetime.timedelta(days=age * 365 + rng.randrange(365)),
+                    'age': age,
+                    'role': 'Staff' if rng.random() < 0.01 else 'Reader',
+                    'active': active,
+                    'deactivated_at': None if active else self._removed_at(),
+                }
+
+        self._insert(Member, members())
+        self._insert(Member.libraries.through, ({
+            'member_id': self.member_start + i,
+            'library_id': self.library_start + rng.randrange(self.plan.libraries),
+        } for i in range(self.plan.members)), name='memberships')
+
+    def seed_borrows(self):
+        rng = self.rng
+        plan = self.plan
+        start = self.today - datetime.timedelta(days=30 * plan.borrows_per_member)
+
+        def borrows():
+            # Round n of every member falls in its own 30-day window, so (member, book, borrow_date) stays unique.
+            for round_ in range(plan.borrows_per_member):
+                for i in range(plan.members):
+                    borrow_date = start + datetime.timedelta(days=30 * round_ + rng.randrange(30))
+                    return_date = borrow_date + datetime.timedelta(days=21)
+                    returned = return_date < self.today and rng.random() < 0.95
+                    yield {
+                        'member_id': self.member_start + i,
+                        'book_id': self.book_start + int(rng.paretovariate(1.1)) % plan.books,
+                        'library_id': self.library_start + rng.randrange(plan.libraries),
+                        'borrow_date': borrow_date,
+                        'return_date': return_date,
+                        'returned': returned,
+                    }
+
+        self._insert(Borrow, borrows())
+
+    def seed_reviews(self):
+        rng = self.rng
+        self._insert(Review, ({
+            'book_id': self.book_start + rng.randrange(self.plan.books),
+            'reviewer_id': self.member_start + i % self.plan.members,
+            'rating': float(rng.randint(1, 5)),
+            'description': ' '.join(rng.choices(WORDS, k=20)),
+            'created_at': self._date(2015, self.today.year),
+        } for i in range(self.plan.members * self.plan.reviews_per_member)))
+
+    def seed_posts(self):
+        rng = self.rng
+        now = timezone.now()
+        self._insert(Post, ({
+            'title': f"{' '.join(rng.choices(WORDS, k=4)).title()} {i}",
+            'body': ' '.join(rng.choices(WORDS, k=80)),
+            'author_id': self.member_start + rng.randrange(self.plan.members),
+            'moderated': rng.random() < 0.8,
+            'library_id': self.library_start + rng.randrange(self.plan.libraries),
+            'created_at': self._date(2015, self.today.year),
+            'updated_at': now,
+        } for i in range(self.plan.posts)))
+
+    def seed_events(self):
+        rng = self.rng
+        plan = self.plan
+        event_start = next_id(Event)
+        self._insert(Event, ({
+            'id': event_start + i,
+            'title': f"{' '.join(rng.choices(WORDS, k=2)).title()} Talk {i}",
+            'description': ' '.join(rng.choices(WORDS, k=30)),
+            'date': timezone.make_aware(datetime.datetime.combine(self._date(2015, self.today.year + 1),
+                                                                  datetime.time(18))),
+            'library_id': self.library_start + rng.randrange(plan.libraries),
+            'capacity': rng.choice([None, plan.participants_per_event, 2 * plan.participants_per_event]),
+            'admitted_count': plan.participants_per_event,
+        } for i in range(plan.events)))
+        self._insert(Event.books.through, ({
+            'event_id': event_start + i,
+            'book_id': self.book_start + book,
+        } for i in range(plan.events) for book in rng.sample(range(plan.books), min(3, plan.books))),
+            name='event books')
+        self._insert(EventParticipant, ({
+            'event_id': event_start + i,
+            'member_id': self.member_start + member,
+            'registration_date': self._date(2015, self.today.year),
+            'status': EventParticipant.ADMITTED,
+        } for i in range(plan.events)
+            for member in rng.sample(range(plan.members), plan.participants_per_event)))
@@ -0,0 +1,405 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .analytics import log_borrow_changes
+from .audit import diff, record
+from .caching import (book_library_ids, invalidate_author_books, invalidate_feeds, invalidate_holdings,
+                      invalidate_objects)
+from .dashboard import bump_daily, bump_due, bump_library, refresh_top_rated_for_book
+from .inventory import bump_available, refresh_availability
+from .models import (Author, Book, Borrow, Category, Event, EventParticipant, Holding, Library, Member, Post,
+                     Review)
+from .ratings import apply_review_delta, recompute_book_ratings
+from .recommendations import mark_stale
+from .registrations import promote_waitlist
+from .search import INDEXES, get_search_backend
+
+
+@receiver(post_save, sender=Review, dispatch_uid='library_review_saved_rating')
+def update_rating_on_review_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    old_book_id = instance.loaded_value('book_id')
+    old_rating = instance.loaded_value('rating')
+    invalidate_objects(Book, {old_book_id, instance.book_id} - {None}, using)
+    if created:
+        apply_review_delta(instance.book_id, instance.rating, 1)
+    elif old_book_id is None or old_rating is None:
+        # An existing row saved without its loaded values (a fresh instance given its pk, or a deferred rating):
+        # there is no delta to apply.
+        recompute_book_ratings(Book.objects.filter(pk__in={old_book_id, instance.book_id} - {None}))
+    elif old_book_id != instance.book_id:
+        apply_review_delta(old_book_id, -old_rating, -1)
+        apply_review_delta(instance.book_id, instance.rating, 1)
+    elif old_rating != instance.rating:
+        apply_review_delta(instance.book_id, instance.rating - old_rating, 0)
+
+
+@receiver(post_delete, sender=Review, dispatch_uid='library_review_deleted_rating')
+def update_rating_on_review_delete(sender, instance, using='default', **kwargs):
+    book_id = instance.loaded_value('book_id') or instance.book_id
+    rating = instance.loaded_value('rating')
+    if rating is None:
+        rating = instance.rating
+    apply_review_delta(book_id, -rating, -1)
+    invalidate_objects(Book, [book_id], using)
+
+
+def _search_dependents(sender, pk, using):
+    for spec in INDEXES.values():
+        lookup = spec.dependencies.get(sender)
+        if lookup:
+            yield spec, list(spec.model._default_manager.using(using).filter(**{lookup: pk})
+                             .values_list('pk', flat=True))
+
+
+def update_search_index_on_save(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    backend = get_search_backend()
+    if sender in INDEXES:
+        backend.index(INDEXES[sender], [instance.pk], using)
+    for spec, pks in _search_dependents(sender, instance.pk, using):
+        backend.index(spec, pks, using)
+
+
+def collect_search_dependents_on_delete(sender, instance, using='default', **kwargs):
+    instance._search_dependents = list(_search_dependents(sender, instance.pk, using))
+
+
+def update_search_index_on_delete(sender, instance, using='default', **kwargs):
+    backend = get_search_backend()
+    if sender in INDEXES:
+        backend.remove(INDEXES[sender], [instance.pk], using)
+    for spec, pks in getattr(instance, '_search_dependents', []):
+        backend.index(spec, pks, using)
+
+
+for _model in {*INDEXES, *(model for spec in INDEXES.values() for model in spec.dependencies)}:
+    post_save.connect(update_search_index_on_save, sender=_model,
+                      dispatch_uid=f'library_search_save_{_model.__name__}')
+    pre_delete.connect(collect_search_dependents_on_delete, sender=_model,
+                       dispatch_uid=f'library_search_pre_delete_{_model.__name__}')
+    post_delete.connect(update_search_index_on_delete, sender=_model,
+                        dispatch_uid=f'library_search_delete_{_model.__name__}')
+
+
+def create_search_indexes(sender, using='default', **kwargs):
+    backend = get_search_backend()
+    for spec in INDEXES.values():
+        backend.create_index(spec, using)
+
+
+AUDITED_MODELS = [Author, Book, Borrow, Member]
+
+
+def audit_on_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    action = 'create' if created else 'update'
+    changes = diff(instance, action)
+    if changes:
+        record(sender, {instance.pk: changes}, action, using)
+
+
+def audit_on_delete(sender, instance, using='default', **kwargs):
+    record(sender, {instance.pk: diff(instance, 'delete')}, 'delete', using)
+
+
+for _model in AUDITED_MODELS:
+    post_save.connect(audit_on_save, sender=_model, dispatch_uid=f'library_audit_save_{_model.__name__}')
+    post_delete.connect(audit_on_delete, sender=_model, dispatch_uid=f'library_audit_delete_{_model.__name__}')
+
+
+CACHED_MODELS = [Author, Book, Category, Library]
+
+
+def invalidate_cache_on_save(sender, instance, raw=False, using='default', **kwargs):
+    invalidate_objects(sender, [instance.pk], using)
+    if sender is Book:
+        invalidate_author_books({instance.author_id, instance.loaded_value('author_id')} - {None}, using)
+    if sender is Book and not kwargs.get('created'):
+        invalidate_holdings(book_library_ids([instance.pk], using), using)
+
+
+def collect_holdings_on_delete(sender, instance, using='default', **kwargs):
+    instance._cached_library_ids = book_library_ids([instance.pk], using)
+
+
+def invalidate_cache_on_delete(sender, instance, using='default', **kwargs):
+    invalidate_objects(sender, [instance.pk], using)
+    if sender is Book:
+        invalidate_author_books([instance.author_id] if instance.author_id else [], using)
+    invalidate_holdings(getattr(instance, '_cached_library_ids', ()), using)
+
+
+for _model in CACHED_MODELS:
+    post_save.connect(invalidate_cache_on_save, sender=_model, dispatch_uid=f'library_cache_save_{_model.__name__}')
+    post_delete.connect(invalidate_cache_on_delete, sender=_model,
+                        dispatch_uid=f'library_cache_delete_{_model.__name__}')
+pre_delete.connect(collect_holdings_on_delete, sender=Book, dispatch_uid='library_cache_pre_delete_Book')
+
+
+@receiver(m2m_changed, sender=Book.libraries.through, dispatch_uid='library_cache_book_libraries')
+def invalidate_holdings_on_m2m_change(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        invalidate_holdings([instance.pk], using)
+    elif action == 'pre_clear':
+        invalidate_holdings(book_library_ids([instance.pk], using), using)
+    else:
+        invalidate_holdings(pk_set, using)
+
+
+def _is_open(returned):
+    return returned is False
+
+
+@receiver(post_save, sender=Borrow, dispatch_uid='library_stats_borrow_saved')
+def update_stats_on_borrow_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if created:
+        old_library_id, old_return_date, old_returned = None, None, None
+    else:
+        old_library_id = instance.loaded_value('library_id')
+        old_return_date = instance.loaded_value('return_date')
+        old_returned = instance.loaded_value('returned')
+    state = (instance.library_id, instance.return_date, instance.returned)
+    if (old_library_id, old_return_date, old_returned) == state:
+        return
+    if _is_open(old_returned):
+        bump_library(old_library_id, using, open_loans=-1)
+        bump_due(old_library_id, old_return_date, -1, using)
+    if not instance.returned:
+        bump_library(instance.library_id, using, open_loans=1)
+        bump_due(instance.library_id, instance.return_date, 1, using)
+    if created:
+        bump_daily(instance.library_id, instance.borrow_date, using, loans_started=1)
+    elif old_returned is False and instance.returned:
+        bump_daily(instance.library_id, timezone.localdate(), using, loans_returned=1)
+
+
+@receiver(post_delete, sender=Borrow, dispatch_uid='library_stats_borrow_deleted')
+def update_stats_on_borrow_delete(sender, instance, using='default', **kwargs):
+    if not instance.returned:
+        bump_library(instance.library_id, using, open_loans=-1)
+        bump_due(instance.library_id, instance.return_date, -1, using)
+
+
+@receiver(post_save, sender=Borrow, dispatch_uid='library_inventory_borrow_saved')
+def update_availability_on_borrow_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    old = None if created or instance.loaded_value('returned') is not False else \
+        (instance.loaded_value('library_id'), instance.loaded_value('book_id'))
+    new = None if instance.returned else (instance.library_id, instance.book_id)
+    if old != new:
+        if old:
+            bump_available(*old, 1, using)
+        if new:
+            bump_available(*new, -1, using)
+
+
+@receiver(post_delete, sender=Borrow, dispatch_uid='library_inventory_borrow_deleted')
+def update_availability_on_borrow_delete(sender, instance, using='default', **kwargs):
+    if not instance.returned:
+        bump_available(instance.library_id, instance.book_id, 1, using)
+
+
+@receiver(post_save, sender=Borrow, dispatch_uid='library_analytics_borrow_saved')
+def log_borrow_change_on_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if not raw:
+        log_borrow_changes([instance.pk], using)
+
+
+@receiver(post_delete, sender=Borrow, dispatch_uid='library_analytics_borrow_deleted')
+def log_borrow_change_on_delete(sender, instance, using='default', **kwargs):
+    log_borrow_changes([instance.pk], using)
+
+
+@receiver(post_save, sender=Holding, dispatch_uid='library_inventory_holding_saved')
+def update_availability_on_holding_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if created:
+        refresh_availability(Holding.objects.using(using).filter(pk=instance.pk))
+    elif instance.copies != instance.loaded_value('copies'):
+        Holding.objects.using(using).filter(pk=instance.pk) \
+            .update(available=F('available') + instance.copies - instance.loaded_value('copies'))
+
+
+@receiver(m2m_changed, sender=Book.libraries.through, dispatch_uid='library_inventory_book_libraries')
+def update_availability_on_holding_add(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    # add() creates holdings with bulk_create, so loans already open at the library are counted here.
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        holdings = Holding.objects.using(using).filter(library_id=instance.pk, book_id__in=pk_set)
+    else:
+        holdings = Holding.objects.using(using).filter(book_id=instance.pk, library_id__in=pk_set)
+    refresh_availability(holdings)
+
+
+@receiver(post_save, sender=Post, dispatch_uid='library_stats_post_saved')
+def update_stats_on_post_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if created:
+        bump_library(instance.library_id, using, post_count=1)
+        bump_daily(instance.library_id, instance.created_at, using, posts_created=1)
+    elif instance.loaded_value('library_id') not in (None, instance.library_id):
+        bump_library(instance.loaded_value('library_id'), using, post_count=-1)
+        bump_library(instance.library_id, using, post_count=1)
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='library_stats_post_deleted')
+def update_stats_on_post_delete(sender, instance, using='default', **kwargs):
+    bump_library(instance.library_id, using, post_count=-1)
+
+
+@receiver(post_save, sender=Post, dispatch_uid='library_feed_post_saved')
+def invalidate_feed_on_post_save(sender, instance, created, raw=False, using='default', **kwargs):
+    # Posts waiting for moderation are not in any feed, so editing them leaves the cached pages alone.
+    if instance.moderated or instance.loaded_value('moderated'):
+        invalidate_feeds({instance.library_id, instance.loaded_value('library_id')} - {None}, using)
+
+
+@receiver(post_delete, sender=Post, dispatch_uid='library_feed_post_deleted')
+def invalidate_feed_on_post_delete(sender, instance, using='default', **kwargs):
+    if instance.moderated:
+        invalidate_feeds([instance.library_id], using)
+
+
+@receiver(post_save, sender=EventParticipant, dispatch_uid='library_stats_participant_saved')
+def update_stats_on_registration(sender, instance, created, raw=False, using='default', **kwargs):
+    if created and not raw:
+        bump_daily(instance.event.library_id, instance.registration_date, using, event_registrations=1)
+
+
+def _member_library_ids(member_id, using):
+    return list(Member.libraries.through.objects.using(using).filter(member_id=member_id)
+                .values_list('library_id', flat=True))
+
+
+@receiver(post_save, sender=Member, dispatch_uid='library_stats_member_saved')
+def update_stats_on_member_save(sender, instance, created, raw=False, using='default', **kwargs):
+    old_active = instance.loaded_value('active')
+    if raw or created or old_active is None or old_active == instance.active:
+        return
+    for library_id in _member_library_ids(instance.pk, using):
+        bump_library(library_id, using, active_members=1 if instance.active else -1)
+
+
+@receiver(pre_delete, sender=Member, dispatch_uid='library_stats_member_pre_delete')
+def collect_member_libraries(sender, instance, using='default', **kwargs):
+    instance._stats_library_ids = _member_library_ids(instance.pk, using) if instance.active else []
+
+
+@receiver(post_delete, sender=Member, dispatch_uid='library_stats_member_deleted')
+def update_stats_on_member_delete(sender, instance, using='default', **kwargs):
+    for library_id in getattr(instance, '_stats_library_ids', []):
+        bump_library(library_id, using, active_members=-1)
+
+
+def _membership_changes(through, source, target, instance, action, reverse, pk_set, using, counted):
+    """Per-library deltas for an m2m_changed signal on a <source>-Library relation.
+
+    ``counted`` narrows a set of source ids to those that count towards the statistic.
+    """
+    links = through.objects.using(using)
+    if action == 'pre_remove':
+        lookup = {f'{target}_id': instance.pk, f'{source}_id__in': pk_set} if reverse else \
+            {f'{source}_id': instance.pk, f'{target}_id__in': pk_set}
+        instance._stats_removed = set(links.filter(**lookup).values_list(
+            f'{source}_id' if reverse else f'{target}_id', flat=True))
+        return {}
+    if action == 'pre_clear':
+        lookup = {f'{target}_id': instance.pk} if reverse else {f'{source}_id': instance.pk}
+        pks = set(links.filter(**lookup).values_list(f'{source}_id' if reverse else f'{target}_id', flat=True))
+        sign = -1
+    elif action == 'post_remove':
+        pks, sign = getattr(instance, '_stats_removed', set()), -1
+    elif action == 'post_add':
+        pks, sign = pk_set, 1
+    else:
+        return {}
+    if reverse:
+        return {instance.pk: sign * len(counted(pks))}
+    return {library_id: sign for library_id in pks} if counted({instance.pk}) else {}
+
+
+@receiver(m2m_changed, sender=Member.libraries.through, dispatch_uid='library_stats_member_libraries')
+def update_stats_on_membership_change(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    def active(member_ids):
+        return set(Member.objects.using(using).filter(pk__in=member_ids).values_list('pk', flat=True))
+
+    for library_id, delta in _membership_changes(sender, 'member', 'library', instance, action, reverse,
+                                                 pk_set, using, active).items():
+        bump_library(library_id, using, active_members=delta)
+
+
+@receiver(m2m_changed, sender=Book.libraries.through, dispatch_uid='library_stats_book_libraries')
+def update_stats_on_holding_add(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    # add() bulk-creates holdings without post_save; removals delete Holding rows and reach the handler below.
+    if action != 'post_add':
+        return
+    for library_id, delta in _membership_changes(sender, 'book', 'library', instance, action, reverse,
+                                                 pk_set, using, set).items():
+        bump_library(library_id, using, books_held=delta)
+
+
+@receiver(post_save, sender=Holding, dispatch_uid='library_stats_holding_saved')
+def update_stats_on_holding_save(sender, instance, created, raw=False, using='default', **kwargs):
+    if created and not raw:
+        bump_library(instance.library_id, using, books_held=1)
+        invalidate_holdings([instance.library_id], using)
+
+
+@receiver(post_delete, sender=Holding, dispatch_uid='library_stats_holding_deleted')
+def update_stats_on_holding_delete(sender, instance, using='default', **kwargs):
+    bump_library(instance.library_id, using, books_held=-1)
+    invalidate_holdings([instance.library_id], using)
+
+
+@receiver(post_save, sender=Review, dispatch_uid='library_stats_review_saved')
+@receiver(post_delete, sender=Review, dispatch_uid='library_stats_review_deleted')
+def refresh_top_rated_on_review_change(sender, instance, using='default', **kwargs):
+    if kwargs.get('raw'):
+        return
+    for book_id in {instance.loaded_value('book_id'), instance.book_id} - {None}:
+        refresh_top_rated_for_book(book_id, using)
+
+
+@receiver(post_save, sender=Borrow, dispatch_uid='library_recommendations_borrow_saved')
+@receiver(post_delete, sender=Borrow, dispatch_uid='library_recommendations_borrow_deleted')
+def mark_recommendations_on_borrow_change(sender, instance, using='default', **kwargs):
+    if kwargs.get('raw'):
+        return
+    old = (instance.loaded_value('member_id'), instance.loaded_value('book_id'))
+    if kwargs.get('created') is False and old == (instance.member_id, instance.book_id):
+        return
+    mark_stale({old[1], instance.book_id}, {old[0], instance.member_id}, using)
+
+
+@receiver(post_save, sender=Review, dispatch_uid='library_recommendations_review_saved')
+@receiver(post_delete, sender=Review, dispatch_uid='library_recommendations_review_deleted')
+def mark_recommendations_on_review_change(sender, instance, using='default', **kwargs):
+    if kwargs.get('raw'):
+        return
+    old = (instance.loaded_value('book_id'), instance.loaded_value('rating'))
+    if kwargs.get('created') is False and old == (instance.book_id, instance.rating):
+        return
+    mark_stale({old[0], instance.book_id}, (), using)
+
+
+@receiver(post_save, sender=Event, dispatch_uid='library_registrations_event_saved')
+def promote_waitlist_on_capacity_change(sender, instance, created, raw=False, using='default', **kwargs):
+    if raw or created:
+        return
+    old, new = instance.loaded_value('capacity'), instance.capacity
+    if old is not None and (new is None or new > old):
+        promote_waitlist(instance.pk, using)
@@ -0,0 +1,362 @@
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from . import analytics
+from .caching import get_cache
+from .search import INDEXES, index_objects
+
+DEFAULTS = {
+    'DIRECTORY': None,
+    'PAGES_PER_STEP': 1024,
+    'STEP_PAUSE': 0.005,
+    'COMPRESS_LEVEL': 1,
+}
+
+MARKS_FILE = 'marks.json'
+COPY_BUFFER = 1024 * 1024
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'LIBRARY_SNAPSHOTS', {})}
+
+
+@dataclass(frozen=True)
+class SnapshotResult:
+    """What a snapshot, incremental export or restore wrote: ``size`` database bytes, ``stored`` file bytes."""
+
+    path: Path
+    size: int
+    stored: int
+    seconds: float
+    rows: int = 0
+    violations: int = 0
+
+    @property
+    def throughput(self):
+        """Database megabytes per second."""
+        return self.size / 1e6 / self.seconds if self.seconds else 0.0
+
+
+def _database_path(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise SnapshotError("Snapshots need an SQLite database.")
+    name = str(connection.settings_dict['NAME'])
+    if name == ':memory:' or 'mode=memory' in name:
+        raise SnapshotError("An in-memory database cannot be snapshotted.")
+    return name
+
+
+def _connect(path, **kwargs):
+    return sqlite3.connect(path, uri=str(path).startswith('file:'), isolation_level=None, **kwargs)
+
+
+def _stamp():
+    return timezone.now().strftime('%Y%m%dT%H%M%S%f')
+
+
+def _rowid_tables(cursor, schema='main'):
+    """Ordinary tables of ``schema`` that have a rowid, the key incremental exports are taken on."""
+    cursor.execute(f'PRAGMA {schema}.table_list')
+    return [name for _, name, kind, _, without_rowid, _ in cursor.fetchall()
+            if kind == 'table' and not without_rowid and not name.startswith('sqlite_')]
+
+
+def _columns(cursor, schema, table):
+    cursor.execute(f'PRAGMA {schema}.table_info("{table}")')
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _high_water_marks(cursor, tables):
+    marks = {}
+    for table in tables:
+        cursor.execute(f'SELECT MAX(rowid) FROM main."{table}"')
+        marks[table] = cursor.fetchone()[0] or 0
+    return marks
+
+
+def _store(work, destination, compress_level):
+    """Move the finished database ``work`` to ``destination``, gzip-compressed when ``compress_level`` is set."""
+    if compress_level:
+        temporary = destination.with_name(f'.{destination.name}.tmp')
+        with open(work, 'rb') as source, gzip.open(temporary, 'wb', compresslevel=compress_level) as target:
+            shutil.copyfileobj(source, target, COPY_BUFFER)
+        os.replace(temporary, destination)
+        os.unlink(work)
+    else:
+        os.replace(work, destination)
+    return destination.stat().st_size
+
+
+def _write_marks(directory, snapshot, marks):
+    temporary = directory / f'.{MARKS_FILE}.tmp'
+    temporary.write_text(json.dumps({'snapshot': snapshot, 'marks': marks}))
+    os.replace(temporary, directory / MARKS_FILE)
+
+
+def read_marks(directory):
+    """Primary-key high-water mark per table left by the last snapshot or incremental export in ``directory``."""
+    try:
+        return json.loads((Path(directory) / MARKS_FILE).read_text())
+    except FileNotFoundError:
+        raise SnapshotError(f"{directory} holds no snapshot; take a full snapshot first.") from None
+
+
+def _directory(directory):
+    directory = directory or get_config()['DIRECTORY']
+    if not directory:
+        raise SnapshotError("No snapshot directory: pass one or set LIBRARY_SNAPSHOTS['DIRECTORY'].")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def _size(connection, schema='main'):
+    page_count = connection.execute(f'PRAGMA {schema}.page_count').fetchone()[0]
+    return page_count * connection.execute(f'PRAGMA {schema}.page_size').fetchone()[0]
+
+
+def snapshot(directory=None, compress=True, pages=None, pause=None, using='default'):
+    """Copy the live database into ``directory`` with SQLite's online backup API.
+
+    The copy advances ``pages`` pages per step and sleeps ``pause`` seconds between steps, so writers are
+    never locked out for long. In WAL mode the copy reads one consistent version of the database while
+    writers carry on; otherwise a write from another connection restarts it. The primary-key high-water
+    marks of the copy are recorded for later incremental exports.
+    """
+    config = get_config()
+    directory = _directory(directory)
+    pages = pages or config['PAGES_PER_STEP']
+    pause = config['STEP_PAUSE'] if pause is None else pause
+    compress_level = config['COMPRESS_LEVEL'] if compress else 0
+    name = f"snapshot-{_stamp()}.sqlite3{'.gz' if compress_level else ''}"
+    work = directory / f'.{name}.work'
+    started = time.perf_counter()
+    source = _connect(_database_path(using), timeout=30)
+    try:
+        if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal':
+            # A read transaction pins one version of the database: writers keep appending to the WAL
+            # instead of restarting the copy, which could otherwise never finish under steady writes.
+            source.execute('BEGIN')
+            source.execute('SELECT COUNT(*) FROM sqlite_master')
+        target = _connect(work)
+        try:
+            source.backup(target, pages=pages, sleep=pause)
+            cursor = target.cursor()
+            marks = _high_water_marks(cursor, _rowid_tables(cursor))
+            size = _size(target)
+        finally:
+            target.close()
+    except BaseException:
+        Path(work).unlink(missing_ok=True)
+        raise
+    finally:
+        source.close()
+    path = directory / name
+    stored = _store(work, path, compress_level)
+    _write_marks(directory, name, marks)
+    return SnapshotResult(path, size, stored, time.perf_counter() - started)
+
+
+def export_increment(directory=None, tables=None, compress=True, using='default'):
+    """Export rows added since the last snapshot or export in ``directory`` into a small SQLite file.
+
+    Each table keeps a primary-key high-water mark, so an export carries only rows inserted after the
+    previous one: the right fit for append-mostly tables such as borrows, reviews, posts and the audit log.
+    Rows updated or deleted in place are only captured by the next full snapshot.
+    """
+    config = get_config()
+    directory = _directory(directory)
+    state = read_marks(directory)
+    marks = state['marks']
+    compress_level = config['COMPRESS_LEVEL'] if compress else 0
+    name = f"increment-{_stamp()}.sqlite3{'.gz' if compress_level else ''}"
+    work = directory / f'.{name}.work'
+    started = time.perf_counter()
+    source = _connect(_database_path(using), timeout=30)
+    try:
+        cursor = source.cursor()
+        available = _rowid_tables(cursor)
+        unknown = set(tables or ()) - set(available)
+        if unknown:
+            raise SnapshotError(f"Unknown tables: {', '.join(sorted(unknown))}")
+        cursor.execute('ATTACH DATABASE ? AS increment', [str(work)])
+        # One read transaction, so every table is exported as of the same moment.
+        cursor.execute('BEGIN')
+        new_marks = _high_water_marks(cursor, tables or available)
+        rows = 0
+        for table, mark in new_marks.items():
+            since = marks.get(table, 0)
+            if mark <= since:
+                continue
+            cursor.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?", [table])
+            cursor.execute(cursor.fetchone()[0].replace('CREATE TABLE ', 'CREATE TABLE increment.', 1))
+            cursor.execute(f'INSERT INTO increment."{table}" SELECT * FROM main."{table}" '
+                           f'WHERE rowid > ? AND rowid <= ?', [since, mark])
+            rows += cursor.rowcount
+        cursor.execute('COMMIT')
+        cursor.execute('DETACH DATABASE increment')
+        size = os.path.getsize(work)
+    except BaseException:
+        source.close()
+        Path(work).unlink(missing_ok=True)
+        raise
+    source.close()
+    path = directory / name
+    stored = _store(work, path, compress_level)
+    _write_marks(directory, state['snapshot'], {**marks, **new_marks})
+    return SnapshotResult(path, size, stored, time.perf_counter() - started, rows=rows)
+
+
+def _unpack(path, directory):
+    """Path of a plain SQLite copy of the snapshot or increment at ``path``, decompressed into ``directory``."""
+    path = Path(path)
+    if not path.exists():
+        raise SnapshotError(f"{path} does not exist.")
+    if path.suffix != '.gz':
+        return path
+    work = Path(directory) / path.stem
+    with gzip.open(path, 'rb') as source, open(work, 'wb') as target:
+        shutil.copyfileobj(source, target, COPY_BUFFER)
+    return work
+
+
+def _load_snapshot(cursor):
+    """Create the tables of the attached snapshot in main, fill them and build their unique indexes.
+
+    Returns the rows loaded and the statements of the other indexes, triggers and views, left for the caller
+    to run once the increments are in.
+    """
+    cursor.execute('PRAGMA snapshot.table_list')
+    kinds = {name: kind for _, name, kind, *_ in cursor.fetchall()}
+    cursor.execute("SELECT type, name, sql FROM snapshot.sqlite_master WHERE sql IS NOT NULL ORDER BY rowid")
+    schema = cursor.fetchall()
+    unique, deferred = [], []
+    cursor.execute('BEGIN')
+    for kind, name, sql in schema:
+        if kind == 'index' and sql.startswith('CREATE UNIQUE INDEX'):
+            unique.append(sql)
+        elif kind != 'table':
+            deferred.append(sql)
+        elif kinds.get(name) in ('table', 'virtual') and not name.startswith('sqlite_'):
+            # Virtual tables create their own shadow tables, which are then filled like ordinary ones.
+            cursor.execute(sql)
+    rows = 0
+    for kind, name, sql in schema:
+        if kind == 'table' and kinds.get(name) in ('table', 'shadow') and not name.startswith('sqlite_'):
+            cursor.execute(f'INSERT OR REPLACE INTO main."{name}" SELECT * FROM snapshot."{name}"')
+            rows += cursor.rowcount
+    if 'sqlite_sequence' in kinds:
+        # AUTOINCREMENT counters, which may run ahead of the highest primary key left in the table.
+        cursor.execute('DELETE FROM main.sqlite_sequence')
+        cursor.execute('INSERT INTO main.sqlite_sequence SELECT * FROM snapshot.sqlite_sequence')
+    # Built before the increments, so that INSERT OR REPLACE replaces a row deleted and added again under the
+    # same unique key instead of leaving both.
+    for sql in unique:
+        cursor.execute(sql)
+    cursor.execute('COMMIT')
+    return rows, deferred
+
+
+def _searched_tables():
+    """Tables whose rows feed the full-text index, mapped to their model."""
+    return {model._meta.db_table: model
+            for spec in INDEXES.values() for model in [spec.model, *spec.dependencies]}
+
+
+def _apply_increment(cursor, path, restored):
+    """Copy the rows of the increment at ``path`` into main, adding the pks of searched models to ``restored``."""
+    cursor.execute('ATTACH DATABASE ? AS increment', [str(path)])
+    rows = 0
+    searched = _searched_tables()
+    cursor.execute('BEGIN')
+    for table in _rowid_tables(cursor, 'increment'):
+        present = set(_columns(cursor, 'main', table))
+        if not present:
+            continue
+        columns = ', '.join(f'"{column}"' for column in _columns(cursor, 'increment', table) if column in present)
+        cursor.execute(f'INSERT OR REPLACE INTO main."{table}" ({columns}) SELECT {columns} FROM increment."{table}"')
+        rows += cursor.rowcount
+        if table in searched:
+            cursor.execute(f'SELECT rowid FROM increment."{table}"')
+            restored[searched[table]].update(pk for pk, in cursor.fetchall())
+    cursor.execute('COMMIT')
+    cursor.execute('DETACH DATABASE increment')
+    return rows
+
+
+def restore(path, increments=(), pages=-1, using='default'):
+    """Replace the database with the snapshot at ``path`` and the ``increments`` exported after it, in order.
+
+    The data is bulk loaded into a scratch database with foreign keys, check constraints, journaling and
+    fsync switched off; unique indexes are built once the snapshot rows are in, the other indexes and
+    triggers after the increments, and foreign keys are checked at the end. The result is copied into the
+    live database with the backup API, which holds its write lock until the copy is done. Violations found
+    by the check are counted, not fixed. SQLite errors are raised as SnapshotError.
+
+    The snapshot carries its own full-text index; rows from the increments are indexed once the copy is in.
+    The read-through cache and the circulation analytics cache described the replaced database and are
+    dropped.
+    """
+    target_path = _database_path(using)
+    if 'mode=ro' in target_path:
+        raise SnapshotError("Cannot restore into a read-only database.")
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(dir=Path(target_path.removeprefix('file:').split('?')[0]).parent) as scratch:
+        unpacked = _unpack(path, scratch)
+        build = _connect(Path(scratch) / 'restore.sqlite3')
+        try:
+            cursor = build.cursor()
+            cursor.execute('ATTACH DATABASE ? AS snapshot', [f'file:{unpacked}?mode=ro'])
+            page_size = cursor.execute('PRAGMA snapshot.page_size').fetchone()[0]
+            # WAL databases only accept a backup with their own page size.
+            cursor.execute(f'PRAGMA main.page_size = {page_size}')
+            cursor.execute('PRAGMA main.journal_mode = OFF')
+            cursor.execute('PRAGMA main.synchronous = OFF')
+            cursor.execute('PRAGMA foreign_keys = OFF')
+            cursor.execute('PRAGMA ignore_check_constraints = ON')
+            rows, deferred = _load_snapshot(cursor)
+            cursor.execute('DETACH DATABASE snapshot')
+            restored = defaultdict(set)
+            for increment in increments:
+                rows += _apply_increment(cursor, _unpack(increment, scratch), restored)
+            cursor.execute('BEGIN')
+            for sql in deferred:
+                cursor.execute(sql)
+            cursor.execute('COMMIT')
+            violations = len(cursor.execute('PRAGMA foreign_key_check').fetchall())
+            size = _size(build)
+            connections[using].close()
+            target = _connect(target_path, timeout=30)
+            try:
+                build.backup(target, pages=pages)
+            finally:
+                target.close()
+        except sqlite3.Error as exc:
+            raise SnapshotError(f"Cannot restore {path}: {exc}") from exc
+        finally:
+            build.close()
+    for model, pks in restored.items():
+        index_objects(model, pks, using)
+    get_cache().clear()
+    cache_dir = analytics.get_config()['CACHE_DIR']
+    if cache_dir:
+        analytics.BorrowColumns(cache_dir, using).rebuild()
+    return SnapshotResult(Path(path), size, Path(path).stat().st_size, time.perf_counter() - started, rows,
+                          violations)
@@ -1,3 +1,1576 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import caching
+from .analytics import BorrowColumns, circulation_report, log_borrow_changes
+from .audit import AuditWriter, object_history, user_history
+from .bulk import run_job
+from .dashboard import library_dashboard, reconcile_library_stats, top_rated_books
+from .dedup import (author_records, confirm_candidates, find_author_duplicates, find_duplicates, merge_confirmed,
+                    normalize)
+from .exports import ExportError, export_lines
+from .importers import Checkpoint
+from .inventory import availability, is_available, reconcile_availability
+from .models import *
+from .overdue import sweep_overdue
+from .paginators import CachedCountPaginator, InvalidCursor, KeysetPaginator
+from .partitions import archive, archive_years, history, restore
+from .profiling import QueryProfilingMiddleware
+from .recommendations import (Interactions, item_neighbours, recommended_books, recommended_for_member,
+                              refresh_recommendations)
+from .registrations import AlreadyRegistered, cancel, register, register_many
+from .routers import ReadReplicaRouter
+from .search import get_search_backend, rebuild_index, search
+from .snapshots import SnapshotError, export_increment, restore as restore_snapshot, snapshot
+from .timeline import SOURCES, MemberTimeline
+
+logger = logging.getLogger(__name__)
+
+
+# The background audit writer would wait on each test's open transaction; tests write entries inline.
+_inline_audit = override_settings(LIBRARY_AUDIT={'BACKGROUND': False})
+
+
+def setUpModule():
+    _inline_audit.enable()
+
+
+def tearDownModule():
+    _inline_audit.disable()
+
+
+def create_catalogue(size, offset=0):
+    library = Library.objects.create(name=f"Library {offset}", location="Town")
+    category = Category.objects.create(name=f"Category {offset}")
+    for i in range(offset, offset + size):
+        author = Author.objects.create(first_name=f"First{i}", last_name=f"Last{i}",
+                                       birth_date=datetime.date(1970, 1, 1))
+        AuthorDetail.objects.create(author=author, biography="Bio", gender='Other')
+        book = Book.objects.create(title=f"Book {i}", author=author, category=category,
+                                   publishing_date=datetime.date(2000, 1, 1), genre='Fiction')
+        book.libraries.add(library)
+        member = Member.objects.create(first_name=f"Member{i}", last_name=f"Reader{i}",
+                                       email=f"member{i}@example.com", gender='Other',
+                                       birth_date=datetime.date(1990, 1, 1), age=30, role='Reader')
+        member.libraries.add(library)
+        Borrow.objects.create(member=member, book=book, library=library,
+                              borrow_date=datetime.date(2024, 1, 1), return_date=datetime.date(2024, 1, 15))
+        Review.objects.create(book=book, reviewer=member, rating=4, description="Good")
+        Post.objects.create(title=f"Post {i}", body="Body", author=member, library=library,
+                            created_at=datetime.date(2024, 1, 1))
+        event = Event.objects.create(title=f"Event {i}", description="Talk", library=library,
+                                     date=timezone.make_aware(datetime.datetime(2024, 1, 1 + i % 28)))
+        EventParticipant.objects.create(event=event, member=member)
+
+
+class BookRatingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(2)
+
+    def rating(self, title):
+        return Book.objects.values_list('average_rating', 'review_count').get(title=title)
+
+    def test_review_changes_shift_the_stored_aggregate(self):
+        review = Review.objects.create(book=Book.objects.get(title="Book 0"), reviewer=Member.objects.last(),
+                                       rating=2, description="Meh")
+        self.assertEqual(self.rating("Book 0"), (3.0, 2))
+        review.rating = 5
+        review.save()
+        self.assertEqual(self.rating("Book 0"), (4.5, 2))
+        review.book = Book.objects.get(title="Book 1")
+        review.save()
+        self.assertEqual((self.rating("Book 0"), self.rating("Book 1")), ((4.0, 1), (4.5, 2)))
+        review.delete()
+        self.assertEqual(self.rating("Book 1"), (4.0, 1))
+        Review.objects.filter(book__title="Book 1").get().delete()
+        self.assertEqual(self.rating("Book 1"), (0.0, 0))
+
+    def test_saving_a_fresh_instance_of_an_existing_review_counts_it_once(self):
+        review = Review.objects.get(book__title="Book 0")
+        Review(pk=review.pk, book_id=review.book_id, reviewer_id=review.reviewer_id, rating=2,
+               description="Changed my mind").save()
+        self.assertEqual(self.rating("Book 0"), (2.0, 1))
+
+    def test_recompute_repairs_drifted_aggregates(self):
+        Book.objects.update(average_rating=1.0, review_count=7)
+        out = io.StringIO()
+        call_command('recompute_book_ratings', batch_size=1, stdout=out)
+        self.assertIn("2 books", out.getvalue())
+        self.assertEqual([self.rating("Book 0"), self.rating("Book 1")], [(4.0, 1), (4.0, 1)])
+
+
+class QueryProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(3)
+
+    def view(self, request):
+        for book in Book.objects.all():
+            Author.objects.get(pk=book.author_id)
+        return HttpResponse("ok")
+
+    def test_disabled_middleware_removes_itself(self):
+        with override_settings(LIBRARY_PROFILING={'ENABLED': False}):
+            with self.assertRaises(MiddlewareNotUsed):
+                QueryProfilingMiddleware(self.view)
+
+    def test_headers_and_log_report_queries(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/profiling.log'
+            with override_settings(LIBRARY_PROFILING={'ENABLED': True, 'LOG_FILE': path, 'DUPLICATE_THRESHOLD': 3}):
+                middleware = QueryProfilingMiddleware(self.view)
+            try:
+                response = middleware(RequestFactory().get('/api/books/'))
+            finally:
+                for handler in middleware.logger.handlers[:]:
+                    handler.close()
+                    middleware.logger.removeHandler(handler)
+            with open(path, encoding='utf-8') as handle:
+                report = json.loads(handle.readline())
+        self.assertEqual(response['X-Query-Count'], '4')
+        self.assertEqual(response['X-Duplicate-Queries'], '3')
+        self.assertGreaterEqual(float(response['X-Wall-Time-Ms']), float(response['X-Query-Time-Ms']))
+        self.assertEqual((report['path'], report['status'], report['query_count']), ('/api/books/', 200, 4))
+        self.assertEqual([duplicate['count'] for duplicate in report['duplicates']], [3])
+        self.assertIn('FROM "library_author"', report['duplicates'][0]['sql'])
+
+    def test_paths_outside_the_prefixes_are_not_profiled(self):
+        with override_settings(LIBRARY_PROFILING={'ENABLED': True, 'LOG_FILE': None, 'PATH_PREFIXES': ['/api/']}):
+            middleware = QueryProfilingMiddleware(self.view)
+        self.assertNotIn('X-Query-Count', middleware(RequestFactory().get('/admin/')))
+        self.assertIn('X-Query-Count', middleware(RequestFactory().get('/api/books/')))
+
+
+class AdminChangelistQueryTests(TestCase):
+    # Upper bound of queries for one changelist page: session, user, the page itself,
+    # counts and list filter choices. It must not depend on the number of rows shown.
+    QUERY_BUDGET = 10
+    MODELS = [Author, AuthorDetail, Book, Borrow, Category, Event, EventParticipant, Library, Member, Post, Review]
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def changelist_queries(self, model):
+        url = reverse(f'admin:library_{model._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_stay_within_query_budget(self):
+        create_catalogue(5)
+        for model in self.MODELS:
+            with self.subTest(model=model.__name__):
+                self.assertLessEqual(self.changelist_queries(model), self.QUERY_BUDGET)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        create_catalogue(3)
+        small = {model: self.changelist_queries(model) for model in self.MODELS}
+        create_catalogue(12, offset=3)
+        for model in self.MODELS:
+            with self.subTest(model=model.__name__):
+                self.assertEqual(self.changelist_queries(model), small[model])
+
+
+class ImportCatalogueTests(TestCase):
+    HEADER = 'title,author_first_name,author_last_name,author_birth_date,publishing_date,summary,libraries\n'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        Library.objects.create(name="North", location="Town")
+        Library.objects.create(name="South", location="Town")
+
+    def feed(self, lines):
+        path = f'{self.directory}/books.csv'
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(self.HEADER + ''.join(f'{line}\n' for line in lines))
+        return path
+
+    def run_import(self, path, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_catalogue', path, stdout=out, stderr=err, **options)
+        return err.getvalue()
+
+    def test_reimport_updates_books_and_links_holdings(self):
+        path = self.feed(['Emma,Jane,Austen,1775-12-16,1815-12-23,First,North',
+                          'Persuasion,Jane,Austen,1775-12-16,1817-12-20,,North;Nowhere'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertIn("Nowhere", self.run_import(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(self.feed(['Emma,Jane,Austen,1775-12-16,1815-12-23,Second,South',
+                                       'Emma,Jane,Austen,1775-12-16,1815-12-23,Second,North']))
+        self.assertEqual(Author.objects.count(), 1)
+        emma = Book.objects.get(title="Emma")
+        self.assertEqual(emma.summary, "Second")
+        self.assertEqual(sorted(emma.libraries.values_list('name', flat=True)), ["North", "South"])
+        self.assertEqual(list(Book.objects.get(title="Persuasion").libraries.values_list('name', flat=True)),
+                         ["North"])
+        self.assertEqual(dict(LibraryStats.objects.values_list('library__name', 'books_held')),
+                         {"North": 2, "South": 1})
+        self.assertEqual(list(Holding.objects.values_list('available', flat=True).distinct()), [1])
+        self.assertEqual([(entry.action, entry.changes.get('summary')) for entry in object_history(Book, emma.pk)],
+                         [('update', ["First", "Second"]), ('create', [None, "First"])])
+
+    def test_batch_with_more_authors_than_the_cache(self):
+        path = self.feed([f'Book {i},First{i},Last{i},1970-01-01,2000-01-01,,North' for i in range(5)])
+        self.run_import(path, batch_size=5, author_cache_size=2)
+        self.assertEqual(
+            sorted(Book.objects.values_list('title', 'author__last_name')),
+            [(f"Book {i}", f"Last{i}") for i in range(5)],
+        )
+
+    def test_resume_skips_committed_batches(self):
+        path = self.feed([f'Book {i},First,Last,1970-01-01,2000-01-01,,North' for i in range(4)])
+        Checkpoint(f'{path}.checkpoint').save(path, 3)
+        self.run_import(path, resume=True)
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ["Book 3"])
+        self.assertFalse(Path(f'{path}.checkpoint').exists())
+
+
+class HistoryExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(3)
+        create_catalogue(2, offset=3)
+        Borrow.objects.filter(book__title="Book 4").update(borrow_date=datetime.date(2024, 3, 1))
+
+    def test_csv_and_json_lines_carry_the_same_rows(self):
+        rows = list(csv.reader(export_lines('borrows')))
+        records = [json.loads(line) for line in export_lines('borrows', fmt='jsonl')]
+        self.assertEqual(rows[0][:3], ['id', 'borrow_date', 'return_date'])
+        self.assertEqual(len(rows) - 1, len(records))
+        self.assertEqual([row[9] for row in rows[1:]], [record['book_title'] for record in records])
+        self.assertEqual(records[0]['borrow_date'], '2024-01-01')
+
+    def test_date_and_library_filters(self):
+        library = Library.objects.get(name="Library 3")
+        lines = export_lines('borrows', fmt='jsonl', since=datetime.date(2024, 2, 1), library=library.pk)
+        self.assertEqual([json.loads(line)['book_title'] for line in lines], ["Book 4"])
+        reviews = export_lines('reviews', fmt='jsonl', library=library.pk)
+        self.assertEqual(sorted(json.loads(line)['book_title'] for line in reviews), ["Book 3", "Book 4"])
+        with self.assertRaises(ExportError):
+            export_lines('borrows', fmt='xml')
+
+    def test_chunks_are_read_by_keyset(self):
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(export_lines('borrows', fmt='jsonl', chunk_size=2))
+        self.assertEqual(len(lines), 5)
+        # Three full or partial chunks and one empty read, each starting after the last primary key seen.
+        self.assertEqual(len(queries), 4)
+        self.assertNotIn('OFFSET', queries[-1]['sql'])
+        self.assertIn('"library_borrow"."id" >', queries[-1]['sql'])
+
+
+class OverdueTests(TestCase):
+    TODAY = datetime.date(2024, 1, 20)
+
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(4)
+        Borrow.objects.filter(book__title="Book 1").update(returned=True)
+        Borrow.objects.filter(book__title="Book 2").update(return_date=datetime.date(2024, 1, 25))
+        Borrow.objects.filter(book__title="Book 3").update(return_date=datetime.date(2024, 2, 20))
+
+    def titles(self, borrows):
+        return sorted(borrows.values_list('book__title', flat=True))
+
+    def test_querysets_select_open_loans_by_due_date(self):
+        self.assertEqual(self.titles(Borrow.objects.overdue(self.TODAY)), ["Book 0"])
+        self.assertEqual(self.titles(Borrow.objects.due_within(7, self.TODAY)), ["Book 2"])
+        member = Member.objects.get(email="member0@example.com")
+        self.assertEqual(Borrow.objects.overdue_counts_by_member(self.TODAY), {member.pk: 1})
+        self.assertEqual(Borrow.objects.overdue_counts_by_library(datetime.date(2024, 3, 1)),
+                         {Library.objects.get().pk: 3})
+
+    def test_overdue_query_reads_the_partial_index(self):
+        self.assertIn('borrow_open_return_date_idx', Borrow.objects.overdue(self.TODAY).order_by().explain())
+        self.assertIn('borrow_open_return_date_idx', Borrow.objects.due_within(7, self.TODAY).explain())
+
+    def test_sweep_refreshes_every_member_in_chunks(self):
+        Member.objects.update(overdue_count=9)
+        out = io.StringIO()
+        call_command('sweep_overdue', chunk_size=1, date='2024-03-01', verbosity=2, stdout=out)
+        self.assertEqual(out.getvalue().count("Swept members"), 4)
+        self.assertIn("Refreshed 4 members; 3 borrows are overdue.", out.getvalue())
+        self.assertEqual(sorted(Member.objects.values_list('email', 'overdue_count')),
+                         [("member0@example.com", 1), ("member1@example.com", 0), ("member2@example.com", 1),
+                          ("member3@example.com", 1)])
+        self.assertEqual(sweep_overdue(today=self.TODAY), 4)
+        self.assertEqual(sum(Member.objects.values_list('overdue_count', flat=True)), 1)
+
+
+class FullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(3)
+        Book.objects.filter(title="Book 1").update(title="Harbor Lights")
+        Book.objects.filter(title="Book 2").update(summary="A night in the harbor")
+        rebuild_index()
+
+    def titles(self, query):
+        return [book.title for book in search(Book, query)]
+
+    def test_saves_and_deletes_keep_the_index_current(self):
+        book = Book.objects.get(title="Book 0")
+        book.title = "Winter Garden"
+        book.save()
+        self.assertEqual(self.titles("winter"), ["Winter Garden"])
+        author = book.author
+        author.last_name = "Tolstoy"
+        author.save()
+        self.assertEqual(self.titles("tolstoy"), ["Winter Garden"])
+        book.delete()
+        self.assertEqual(self.titles("winter"), [])
+
+    def test_title_matches_rank_above_summary_matches_and_prefixes_match(self):
+        self.assertEqual(self.titles("harbor"), ["Harbor Lights", "Book 2"])
+        self.assertEqual(self.titles("harb"), ["Harbor Lights", "Book 2"])
+        self.assertEqual(self.titles("harb lig"), ["Harbor Lights"])
+
+    def test_admin_search_reads_the_index(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:library_book_changelist'), {'q': 'harb'})
+        self.assertEqual(sorted(book.title for book in response.context['cl'].result_list),
+                         ["Book 2", "Harbor Lights"])
+
+    def test_rows_written_without_signals_are_indexed(self):
+        Library.objects.create(name="North", location="Town")
+        with tempfile.TemporaryDirectory() as directory:
+            path = f'{directory}/books.csv'
+            with open(path, 'w', encoding='utf-8') as handle:
+                handle.write(ImportCatalogueTests.HEADER + 'Emma,Jane,Austen,1775-12-16,1815-12-23,,North\n')
+            call_command('import_catalogue', path, stdout=io.StringIO())
+        self.assertEqual(self.titles("austen emma"), ["Emma"])
+        self.assertEqual([str(author) for author in search(Author, "austen")], ["Jane A."])
+
+        Post.objects.update(moderated=True)
+        archive('posts', before=datetime.date(2025, 1, 1))
+        self.assertEqual(search(Post, "post"), [])
+        self.assertEqual(get_search_backend().search(Post, "post"), [])
+        restore('posts')
+        self.assertEqual(sorted(post.title for post in search(Post, "post")), ["Post 0", "Post 1", "Post 2"])
+
+
+class CachedCountPaginatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        create_catalogue(4)
+
+    def test_small_unfiltered_table_is_counted_exactly(self):
+        paginator = CachedCountPaginator(Borrow.objects.all(), 2)
+        self.assertEqual(paginator.count, 4)
+        self.assertEqual(paginator.num_pages, 2)
+
+    def test_large_table_count_is_cached(self):
+        class SmallThresholdPaginator(CachedCountPaginator):
+            estimate_threshold = 2
+
+        self.assertEqual(SmallThresholdPaginator(Borrow.objects.all(), 2).count, 4)
+        Borrow.objects.all().delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(SmallThresholdPaginator(Borrow.objects.all(), 2).count, 4)
+
+    def test_filtered_count_is_capped(self):
+        class CappedPaginator(CachedCountPaginator):
+            max_count = 3
+
+        self.assertEqual(CappedPaginator(Borrow.objects.filter(returned=False), 2).count, 3)
+        self.assertEqual(CachedCountPaginator(Borrow.objects.filter(returned=False), 2).count, 4)
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(12)
+        # Ties on the ordering column must be broken by the primary key.
+        Review.objects.filter(pk__in=[2, 3, 4, 5]).update(rating=5)
+
+    def walk(self, paginator, cursor=None, backwards=False):
+        pages = []
+        while True:
+            page = paginator.page_from_cursor(cursor)
+            pages.append([row.pk for row in page])
+            cursor = page.previous_cursor if backwards else page.next_cursor
+            if cursor is None:
+                return pages
+
+    def test_pages_visit_every_row_once_in_order(self):
+        pages = self.walk(KeysetPaginator(Review.objects.all(), 5))
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sum(pages, []), list(Review.objects.order_by('-rating', '-pk').values_list('pk', flat=True)))
+
+    def test_previous_cursor_returns_the_preceding_page(self):
+        paginator = KeysetPaginator(Borrow.objects.all(), 5)
+        first = paginator.page_from_cursor()
+        second = paginator.page_from_cursor(first.next_cursor)
+        self.assertFalse(first.has_previous())
+        self.assertEqual([row.pk for row in paginator.page_from_cursor(second.previous_cursor)],
+                         [row.pk for row in first])
+
+    def test_related_ordering_and_values_rows(self):
+        paginator = KeysetPaginator(AuthorDetail.objects.select_related('author'), 5)
+        self.assertEqual(sum(self.walk(paginator), []),
+                         list(AuthorDetail.objects.order_by('author__last_name', 'pk').values_list('pk', flat=True)))
+        page = KeysetPaginator(Book.objects.all(), 5, values=['id', 'title']).page_from_cursor()
+        self.assertEqual(set(page.object_list[0]), {'id', 'title', 'publishing_date'})
+
+    def test_deep_page_reads_only_one_page_of_rows(self):
+        paginator = KeysetPaginator(Borrow.objects.all(), 5)
+        cursor = paginator.page_from_cursor(paginator.page_from_cursor().next_cursor).next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            paginator.page_from_cursor(cursor)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+        self.assertIn('LIMIT 6', queries[0]['sql'])
+
+    def test_cursor_from_another_ordering_is_rejected(self):
+        cursor = KeysetPaginator(Borrow.objects.all(), 5).page_from_cursor().next_cursor
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(Review.objects.all(), 5).page_from_cursor(cursor)
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(Review.objects.all(), 5).page_from_cursor('not-a-cursor')
+
+    def test_admin_changelist_follows_cursor_links(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:library_borrow_changelist')
+        pages = []
+        query = ''
+        with mock.patch.object(site._registry[Borrow], 'list_per_page', 5):
+            while query is not None:
+                changelist = self.client.get(url + query).context['cl']
+                pages.append([borrow.pk for borrow in changelist.result_list])
+                query = changelist.next_page_url
+        self.assertEqual([len(page) for page in pages], [5, 5, 2])
+        self.assertEqual(sorted(sum(pages, [])), list(Borrow.objects.order_by('pk').values_list('pk', flat=True)))
+
+
+class LocalMemoryBackendTests(SimpleTestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        backend = caching.LocalMemoryBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get_many(['a'])
+        backend.set('c', 3)
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_entries_expire_after_timeout(self):
+        backend = caching.LocalMemoryBackend()
+        with mock.patch('library.caching.time.monotonic', return_value=100.0):
+            backend.set('a', 1, timeout=10)
+            self.assertFalse(backend.add('a', 2))
+        with mock.patch('library.caching.time.monotonic', return_value=110.0):
+            self.assertEqual(backend.get_many(['a']), {})
+            self.assertTrue(backend.add('a', 2))
+
+
+class ReadThroughCacheTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        self.library = Library.objects.create(name="Central", location="Town")
+        self.book = Book.objects.create(title="Dune", publishing_date=datetime.date(1965, 8, 1))
+
+    def test_object_is_served_from_cache_after_first_read(self):
+        self.assertEqual(caching.get_object(Library, self.library.pk).name, "Central")
+        with self.assertNumQueries(0):
+            self.assertEqual(caching.get_object(Library, self.library.pk).name, "Central")
+        self.assertEqual(caching.cache_stats(), {'library.library.misses': 1, 'library.library.hits': 1})
+
+    def test_missing_object_raises_does_not_exist(self):
+        with self.assertRaises(Library.DoesNotExist):
+            caching.get_object(Library, 0)
+
+    def test_save_and_delete_invalidate_object(self):
+        caching.get_object(Library, self.library.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.library.name = "Renamed"
+            self.library.save()
+        self.assertEqual(caching.get_object(Library, self.library.pk).name, "Renamed")
+        with self.captureOnCommitCallbacks(execute=True):
+            Library.objects.get(pk=self.library.pk).delete()
+        with self.assertRaises(Library.DoesNotExist):
+            caching.get_object(Library, self.library.pk)
+
+    def test_category_list_is_invalidated_on_change(self):
+        self.assertEqual(caching.get_categories(), ())
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(name="Classics")
+        self.assertEqual(caching.get_categories(), ((category.pk, "Classics"),))
+
+    def test_holdings_are_invalidated_by_m2m_changes(self):
+        self.assertEqual(caching.get_library_holdings(self.library.pk), ())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.libraries.add(self.library)
+        self.assertEqual(caching.get_library_holdings(self.library.pk), ((self.book.pk, "Dune"),))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.library.books.clear()
+        self.assertEqual(caching.get_library_holdings(self.library.pk), ())
+
+    def test_review_changes_invalidate_cached_book_rating(self):
+        member = Member.objects.create(first_name="Ann", last_name="Lee", email="ann@example.com", gender='Female',
+                                       birth_date=datetime.date(1990, 1, 1), age=34, role='Reader')
+        self.assertEqual(caching.get_object(Book, self.book.pk).rating, 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, reviewer=member, rating=4, description="Good")
+        self.assertEqual(caching.get_object(Book, self.book.pk).rating, 4)
+
+    def test_author_detail_is_served_from_cache(self):
+        author = Author.objects.create(first_name="Frank", last_name="Herbert", birth_date=datetime.date(1920, 10, 8))
+        other = Author.objects.create(first_name="Brian", last_name="Herbert", birth_date=datetime.date(1947, 6, 29))
+        self.book.author = author
+        self.book.save()
+        url = reverse('library:api-author', args=[author.pk])
+        self.assertEqual([book['title'] for book in self.client.get(url).json()['books']], ["Dune"])
+        with self.assertNumQueries(0):
+            response = self.client.get(url).json()
+        self.assertEqual((response['last_name'], response['book_count']), ("Herbert", 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = "Dune Messiah"
+            self.book.save()
+        self.assertEqual(self.client.get(url).json()['books'][0]['title'], "Dune Messiah")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.author = other
+            self.book.save()
+        self.assertEqual(self.client.get(url).json()['books'], [])
+        self.assertEqual(self.client.get(reverse('library:api-author', args=[other.pk])).json()['book_count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            author.deleted = True
+            author.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_book_list_pages_are_dropped_on_catalogue_changes(self):
+        url = reverse('library:api-books')
+        self.assertEqual(self.client.get(url, {'library': self.library.pk}).json()['results'], [])
+        with self.assertNumQueries(0):
+            self.client.get(url, {'library': self.library.pk})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.libraries.add(self.library)
+        results = self.client.get(url, {'library': self.library.pk}).json()['results']
+        self.assertEqual([book['title'] for book in results], ["Dune"])
+        member = Member.objects.create(first_name="Ann", last_name="Lee", email="ann@example.com", gender='Female',
+                                       birth_date=datetime.date(1990, 1, 1), age=34, role='Reader')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(book=self.book, reviewer=member, rating=4, description="Good")
+        self.assertEqual(self.client.get(url).json()['results'][0]['average_rating'], 4)
+
+
+class ReadThroughCacheConcurrencyTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        caching.get_cache().clear()
+        self.library = Library.objects.create(name="Version 0", location="Town")
+
+    def test_value_loaded_before_concurrent_write_is_not_served(self):
+        read_through = caching.get_cache()
+        key = caching.object_key(Library, self.library.pk)
+
+        def load_then_race():
+            stale = Library.objects.get(pk=self.library.pk)
+            # A writer commits between the database read and the cache fill.
+            Library.objects.filter(pk=self.library.pk).update(name="Fresh")
+            read_through.invalidate(key, 'library.library')
+            return stale
+
+        self.assertEqual(read_through.get(key, load_then_race, 'library.library').name, "Version 0")
+        self.assertEqual(caching.get_object(Library, self.library.pk).name, "Fresh")
+
+    def test_concurrent_readers_and_writers_converge_on_latest_write(self):
+        # Backing store shared by the threads; an in-memory SQLite test database
+        # would serialise them on table locks instead of exercising the cache.
+        store = {'value': 0}
+        store_lock = threading.Lock()
+        read_through = caching.ReadThroughCache(caching.LocalMemoryBackend(), timeout=None)
+        errors = []
+
+        def load():
+            with store_lock:
+                value = store['value']
+            time.sleep(0)
+            return value
+
+        def writer():
+            for _ in range(200):
+                with store_lock:
+                    store['value'] += 1
+                read_through.invalidate('counter', 'counter')
+
+        def reader():
+            try:
+                for _ in range(500):
+                    read_through.get('counter', load, 'counter')
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=writer) for _ in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(read_through.get('counter', load, 'counter'), 800)
+
+
+class ReadReplicaRouterTests(TransactionTestCase):
+    def test_reads_use_replica_outside_transactions(self):
+        router = ReadReplicaRouter()
+        self.assertEqual(router.db_for_read(Book), 'replica')
+        self.assertEqual(router.db_for_write(Book), 'default')
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Book), 'default')
+
+    def test_only_primary_is_migrated(self):
+        router = ReadReplicaRouter()
+        self.assertTrue(router.allow_migrate('default', 'library'))
+        self.assertFalse(router.allow_migrate('replica', 'library'))
+
+    def test_relations_outside_primary_and_replica_are_left_to_other_routers(self):
+        router = ReadReplicaRouter()
+        book, author = Book(), Author()
+        book._state.db, author._state.db = 'replica', 'default'
+        self.assertTrue(router.allow_relation(book, author))
+        author._state.db = 'other'
+        self.assertIsNone(router.allow_relation(book, author))
+
+
+class LibraryDashboardTests(TestCase):
+    def snapshot(self):
+        # Daily rows record activity as it happened, so only the current-state tables are compared.
+        return {
+            'stats': sorted(LibraryStats.objects.values_list(
+                'library_id', 'active_members', 'books_held', 'open_loans', 'post_count')),
+            'due': sorted(LibraryLoanDue.objects.filter(open_loans__gt=0).values_list(
+                'library_id', 'due_date', 'open_loans')),
+        }
+
+    def test_incremental_updates_match_full_reconcile(self):
+        create_catalogue(6)
+        other = Library.objects.create(name="Branch", location="Village")
+        member = Member.objects.get(email="member0@example.com")
+        member.libraries.add(other)
+        member.active = False
+        member.save()
+        Book.objects.get(title="Book 1").libraries.set([other])
+        borrow = Borrow.objects.get(member=member)
+        borrow.returned = True
+        borrow.save()
+        moved = Borrow.objects.get(member__email="member2@example.com")
+        moved.library = other
+        moved.return_date = datetime.date(2024, 2, 1)
+        moved.save()
+        Post.objects.filter(title="Post 3").get().delete()
+        Member.objects.get(email="member4@example.com").delete()
+        other.members.clear()
+
+        incremental = self.snapshot()
+        reconcile_library_stats()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_dashboard_reads_use_fixed_number_of_queries(self):
+        create_catalogue(4)
+        library = Library.objects.get()
+        reconcile_library_stats()
+        with self.assertNumQueries(4):
+            dashboard = library_dashboard(library.pk)
+        self.assertEqual(dashboard['active_members'], 4)
+        self.assertEqual(dashboard['books_held'], 4)
+        self.assertEqual(dashboard['current_loans'], 4)
+        self.assertEqual(dashboard['overdue_loans'], 4)
+        self.assertEqual(dashboard['post_count'], 4)
+        self.assertEqual(len(dashboard['top_rated_books']), 4)
+
+    def test_top_rated_list_follows_new_reviews(self):
+        create_catalogue(3)
+        reconcile_library_stats()
+        book = Book.objects.get(title="Book 2")
+        Review.objects.create(book=book, reviewer=Member.objects.first(), rating=5, description="Great")
+        self.assertEqual(LibraryStats.objects.get().top_rated_books[0]['id'], book.pk)
+
+    def test_top_rated_list_is_requeried_only_when_a_book_may_drop_out(self):
+        create_catalogue(7)
+        reconcile_library_stats()
+        member = Member.objects.first()
+        reviews = {title: Review.objects.create(book=Book.objects.get(title=title), reviewer=member, rating=5,
+                                                description="Great") for title in ("Book 5", "Book 6")}
+
+        def requeries(change):
+            with CaptureQueriesContext(connection) as queries:
+                change()
+            return sum('ORDER BY "library_book"."average_rating" DESC' in query['sql'] for query in queries)
+
+        listed = [entry['id'] for entry in LibraryStats.objects.get().top_rated_books]
+        unlisted = Book.objects.exclude(pk__in=listed).first()
+        self.assertEqual(requeries(lambda: Review.objects.create(book=unlisted, reviewer=member, rating=1,
+                                                                 description="Poor")), 0)
+        review = reviews["Book 6"]
+        review.rating = 1
+        self.assertEqual(requeries(review.save), 1)
+        stats = LibraryStats.objects.get()
+        self.assertEqual(stats.top_rated_books, top_rated_books(stats.library_id))
+        self.assertNotIn(Book.objects.get(title="Book 6").pk, [entry['id'] for entry in stats.top_rated_books])
+        review.rating = 5
+        self.assertEqual(requeries(review.save), 0)
+        self.assertEqual(LibraryStats.objects.get().top_rated_books, top_rated_books(stats.library_id))
+
+
+@override_settings(LIBRARY_BULK_ACTIONS={'CHUNK_SIZE': 2, 'BACKGROUND_THRESHOLD': None})
+class BulkActionTests(TestCase):
+    def setUp(self):
+        create_catalogue(5)
+        reconcile_library_stats()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def post_action(self, model, action, queryset):
+        url = reverse(f'admin:library_{model}_changelist')
+        selected = list(queryset.values_list('pk', flat=True))
+        return self.client.post(url, {'action': action, '_selected_action': selected}, follow=True)
+
+    def test_returning_borrows_keeps_statistics_in_step(self):
+        response = self.post_action('borrow', 'mark_borrows_returned', Borrow.objects.all())
+        self.assertContains(response, "Updated 5 of 5 selected Borrows.")
+        self.assertFalse(Borrow.objects.filter(returned=False).exists())
+        job = BulkJob.objects.get()
+        self.assertEqual((job.status, job.processed, job.changed, job.progress), ('done', 5, 5, 100))
+        stats = LibraryStats.objects.get()
+        self.assertEqual(stats.open_loans, 0)
+        self.assertEqual(LibraryDailyStats.objects.get(date=timezone.localdate()).loans_returned, 5)
+        self.assertEqual(sum(Member.objects.values_list('overdue_count', flat=True)), 0)
+        self.assertEqual(set(Holding.objects.values_list('available', flat=True)), {1})
+
+    def test_deactivating_members_updates_active_member_count(self):
+        self.post_action('member', 'deactivate_members', Member.objects.filter(email__in=[
+            'member0@example.com', 'member1@example.com', 'member2@example.com']))
+        self.assertEqual(LibraryStats.objects.get().active_members, 2)
+        self.post_action('member', 'deactivate_members', Member.objects.all())
+        self.assertEqual(LibraryStats.objects.get().active_members, 0)
+        self.assertEqual(BulkJob.objects.first().changed, 2)
+
+    def test_each_chunk_commits_separately(self):
+        with mock.patch('library.bulk.transaction', wraps=transaction) as bulk_transaction:
+            self.post_action('author', 'mark_authors_deleted', Author.objects.all())
+        self.assertEqual(bulk_transaction.atomic.call_count, 3)
+        self.assertEqual(Author.all_objects.filter(deleted=True).count(), 5)
+
+    @override_settings(LIBRARY_BULK_ACTIONS={'CHUNK_SIZE': 2, 'BACKGROUND_THRESHOLD': 3})
+    def test_large_selections_are_queued_for_the_worker_pool(self):
+        executor = mock.Mock()
+        with mock.patch('library.bulk.get_executor', return_value=executor), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.post_action('member', 'assign_role_to_staff', Member.objects.all())
+        self.assertContains(response, "Started")
+        job = BulkJob.objects.get()
+        self.assertEqual(job.status, 'queued')
+        executor.submit.assert_called_once()
+        _, *args = executor.submit.call_args.args
+        run_job(*args)
+        self.assertEqual(Member.objects.filter(role='Staff').count(), 5)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+
+
+class InventoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(2)
+        cls.library = Library.objects.get()
+        cls.book = Book.objects.get(title="Book 0")
+        cls.member = Member.objects.get(email="member1@example.com")
+
+    def borrow(self, borrow_date=datetime.date(2024, 2, 1)):
+        return Borrow.objects.create(member=self.member, book=self.book, library=self.library,
+                                     borrow_date=borrow_date, return_date=borrow_date + datetime.timedelta(days=14))
+
+    def available(self):
+        return Holding.objects.get(book=self.book, library=self.library).available
+
+    def test_borrows_move_available_copies(self):
+        holding = Holding.objects.get(book=self.book, library=self.library)
+        holding.copies = 2
+        holding.save()
+        self.assertEqual(self.available(), 1)
+        borrow = self.borrow()
+        self.assertEqual(self.available(), 0)
+        self.assertFalse(is_available(self.book.pk, self.library.pk))
+        borrow.returned = True
+        borrow.save()
+        self.assertEqual(self.available(), 1)
+        self.borrow(datetime.date(2024, 3, 1)).delete()
+        self.assertEqual(self.available(), 1)
+
+    def test_adding_a_holding_counts_loans_already_open(self):
+        other = Library.objects.create(name="Branch", location="Town")
+        Borrow.objects.create(member=self.member, book=self.book, library=other,
+                              borrow_date=datetime.date(2024, 2, 1), return_date=datetime.date(2024, 2, 15))
+        self.book.libraries.add(other, through_defaults={'copies': 3})
+        self.assertEqual(Holding.objects.get(book=self.book, library=other).available, 2)
+        self.assertEqual(LibraryStats.objects.get(library=other).books_held, 1)
+        self.book.libraries.remove(other)
+        self.assertEqual(LibraryStats.objects.get(library=other).books_held, 0)
+
+    def test_availability_for_many_books_is_one_query(self):
+        book_ids = list(Book.objects.values_list('pk', flat=True)) + [0]
+        with self.assertNumQueries(1):
+            result = availability(book_ids)
+        self.assertEqual(result, {self.book.pk: {self.library.pk: 0},
+                                  Book.objects.get(title="Book 1").pk: {self.library.pk: 0}, 0: {}})
+
+    def test_reconciliation_rebuilds_counters_from_borrows(self):
+        Holding.objects.update(available=7)
+        self.assertEqual(reconcile_availability(chunk_size=1), 2)
+        self.assertEqual(set(Holding.objects.values_list('available', flat=True)), {0})
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        create_catalogue(3)
+        self.long_ago = timezone.now() - datetime.timedelta(days=400)
+
+    def test_default_managers_hide_deleted_and_inactive_rows(self):
+        author = Author.objects.get(last_name="Last0")
+        author.deleted = True
+        author.save()
+        self.assertIsNotNone(author.deleted_at)
+        Member.objects.filter(email="member1@example.com").update(active=False)
+        self.assertEqual(Author.objects.count(), 2)
+        self.assertEqual(Author.all_objects.count(), 3)
+        self.assertEqual(Member.objects.count(), 2)
+        self.assertEqual(Member.all_objects.count(), 3)
+        # Forward relations and Django's default manager still reach hidden rows.
+        self.assertEqual(Book.objects.get(title="Book 0").author, author)
+        self.assertEqual(Author._default_manager.count(), 3)
+
+    def test_live_queries_use_partial_indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + str(Author.objects.order_by('last_name', 'first_name')[:10].query))
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+        self.assertIn('author_live_name_idx', plan)
+
+    def test_archive_moves_only_long_removed_rows_without_dependents(self):
+        kept = Author.objects.create(first_name="Kept", last_name="Recent", deleted=True,
+                                     birth_date=datetime.date(1950, 1, 1))
+        archived = Author.objects.create(first_name="Gone", last_name="Old", birth_date=datetime.date(1940, 1, 1))
+        AuthorDetail.objects.create(author=archived, biography="Old bio", gender='Other')
+        Author.all_objects.filter(pk=archived.pk).update(deleted=True, deleted_at=self.long_ago)
+        Author.all_objects.filter(last_name="Last0").update(deleted=True, deleted_at=self.long_ago)
+        idle = Member.objects.create(first_name="Idle", last_name="Member", email="idle@example.com",
+                                     gender='Other', birth_date=datetime.date(1980, 1, 1), age=44, role='Reader')
+        idle.libraries.add(Library.objects.get())
+        Member.all_objects.filter(pk=idle.pk).update(active=False, deactivated_at=self.long_ago)
+        Member.all_objects.filter(email="member0@example.com").update(active=False, deactivated_at=self.long_ago)
+
+        call_command('archive_soft_deleted', chunk_size=1, stdout=io.StringIO())
+
+        self.assertEqual(list(ArchivedAuthor.objects.values_list('original_id', flat=True)), [archived.pk])
+        self.assertEqual(ArchivedAuthor.objects.get().data['details']['biography'], "Old bio")
+        self.assertTrue(Author.all_objects.filter(pk=kept.pk).exists())
+        self.assertTrue(Author.all_objects.filter(last_name="Last0").exists())
+        self.assertFalse(AuthorDetail.objects.filter(author_id=archived.pk).exists())
+        member = ArchivedMember.objects.get()
+        self.assertEqual((member.original_id, member.data['email']), (idle.pk, "idle@example.com"))
+        self.assertEqual(member.data['libraries'], [Library.objects.get().pk])
+        self.assertTrue(Member.all_objects.filter(email="member0@example.com").exists())
+
+
+class HistoryPartitionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(3)
+        Borrow.objects.filter(book__title__in=["Book 0", "Book 1"]).update(returned=True)
+        Borrow.objects.filter(book__title="Book 1").update(borrow_date=datetime.date(2023, 6, 1))
+        Post.objects.update(moderated=True)
+
+    def test_closed_rows_move_to_yearly_tables_and_back(self):
+        stats = LibraryStats.objects.values().get()
+        self.assertEqual(archive('borrows', before=datetime.date(2025, 1, 1), chunk_size=1), 2)
+        self.assertEqual(archive_years('borrows'), [2023, 2024])
+        self.assertEqual(list(Borrow.objects.values_list('book__title', flat=True)), ["Book 2"])
+        # Archiving is not a deletion: no counter or statistic moves.
+        self.assertEqual(LibraryStats.objects.values().get(), stats)
+        self.assertEqual(restore('borrows'), (2, 0))
+        self.assertEqual(archive_years('borrows'), [])
+        self.assertEqual(Borrow.objects.count(), 3)
+
+    def test_post_counts_and_recommendations_follow_the_hot_table(self):
+        refresh_recommendations()
+        self.assertEqual(archive('posts', before=datetime.date(2025, 1, 1)), 3)
+        self.assertEqual(LibraryStats.objects.get().post_count, 0)
+        archive('borrows', before=datetime.date(2025, 1, 1))
+        stale = set(BookRecommendations.objects.filter(stale=True).values_list('pk', flat=True))
+        self.assertEqual(stale, set(Book.objects.filter(title__in=["Book 0", "Book 1"]).values_list('pk', flat=True)))
+        self.assertEqual(restore('posts'), (3, 0))
+        self.assertEqual(LibraryStats.objects.get().post_count, 3)
+        reconcile_library_stats()
+        self.assertEqual(LibraryStats.objects.get().post_count, 3)
+
+    def test_history_unions_hot_and_archived_rows(self):
+        archive('borrows', before=datetime.date(2025, 1, 1))
+        borrows = history('borrows')
+        self.assertEqual(sorted(borrows.values_list('book__title', flat=True)), ["Book 0", "Book 1", "Book 2"])
+        recent = history('borrows', since=datetime.date(2024, 1, 1)).filter(borrow_date__gte=datetime.date(2024, 1, 1))
+        self.assertEqual(recent.count(), 2)
+        lines = list(export_lines('borrows', archived=True))
+        self.assertEqual(len(lines), 4)
+
+    def test_restore_keeps_rows_whose_references_are_gone(self):
+        archive('posts', before=datetime.date(2025, 1, 1))
+        Member.objects.get(email="member0@example.com").delete()
+        self.assertEqual(restore('posts'), (2, 1))
+        self.assertEqual(archive_years('posts'), [2024])
+
+
+class AttachedArchiveTests(TransactionTestCase):
+    def test_archive_tables_live_in_the_attached_file(self):
+        create_catalogue(2)
+        Post.objects.update(moderated=True)
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(LIBRARY_PARTITIONS={'ARCHIVE_DATABASE': f'{directory}/archive.sqlite3'}):
+            self.assertEqual(archive('posts', before=datetime.date(2025, 1, 1)), 2)
+            self.assertFalse(Post.objects.exists())
+            self.assertEqual(history('posts').count(), 2)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM main.sqlite_master WHERE name LIKE 'library_post_2%%'")
+                self.assertEqual(cursor.fetchone()[0], 0)
+            self.assertEqual(restore('posts'), (2, 0))
+            connection.close()
+        self.assertEqual(Post.objects.count(), 2)
+
+
+class ApiEndpointTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(5)
+        cls.library = Library.objects.get()
+        cls.member = Member.objects.get(email="member0@example.com")
+        for day in range(2, 6):
+            Borrow.objects.create(member=cls.member, book=Book.objects.get(title=f"Book {day - 1}"),
+                                  library=cls.library, borrow_date=datetime.date(2024, 2, day),
+                                  return_date=datetime.date(2024, 3, day))
+
+    def setUp(self):
+        caching.get_cache().clear()
+
+    def walk(self, url, limit=2):
+        """Ids of every page followed through ``next``, checking that ``previous`` leads back."""
+        pages, cursor = [], None
+        while True:
+            response = self.client.get(url, {'limit': limit, 'cursor': cursor or ''})
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            pages.append([row['id'] for row in page['results']])
+            if len(pages) > 1:
+                previous = self.client.get(url, {'limit': limit, 'cursor': page['previous']}).json()
+                self.assertEqual([row['id'] for row in previous['results']], pages[-2])
+            cursor = page['next']
+            if cursor is None:
+                break
+        self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+        return [pk for page in pages for pk in page]
+
+    def test_book_list_pages_and_filters(self):
+        url = reverse('library:api-books')
+        self.assertEqual(self.walk(url), list(Book.objects.order_by('-publishing_date', '-pk')
+                                              .values_list('pk', flat=True)))
+        Book.objects.filter(title="Book 0").update(genre='Mystery')
+        caching.get_cache().clear()
+        results = self.client.get(url, {'genre': 'Mystery'}).json()['results']
+        self.assertEqual([book['title'] for book in results], ["Book 0"])
+        self.assertEqual(self.client.get(url, {'library': 0}).json()['results'], [])
+
+    def test_book_list_rejects_bad_parameters(self):
+        url = reverse('library:api-books')
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'limit': 'ten'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'category': 'fiction'}).status_code, 400)
+
+    def test_author_detail_lists_books(self):
+        book = Book.objects.get(title="Book 0")
+        response = self.client.get(reverse('library:api-author', args=[book.author_id]))
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual((payload['first_name'], payload['book_count']), ("First0", 1))
+        self.assertEqual(payload['books'][0]['id'], book.pk)
+        self.assertEqual(self.client.get(reverse('library:api-author', args=[0])).status_code, 404)
+
+    def test_library_events_pages_and_404(self):
+        url = reverse('library:api-library-events', args=[self.library.pk])
+        self.assertEqual(self.walk(url), list(Event.objects.order_by('-date', '-pk').values_list('pk', flat=True)))
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('library:api-library-events', args=[0])).status_code, 404)
+
+    def test_member_borrows_is_staff_only(self):
+        url = reverse('library:api-member-borrows', args=[self.member.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('reader'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.walk(url), list(self.member.borrows.order_by('-borrow_date', '-pk')
+                                              .values_list('pk', flat=True)))
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('library:api-member-borrows', args=[0])).status_code, 404)
+
+
+class MemberTimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(3)
+        cls.member = Member.objects.get(email="member0@example.com")
+        book = Book.objects.get(title="Book 1")
+        library = Library.objects.get()
+        for day in range(1, 6):
+            Borrow.objects.create(member=cls.member, book=book, library=library,
+                                  borrow_date=datetime.date(2024, 2, day), return_date=datetime.date(2024, 3, day))
+            Review.objects.create(book=book, reviewer=cls.member, rating=3, description="Fine",
+                                  created_at=datetime.date(2024, 2, day * 2))
+        event = Event.objects.create(title="Reading", description="Club", library=library,
+                                     date=timezone.now())
+        EventParticipant.objects.create(event=event, member=cls.member, registration_date=datetime.date(2024, 2, 3))
+
+    def expected(self):
+        rows = []
+        for name, source in SOURCES.items():
+            queryset = source.model.objects.filter(**{f'{source.member_field}_id': self.member.pk})
+            rows += [(date, pk, name) for pk, date in queryset.values_list('pk', source.date_field)]
+        return sorted(rows, reverse=True)
+
+    def test_pages_merge_every_source_newest_first(self):
+        timeline = MemberTimeline(self.member.pk, 4)
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(len(SOURCES)):
+                page = timeline.page(cursor)
+            seen += [(entry['date'], entry['id'], entry['type']) for entry in page['results']]
+            cursor = page['next']
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.expected())
+
+    def test_api_is_staff_only_and_rejects_bad_cursors(self):
+        url = reverse('library:api-member-timeline', args=[self.member.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['date'] for entry in response.json()['results']],
+                         [str(date) for date, _, _ in self.expected()[:2]])
+        self.assertIsNotNone(response.json()['next'])
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 400)
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(5)
+        cls.books = list(Book.objects.order_by('pk'))
+        cls.members = list(Member.objects.order_by('pk'))
+        library = Library.objects.get()
+        # Members 0-2 borrow books 0 and 1 together; member 3 borrows books 2 and 3.
+        for member, books in [(0, [1]), (1, [0, 1]), (2, [0, 1]), (3, [2])]:
+            for book in books:
+                Borrow.objects.get_or_create(member=cls.members[member], book=cls.books[book], library=library,
+                                             borrow_date=datetime.date(2024, 1, 1),
+                                             defaults={'return_date': datetime.date(2024, 1, 15)})
+        Borrow.objects.create(member=cls.members[3], book=cls.books[3], library=library,
+                              borrow_date=datetime.date(2024, 2, 1), return_date=datetime.date(2024, 2, 15))
+
+    def test_co_borrowed_books_rank_first(self):
+        refresh_recommendations(full=True, k=2)
+        self.assertEqual(recommended_books(self.books[0].pk, limit=1), [self.books[1]])
+        self.assertEqual(recommended_books(self.books[2].pk, limit=1), [self.books[3]])
+        with self.assertNumQueries(2):
+            recommended_books(self.books[1].pk)
+
+    def test_similar_ratings_follow_members_who_rate_alike(self):
+        Review.objects.all().delete()
+        for member, ratings in [(0, [5, 5, 1]), (1, [4, 5, 1]), (2, [1, 2, 5])]:
+            for book, rating in zip(self.books, ratings):
+                Review.objects.create(book=book, reviewer=self.members[member], rating=rating, description="")
+        refresh_recommendations(full=True)
+        self.assertEqual(recommended_books(self.books[0].pk, 'similar_ratings'), [self.books[1]])
+
+    def test_member_recommendations_skip_borrowed_books(self):
+        refresh_recommendations(full=True)
+        self.assertEqual(recommended_for_member(self.members[4].pk), [])
+        books = recommended_for_member(self.members[0].pk)
+        self.assertNotIn(self.books[0], books)
+        self.assertNotIn(self.books[1], books)
+        self.assertEqual(books[0], self.books[2])
+
+    def test_incremental_refresh_only_recomputes_stale_rows(self):
+        refresh_recommendations(full=True)
+        Borrow.objects.create(member=self.members[4], book=self.books[0], library=Library.objects.get(),
+                              borrow_date=datetime.date(2024, 3, 1), return_date=datetime.date(2024, 3, 15))
+        self.assertEqual(set(BookRecommendations.objects.filter(stale=True).values_list('pk', flat=True)),
+                         {self.books[0].pk})
+        self.assertEqual(refresh_recommendations(), (1, 1))
+        self.assertFalse(BookRecommendations.objects.filter(stale=True).exists())
+        self.assertEqual(refresh_recommendations(), (0, 0))
+
+    def test_block_results_do_not_depend_on_block_size(self):
+        interactions = Interactions()
+        columns = np.arange(len(interactions.book_ids))
+        whole = item_neighbours(interactions.borrows, columns, k=3, block_size=100)
+        blocked = item_neighbours(interactions.borrows, columns, k=3, block_size=2)
+        np.testing.assert_array_equal(whole[0], blocked[0])
+        np.testing.assert_allclose(whole[1], blocked[1])
+
+
+def create_members(count):
+    return Member.objects.bulk_create([
+        Member(first_name=f"Member{i}", last_name="Reader", email=f"reader{i}@example.com", gender='Other',
+               birth_date=datetime.date(1990, 1, 1), age=30, role='Reader')
+        for i in range(count)
+    ])
+
+
+class CirculationAnalyticsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(3)
+
+    def test_report_groups_loans_by_month_genre_and_cohort(self):
+        Borrow.objects.filter(book__title="Book 0").update(returned=True)
+        report = circulation_report(BorrowColumns().load(), today=datetime.date(2024, 2, 1))
+        library_id = Library.objects.get().pk
+        self.assertEqual(report['loans_by_month_library'], [{'month': '2024-01', 'library_id': library_id,
+                                                             'loans': 3}])
+        self.assertEqual(report['loans_by_month_genre'], [{'month': '2024-01', 'genre': 'Fiction', 'loans': 3}])
+        self.assertEqual(report['loan_duration'], [{'library_id': library_id, 'loans': 3, 'average_days': 14.0}])
+        self.assertEqual(report['overdue_lateness'], [{'library_id': library_id, 'days_late': '15-30', 'loans': 2}])
+        self.assertEqual(report['age_cohorts'], [{'ages': '26-35', 'loans': 3, 'average_days': 14.0,
+                                                  'returned_share': 0.3333}])
+
+    def test_cache_appends_new_borrows_and_refreshes_returns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(len(BorrowColumns(directory).load()['id']), 3)
+            borrow = Borrow.objects.first()
+            borrow.returned = True
+            borrow.save()
+            Borrow.objects.create(member=Member.objects.first(), book=Book.objects.first(),
+                                  library=Library.objects.get(), borrow_date=datetime.date(2024, 3, 1),
+                                  return_date=datetime.date(2024, 3, 15))
+            # The change log, the changed borrow, the new ones and pruning the log.
+            with self.assertNumQueries(4):
+                columns = BorrowColumns(directory).load()
+            self.assertIsInstance(columns['id'], np.memmap)
+            self.assertEqual(len(columns['id']), 4)
+            self.assertEqual(int(columns['returned'].sum()), 1)
+            report = circulation_report(columns, since=datetime.date(2024, 2, 1))
+            self.assertEqual(report['loans'], 1)
+            with self.assertNumQueries(2):
+                self.assertEqual(BorrowColumns(directory).load()['id'].tolist(), columns['id'].tolist())
+            self.assertEqual(BorrowChange.objects.count(), 1)
+            del columns
+
+    def test_cache_follows_deleted_and_edited_borrows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(len(BorrowColumns(directory).load()['id']), 3)
+            self.assertTrue((Path(directory) / 'default' / 'meta.json').exists())
+            deleted, edited, _ = Borrow.objects.order_by('pk')
+            deleted.delete()
+            edited.borrow_date = datetime.date(2024, 5, 1)
+            edited.save()
+            columns = BorrowColumns(directory).load()
+            self.assertEqual(columns['id'].tolist(), list(Borrow.objects.order_by('pk').values_list('pk', flat=True)))
+            report = circulation_report(columns, since=datetime.date(2024, 2, 1))
+            self.assertEqual(report['loans'], 1)
+            self.assertEqual(int(columns['returned'].sum()), 0)
+            Borrow.objects.filter(pk=edited.pk).update(library=Library.objects.create(name="Branch", location="Town"))
+            log_borrow_changes([edited.pk])
+            with self.assertNumQueries(4):
+                columns = BorrowColumns(directory).load()
+            self.assertEqual(len(set(columns['library'].tolist())), 2)
+            # A borrow put back under its old id, as restoring from the archive does, is merged in order.
+            deleted.save(force_insert=True)
+            columns = BorrowColumns(directory).load()
+            self.assertEqual(columns['id'].tolist(), list(Borrow.objects.order_by('pk').values_list('pk', flat=True)))
+            self.assertEqual(len(columns['id']), 3)
+            del columns
+
+
+class DuplicateDetectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_catalogue(2)
+        cls.library = Library.objects.get()
+        cls.author = Author.objects.get(last_name="Last0")
+        cls.book = Book.objects.get(title="Book 0")
+        cls.member = Member.objects.get(email="member0@example.com")
+
+    def add_duplicates(self):
+        author = Author.objects.create(first_name="F.", last_name="Last0", birth_date=datetime.date(1970, 1, 1))
+        AuthorDetail.objects.create(author=author, biography="Other bio", gender='Other')
+        book = Book.objects.create(title="Book 0.", author=author, publishing_date=datetime.date(2000, 1, 1))
+        book.libraries.add(self.library, through_defaults={'copies': 2})
+        Review.objects.create(book=book, reviewer=self.member, rating=2, description="Meh")
+        for day in (1, 20):
+            Borrow.objects.create(member=self.member, book=book, library=self.library,
+                                  borrow_date=datetime.date(2024, 1, day), return_date=datetime.date(2024, 2, 1))
+        Event.objects.get(title="Event 1").books.add(book)
+        return author, book
+
+    def test_records_sharing_a_block_cluster_under_the_oldest(self):
+        self.assertEqual(normalize("  Brontë-Smith, J. "), 'bronte smith j')
+        people = [
+            Author(pk=1, first_name="John", last_name="Smith", birth_date=datetime.date(1950, 3, 1)),
+            Author(pk=2, first_name="J.", last_name="Smith", birth_date=datetime.date(1950, 3, 1)),
+            Author(pk=3, first_name="John", last_name="Smithe", birth_date=datetime.date(1950, 3, 1)),
+            Author(pk=4, first_name="Jane", last_name="Smith", birth_date=datetime.date(1950, 3, 1)),
+            Author(pk=5, first_name="John", last_name="Smith", birth_date=datetime.date(1980, 3, 1)),
+        ]
+        records = [(person.pk, normalize(person.first_name), normalize(person.last_name),
+                    person.birth_date.toordinal(), person.birth_date.year) for person in people]
+        self.assertEqual([(canonical, duplicate) for canonical, duplicate, _ in find_author_duplicates(records)],
+                         [(1, 2), (1, 3)])
+
+    def test_confirmed_duplicates_are_merged_into_the_kept_records(self):
+        author, book = self.add_duplicates()
+        self.assertEqual(LibraryStats.objects.get(library=self.library).books_held, 3)
+        self.assertEqual(author_records(Author.objects.filter(pk=author.pk))[0][1:3], ('f', 'last0'))
+        self.assertEqual(find_duplicates(), {'author': 1, 'book': 1})
+        self.assertEqual(set(DuplicateCandidate.objects.values_list('kind', 'canonical_id', 'duplicate_id')),
+                         {('author', self.author.pk, author.pk), ('book', self.book.pk, book.pk)})
+        self.assertEqual(merge_confirmed(), 0)
+        self.assertEqual(confirm_candidates(0.9), 2)
+        self.assertEqual(merge_confirmed(chunk_size=1), 2)
+
+        self.assertFalse(Author.all_objects.filter(pk=author.pk).exists())
+        self.assertFalse(Book.objects.filter(pk=book.pk).exists())
+        self.assertEqual(AuthorDetail.objects.get(author=self.author).biography, "Bio")
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.review_count, self.book.average_rating), (2, 3.0))
+        # The loan of 1 January was recorded under both books and is kept once.
+        self.assertEqual(sorted(self.book.borrows.values_list('borrow_date__day', flat=True)), [1, 20])
+        holding = Holding.objects.get(book=self.book)
+        self.assertEqual((holding.copies, holding.available), (3, 1))
+        self.assertEqual(LibraryStats.objects.get(library=self.library).books_held, 2)
+        self.assertEqual(set(self.book.events.values_list('title', flat=True)), {"Event 1"})
+        self.assertEqual(set(DuplicateCandidate.objects.values_list('status', flat=True)), {'merged'})
+
+    def test_books_of_one_title_are_merged_with_their_authors(self):
+        authors = [Author.objects.create(first_name=first_name, last_name="Smith", birth_date=datetime.date(1950, 3, 1))
+                   for first_name in ("John", "J.")]
+        books = [Book.objects.create(title="Emma", author=author, publishing_date=datetime.date(2000, 1, 1))
+                 for author in authors]
+        books[1].libraries.add(self.library)
+        Review.objects.create(book=books[1], reviewer=self.member, rating=5, description="Great")
+        find_duplicates(['author'])
+        confirm_candidates(0.8)
+        self.assertEqual(merge_confirmed(), 1)
+        self.assertEqual(list(Book.objects.filter(title="Emma").values_list('pk', 'author_id')),
+                         [(books[0].pk, authors[0].pk)])
+        books[0].refresh_from_db()
+        self.assertEqual((books[0].review_count, list(books[0].libraries.all())), (1, [self.library]))
+
+    def test_rejected_pairs_stay_rejected(self):
+        self.add_duplicates()
+        find_duplicates(['author'])
+        DuplicateCandidate.objects.update(status='rejected')
+        find_duplicates(['author'])
+        self.assertEqual(list(DuplicateCandidate.objects.values_list('status', flat=True)), ['rejected'])
+        self.assertEqual(confirm_candidates(0), 0)
+        self.assertEqual(Author.objects.count(), 3)
+
+
+class PostFeedTests(TestCase):
+    def setUp(self):
+        caching.get_cache().clear()
+        create_catalogue(3)
+        self.library = Library.objects.get()
+        self.feed_url = reverse('library:api-library-feed', args=[self.library.pk])
+        self.staff = User.objects.create_user('moderator', is_staff=True)
+
+    def approve(self, *titles):
+        url = reverse('library:api-library-moderation-approve', args=[self.library.pk])
+        ids = list(Post.objects.filter(title__in=titles).values_list('pk', flat=True))
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, {'posts': ids}, content_type='application/json')
+
+    def test_moderation_queue_approves_posts_in_batches(self):
+        url = reverse('library:api-library-moderation', args=[self.library.pk])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(self.approve("Post 0").status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual([post['title'] for post in self.client.get(url).json()['results']],
+                         ["Post 0", "Post 1", "Post 2"])
+        create_catalogue(1, offset=3)
+        other = Post.objects.get(title="Post 3")
+        self.assertEqual(self.approve("Post 0", "Post 2", other.title).json(), {'approved': 2})
+        self.assertEqual([post['title'] for post in self.client.get(url).json()['results']], ["Post 1"])
+        self.assertFalse(Post.objects.get(pk=other.pk).moderated)
+        response = self.client.post(reverse('library:api-library-moderation-approve', args=[self.library.pk]),
+                                    {'posts': 'all'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_feed_pages_are_cached_and_revalidated_with_validators(self):
+        self.client.force_login(self.staff)
+        self.approve("Post 0", "Post 1")
+        response = self.client.get(self.feed_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({post['title'] for post in response.json()['results']}, {"Post 0", "Post 1"})
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.feed_url).content, response.content)
+            self.assertEqual(self.client.get(self.feed_url, headers={'if-none-match': etag}).status_code, 304)
+            modified = self.client.get(self.feed_url, headers={'if-modified-since': last_modified})
+        self.assertEqual((modified.status_code, modified['ETag']), (304, etag))
+
+        # Editing a post still waiting for moderation leaves the feed alone.
+        pending = Post.objects.get(title="Post 2")
+        pending.body = "Edited"
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.save()
+        self.assertEqual(self.client.get(self.feed_url, headers={'if-none-match': etag}).status_code, 304)
+
+        published = Post.objects.get(title="Post 0")
+        published.moderated = False
+        with self.captureOnCommitCallbacks(execute=True):
+            published.save()
+        response = self.client.get(self.feed_url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([post['title'] for post in response.json()['results']], ["Post 1"])
+
+    def test_feed_of_unknown_library_is_not_found(self):
+        self.assertEqual(self.client.get(reverse('library:api-library-feed', args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(self.feed_url).json()['results'], [])
+        self.assertEqual(self.client.get(self.feed_url, {'cursor': 'garbage'}).status_code, 400)
+
+
+class AuditTrailTests(TestCase):
+    def setUp(self):
+        create_catalogue(2)
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def test_saves_and_deletes_record_field_diffs(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(title="Dune", publishing_date=datetime.date(1965, 8, 1))
+        book = Book.objects.get(pk=book.pk)
+        book.title = "Dune Messiah"
+        book.average_rating = 4.5
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+            book.save()
+        pk = book.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            book.delete()
+        entries = list(object_history(Book, pk).values_list('action', 'changes'))
+        self.assertEqual([action for action, _ in entries], ['delete', 'update', 'create'])
+        self.assertEqual(entries[1][1], {'title': ["Dune", "Dune Messiah"]})
+        self.assertEqual(entries[2][1]['publishing_date'], [None, '1965-08-01'])
+        self.assertNotIn('average_rating', entries[0][1])
+
+    def test_bulk_admin_actions_are_attributed_to_the_user(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('admin:library_borrow_changelist'), {
+                'action': 'mark_borrows_returned',
+                '_selected_action': list(Borrow.objects.values_list('pk', flat=True)),
+            })
+        self.assertEqual(list(user_history(self.user.pk).values_list('model', 'changes')),
+                         [('library.borrow', {'returned': [False, True]})] * 2)
+        response = self.client.get(reverse('library:api-audit'),
+                                   {'model': 'borrow', 'object': Borrow.objects.first().pk})
+        self.assertEqual([entry['user_id'] for entry in response.json()['results']], [self.user.pk])
+        self.assertEqual(self.client.get(reverse('library:api-audit'), {'model': 'post'}).status_code, 400)
+
+    def test_changes_rolled_back_are_not_logged(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Member.objects.filter(email="member0@example.com").get().delete()
+                transaction.set_rollback(True)
+        self.assertFalse(AuditEntry.objects.exists())
+
+
+class AuditWriterTests(TransactionTestCase):
+    def entries(self, count):
+        return [AuditEntry(model='library.book', object_id=pk, action='update', changed_at=timezone.now())
+                for pk in range(count)]
+
+    def test_entries_are_written_in_batches_and_flushed_on_stop(self):
+        writer = AuditWriter(batch_size=4, flush_interval=0.05)
+        writer.put(self.entries(10))
+        writer.flush()
+        self.assertEqual(AuditEntry.objects.count(), 10)
+        self.assertGreaterEqual(writer.stats['batches'], 3)
+        writer.put(self.entries(3))
+        writer.stop()
+        self.assertEqual(AuditEntry.objects.count(), 13)
+
+    def test_full_queue_pushes_back_on_producers(self):
+        writer = AuditWriter(queue_size=2, put_timeout=0.01)
+        with mock.patch.object(writer, 'start'):
+            writer.put(self.entries(5))
+        self.assertEqual((writer.queue.qsize(), writer.stats['written_inline']), (2, 3))
+        self.assertEqual(AuditEntry.objects.count(), 3)
+        writer.start()
+        writer.stop()
+        self.assertEqual(AuditEntry.objects.count(), 5)
+
+
+class SnapshotTests(TransactionTestCase):
+    def indexes(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' ORDER BY name")
+            return cursor.fetchall()
+
+    def test_snapshot_and_increments_restore_the_database(self):
+        create_catalogue(2)
+        indexes = self.indexes()
+        with tempfile.TemporaryDirectory() as directory:
+            full = snapshot(directory, pages=8)
+            self.assertTrue(full.path.name.endswith('.sqlite3.gz'))
+            create_catalogue(1, offset=2)
+            increment = export_increment(directory)
+            self.assertEqual(export_increment(directory, tables=['library_borrow']).rows, 0)
+            Review.objects.all().delete()
+            Member.objects.filter(email="member0@example.com").delete()
+            caching.get_object(Book, Book.objects.get(title="Book 2").pk)
+            with self.settings(LIBRARY_ANALYTICS={'CACHE_DIR': directory}):
+                BorrowColumns(directory).load()
+                result = restore_snapshot(full.path, [increment.path])
+            self.assertFalse((Path(directory) / 'default' / 'meta.json').exists())
+        self.assertEqual(result.violations, 0)
+        self.assertEqual((Member.objects.count(), Borrow.objects.count(), Review.objects.count()), (3, 3, 3))
+        self.assertEqual(self.indexes(), indexes)
+        # Rows of the increment reach the full-text index; the read-through cache starts empty.
+        self.assertEqual([book.title for book in search(Book, "book 2")], ["Book 2"])
+        self.assertEqual(caching.cache_stats(), {})
+
+    def test_increments_replace_rows_added_again_under_the_same_key(self):
+        create_catalogue(1)
+        book, library = Book.objects.get(), Library.objects.get()
+        with tempfile.TemporaryDirectory() as directory:
+            full = snapshot(directory)
+            book.libraries.remove(library)
+            book.libraries.add(library)
+            holding = Holding.objects.get()
+            increment = export_increment(directory)
+            result = restore_snapshot(full.path, [increment.path])
+            junk = Path(directory) / 'junk.sqlite3'
+            junk.write_bytes(b'not a database' * 100)
+            with self.assertRaises(SnapshotError):
+                restore_snapshot(junk)
+        self.assertEqual(result.violations, 0)
+        self.assertEqual(list(Holding.objects.values_list('pk', flat=True)), [holding.pk])
+
+    def test_commands_report_throughput(self):
+        create_catalogue(1)
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(SnapshotError):
+                export_increment(directory)
+            call_command('snapshot', directory=directory, no_compress=True, stdout=out)
+            path = next(Path(directory).glob('snapshot-*.sqlite3'))
+            call_command('restore', str(path), interactive=False, stdout=out)
+        self.assertEqual(out.getvalue().count('MB/s'), 2)
+        self.assertEqual(Book.objects.count(), 1)
+
+
+class EventRegistrationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.library = Library.objects.create(name="Library", location="Town")
+        cls.event = Event.objects.create(title="Talk", description="Talk", library=cls.library, capacity=2,
+                                         date=timezone.make_aware(datetime.datetime(2024, 1, 1)))
+        cls.members = [member.pk for member in create_members(5)]
+
+    def statuses(self):
+        return dict(self.event.participants.values_list('member_id', 'status'))
+
+    def test_register_admits_until_full_then_waitlists(self):
+        for member_id in self.members[:3]:
+            register(self.event.pk, member_id)
+        self.assertEqual(list(self.statuses().values()), ['admitted', 'admitted', 'waitlisted'])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.admitted_count, 2)
+        with self.assertRaises(AlreadyRegistered):
+            register(self.event.pk, self.members[0])
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.admitted_count, 2)
+
+    def test_batch_registration_and_cancellation_promote_in_order(self):
+        admitted, waitlisted = register_many(self.event.pk, self.members)
+        self.assertEqual((admitted, waitlisted), (self.members[:2], self.members[2:]))
+        self.assertEqual(register_many(self.event.pk, self.members[:1]), ([], []))
+        self.assertEqual(cancel(self.event.pk, self.members[:2]), (2, 2))
+        self.assertEqual(self.statuses(), {self.members[2]: 'admitted', self.members[3]: 'admitted',
+                                           self.members[4]: 'waitlisted'})
+        self.assertEqual(LibraryDailyStats.objects.get(library=self.library).event_registrations, 5)
+
+    def test_raising_capacity_promotes_waitlist_without_overwriting_count(self):
+        stale = Event.objects.get(pk=self.event.pk)
+        register_many(self.event.pk, self.members)
+        stale.capacity = 4
+        stale.save()
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.admitted_count, 4)
+        self.assertEqual(list(self.statuses().values()).count('waitlisted'), 1)
+
+
+class EventRegistrationConcurrencyTests(TransactionTestCase):
+    def test_concurrent_sign_ups_never_over_admit(self):
+        library = Library.objects.create(name="Library", location="Town")
+        event = Event.objects.create(title="Popular", description="Talk", library=library, capacity=40,
+                                     date=timezone.make_aware(datetime.datetime(2024, 1, 1)))
+        members = [member.pk for member in create_members(240)]
+        errors = []
+
+        def sign_up(member_ids):
+            try:
+                for member_id in member_ids:
+                    register(event.pk, member_id)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        sign_up(members[:40])
+        sequential = 40 / (time.perf_counter() - start)
+        cancel(event.pk, members[:40])
+
+        threads = [threading.Thread(target=sign_up, args=(members[40 + i::8],)) for i in range(8)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        concurrent = 200 / (time.perf_counter() - start)
+
+        self.assertEqual(errors, [])
+        event.refresh_from_db()
+        self.assertEqual(event.admitted_count, 40)
+        self.assertEqual(event.participants.filter(status='admitted').count(), 40)
+        self.assertEqual(event.participants.filter(status='waitlisted').count(), 160)
+        # Wall-clock figures depend on the machine, so they are reported rather than asserted.
+        logger.info("Sign-ups per second: %.0f sequential, %.0f with 8 threads", sequential, concurrent)
@@ -0,0 +1,91 @@
+import base64
+import binascii
+import heapq
+import json
+from dataclasses import dataclass
+
+from .models import Borrow, EventParticipant, Post, Review
+from .paginators import InvalidCursor, KeysetPaginator
+
+
+@dataclass(frozen=True)
+class TimelineSource:
+    """One per-member activity stream, read newest first on its (member, date) index."""
+
+    model: type
+    member_field: str
+    date_field: str
+    fields: tuple
+
+    def paginator(self, member_id, page_size, using='default'):
+        queryset = self.model._default_manager.using(using).filter(**{f'{self.member_field}_id': member_id}) \
+            .order_by(f'-{self.date_field}', '-pk')
+        return KeysetPaginator(queryset, page_size, values=('id', self.date_field) + self.fields)
+
+
+SOURCES = {
+    'borrow': TimelineSource(Borrow, 'member', 'borrow_date',
+                             ('book_id', 'book__title', 'library_id', 'return_date', 'returned')),
+    'review': TimelineSource(Review, 'reviewer', 'created_at', ('book_id', 'book__title', 'rating')),
+    'post': TimelineSource(Post, 'author', 'created_at', ('title', 'library_id')),
+    'event': TimelineSource(EventParticipant, 'member', 'registration_date',
+                            ('event_id', 'event__title', 'event__date', 'event__library_id')),
+}
+
+
+def encode_cursor(positions):
+    return base64.urlsafe_b64encode(json.dumps(positions, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as exc:
+        raise InvalidCursor("Invalid cursor.") from exc
+    if not isinstance(positions, dict) or not set(positions) <= set(SOURCES) \
+            or not all(isinstance(value, str) for value in positions.values()):
+        raise InvalidCursor("Invalid cursor.")
+    return positions
+
+
+class MemberTimeline:
+    """A member's borrows, reviews, posts and event registrations as one feed, newest first.
+
+    Each page reads at most ``page_size + 1`` rows from every source, resuming each one from its
+    own keyset position, and k-way merges them. The cursor carries the per-source positions.
+    """
+
+    def __init__(self, member_id, page_size=50, using='default'):
+        self.page_size = page_size
+        self.paginators = {name: source.paginator(member_id, page_size, using) for name, source in SOURCES.items()}
+
+    def _entries(self, name, rows):
+        date_field = SOURCES[name].date_field
+        for row in rows:
+            yield (row[date_field], row['id'], name), row
+
+    def _merge(self, pages, positions):
+        streams = [self._entries(name, page.object_list) for name, page in pages.items()]
+        merged = list(heapq.merge(*streams, key=lambda entry: entry[0], reverse=True))
+        consumed = merged[:self.page_size]
+        positions = dict(positions)
+        results = []
+        for (date, _, name), row in consumed:
+            date_field = SOURCES[name].date_field
+            positions[name] = self.paginators[name].encode_cursor(row)
+            results.append({'type': name, 'date': date,
+                            **{key: value for key, value in row.items() if key != date_field}})
+        has_next = len(merged) > self.page_size or any(page.has_next() for page in pages.values())
+        return {'results': results, 'next': encode_cursor(positions) if has_next and results else None}
+
+    def page(self, cursor=None):
+        positions = decode_cursor(cursor) if cursor else {}
+        pages = {name: paginator.page_from_cursor(positions.get(name))
+                 for name, paginator in self.paginators.items()}
+        return self._merge(pages, positions)
+
+    async def apage(self, cursor=None):
+        positions = decode_cursor(cursor) if cursor else {}
+        pages = {name: await paginator.apage_from_cursor(positions.get(name))
+                 for name, paginator in self.paginators.items()}
+        return self._merge(pages, positions)
@@ -0,0 +1,26 @@
+from django.urls import path
+
+from . import api, views
+
+app_name = 'library'
+
+urlpatterns = [
+    path('exports/<str:export>/', views.export_history, name='export-history'),
+    path('cache/stats/', views.cache_statistics, name='cache-stats'),
+    path('libraries/<int:pk>/dashboard/', views.library_statistics, name='library-dashboard'),
+    path('api/audit/', api.audit_log, name='api-audit'),
+    path('api/books/', api.book_list, name='api-books'),
+    path('api/sync/books/', api.book_list_sync, name='api-books-sync'),
+    path('api/books/availability/', api.book_availability, name='api-book-availability'),
+    path('api/books/<int:pk>/recommendations/', api.book_recommendations, name='api-book-recommendations'),
+    path('api/authors/<int:pk>/', api.author_detail, name='api-author'),
+    path('api/libraries/<int:pk>/events/', api.library_events, name='api-library-events'),
+    path('api/libraries/<int:pk>/feed/', api.library_feed, name='api-library-feed'),
+    path('api/libraries/<int:pk>/moderation/', api.library_moderation_queue, name='api-library-moderation'),
+    path('api/libraries/<int:pk>/moderation/approve/', api.approve_library_posts,
+         name='api-library-moderation-approve'),
+    path('api/members/<int:pk>/borrows/', api.member_borrows, name='api-member-borrows'),
+    path('api/members/<int:pk>/timeline/', api.member_timeline, name='api-member-timeline'),
+    path('api/members/<int:pk>/recommendations/', api.member_recommendations,
+         name='api-member-recommendations'),
+]
@@ -1,3 +1,46 @@
-from django.shortcuts import render
+import datetime
 
-# Create your views here.
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from .caching import cache_stats
+from .dashboard import library_dashboard
+from .exports import FORMATS, ExportError, export_lines
+from .models import Library
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(value) if value else None
+
+
+@staff_member_required
+@require_GET
+def export_history(request, export):
+    fmt = request.GET.get('format', 'csv')
+    try:
+        filters = {
+            'since': _parse_date(request.GET.get('since')),
+            'until': _parse_date(request.GET.get('until')),
+            'library': int(request.GET['library']) if request.GET.get('library') else None,
+        }
+        lines = export_lines(export, fmt, **filters)
+    except (ExportError, ValueError) as exc:
+        return HttpResponseBadRequest(str(exc))
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt][1])
+    response['Content-Disposition'] = f'attachment; filename="{export}.{fmt}"'
+    return response
+
+
+@staff_member_required
+@require_GET
+def cache_statistics(request):
+    return JsonResponse(cache_stats())
+
+
+@staff_member_required
+@require_GET
+def library_statistics(request, pk):
+    if not Library.objects.filter(pk=pk).exists():
+        raise Http404("No library matches the given query.")
+    return JsonResponse(library_dashboard(pk))